@@ -8,13 +8,22 @@ Claude APIの利用可能性をチェックするユーティリティ
 import os
 import sys
 import logging
+import functools
 import requests
 import json
+from requests.adapters import HTTPAdapter
 
+# モジュールレベルのセッション（keep-aliveで接続を再利用する）
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+
+@functools.lru_cache(maxsize=1)
 def check_claude_api():
     """
     Claude APIが利用可能かチェックする
-    
+
+    結果はプロセス内でキャッシュされ、複数回呼ばれても再プローブしない。
+
     Returns:
         tuple: (bool: 利用可能か, str: 状態メッセージ, dict: 追加情報)
     """
@@ -22,10 +31,30 @@ def check_claude_api():
     api_key = os.environ.get("ANTHROPIC_API_KEY")
     if not api_key:
         return False, "APIキーが設定されていません", {"tip": "環境変数 ANTHROPIC_API_KEY を設定してください"}
-    
+
     # モデル名の確認（デフォルト値があるので常に有効）
     model = os.environ.get("CLAUDE_MODEL", "claude-3-5-sonnet-20240620")
-    
+
+    # まず軽量なGETプローブでキーを検証する（課金される補完を発生させない）
+    try:
+        response = _session.get(
+            "https://api.anthropic.com/v1/models",
+            headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+            timeout=5
+        )
+        if response.status_code == 200:
+            return True, "Claude APIは正常に利用可能です", {"model": model}
+        if response.status_code in (401, 403):
+            try:
+                error_data = response.json()
+                error_message = error_data.get("error", {}).get("message", "不明なエラー")
+                return False, f"API接続エラー: {error_message}", {"status_code": response.status_code}
+            except json.JSONDecodeError:
+                return False, f"API接続エラー: HTTP {response.status_code}", {"status_code": response.status_code}
+        # それ以外（404など）はアカウント構成によるため、従来のPOSTプローブにフォールバック
+    except requests.exceptions.RequestException:
+        pass
+
     # APIへの接続テスト（軽量なリクエスト）
     try:
         headers = {
@@ -43,23 +72,31 @@ def check_claude_api():
             ]
         }
         
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages", 
+        response = _session.post(
+            "https://api.anthropic.com/v1/messages",
             headers=headers,
             json=data,
-            timeout=10
+            timeout=10,
+            stream=True
         )
-        
+
         # レスポンスの解析
-        if response.status_code == 200:
-            return True, "Claude APIは正常に利用可能です", {"model": model}
-        else:
-            try:
-                error_data = response.json()
-                error_message = error_data.get("error", {}).get("message", "不明なエラー")
-                return False, f"API接続エラー: {error_message}", {"status_code": response.status_code}
-            except json.JSONDecodeError:
-                return False, f"API接続エラー: HTTP {response.status_code}", {"response": response.text[:100]}
+        try:
+            if response.status_code == 200:
+                return True, "Claude APIは正常に利用可能です", {"model": model}
+            else:
+                # エラー本文は先頭1KBだけ読む（巨大な本文を全ダウンロードしない）
+                raw_bytes = response.raw.read(1024, decode_content=True)
+                try:
+                    error_data = json.loads(raw_bytes)
+                    error_message = error_data.get("error", {}).get("message", "不明なエラー")
+                    return False, f"API接続エラー: {error_message}", {"status_code": response.status_code}
+                except json.JSONDecodeError:
+                    tip = raw_bytes.decode('utf-8', errors='replace')[:100]
+                    return False, f"API接続エラー: HTTP {response.status_code}", {"response": tip}
+        finally:
+            # 接続をkeep-aliveプールに返却する
+            response.close()
     
     except requests.exceptions.RequestException as e:
         return False, f"API接続エラー: {str(e)}", {}
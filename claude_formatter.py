@@ -5,14 +5,123 @@
 Claude APIを使用してHTML変換後のMarkdownを整形するモジュール
 """
 
+import io
 import os
 import re
 import json
+import fnmatch
 import logging
+import hashlib
+import functools
 import requests
 import time
-from typing import Dict, Optional, List, Any
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, List, Any, Union
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# httpxが利用可能な場合はチャンクを並列送信する（オプション依存）
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# リトライ対象の一時的な通信エラー
+if HTTPX_AVAILABLE:
+    TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, httpx.TransportError)
+else:
+    TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+# orjsonが利用可能な場合は高速なJSONシリアライズを使用する（オプション依存）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class TokenBucket:
+    """time.monotonicベースの簡易トークンバケット型レートリミッタ"""
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """トークンを1つ消費し、必要な待機時間（秒）を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self) -> None:
+        """トークンが補充されるまでブロックする"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """トークンが補充されるまで非同期に待機する"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_pattern(pattern: str):
+    """fnmatchパターンを正規表現として一度だけコンパイルする"""
+    return re.compile(fnmatch.translate(pattern))
+
+
+def _json_dumps(data: Any) -> bytes:
+    """リクエストペイロードをJSONバイト列に変換する（orjsonがあれば使用）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+
+def _json_loads(content: Union[bytes, str]) -> Any:
+    """JSONレスポンスをパースする（orjsonがあれば使用）"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
+# 大見出し（# または ##）の判定用正規表現（モジュールレベルで一度だけコンパイル）
+_HEADER_RE = re.compile(r'^#{1,2}\s+')
+
+# リトライ対象のHTTPステータスコード（認証エラー等はリトライしない）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+# バックオフの上限（秒）
+BACKOFF_CAP = 60.0
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-Afterヘッダーを秒数に変換する（数値形式とHTTP日付形式に対応）"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(value)
+        return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
 
 # 環境変数からAPIキーを取得
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
@@ -24,16 +133,34 @@ class ClaudeFormatter:
     Claude APIを使用してMarkdownを整形するクラス
     """
     
-    def __init__(self, api_key: Optional[str] = None, model: str = CLAUDE_MODEL):
+    def __init__(self, api_key: Optional[str] = None, model: str = CLAUDE_MODEL, max_concurrency: int = 4,
+                 enable_cache: bool = True):
         """
         初期化
-        
+
         Args:
             api_key: Anthropic API Key（なければ環境変数から取得）
             model: 使用するClaudeモデル名
+            max_concurrency: 非同期処理時の最大同時リクエスト数
+            enable_cache: 整形結果のディスクキャッシュを有効にするか
         """
         self.api_key = api_key or ANTHROPIC_API_KEY
         self.model = model
+        self.max_concurrency = max_concurrency
+
+        # 整形結果のキャッシュ設定（同一コンテンツの再整形でAPI呼び出しを省略）
+        self.enable_cache = enable_cache
+        self.cache_dir = os.path.expanduser(os.path.join("~", ".cache", "claude_formatter"))
+
+        # クライアント側レートリミッタ（環境変数CLAUDE_RPMで毎分リクエスト数を調整）
+        rpm = float(os.environ.get("CLAUDE_RPM", "50"))
+        self.rate_limiter = TokenBucket(rate_per_sec=rpm / 60.0, capacity=max(1.0, rpm / 10.0))
+
+        # プロセス内メモ化（クローラー出力で繰り返される同一チャンクの重複送信を防ぐ）
+        self._memo: Dict[str, str] = {}
+
+        # 観測用の統計情報
+        self.stats = {"cache_hits": 0, "api_calls": 0}
         
         # APIキーがない場合はエラー
         if not self.api_key:
@@ -41,7 +168,22 @@ class ClaudeFormatter:
         
         # ロガーを設定
         self.logger = logging.getLogger("ClaudeFormatter")
-        
+
+        # セッションオブジェクトの作成（接続の再利用によるパフォーマンス向上）
+        # keep-aliveにより2回目以降のリクエストでTLSハンドシェイクを省略できる
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+
+        # httpxが利用可能ならHTTP/2クライアントを使用（1本の接続で並列リクエストを多重化）
+        self.client = None
+        if HTTPX_AVAILABLE:
+            limits = httpx.Limits(max_connections=4, max_keepalive_connections=4)
+            try:
+                self.client = httpx.Client(http2=True, limits=limits)
+            except ImportError:
+                # h2パッケージ未導入の場合はHTTP/1.1で動作
+                self.client = httpx.Client(limits=limits)
+
         # 整形用プロンプトテンプレート
         self.format_prompt = """
 あなたはMarkdown整形の専門家です。与えられたMarkdownファイルを分析し、より読みやすく、構造的に正しい形式に整形してください。
@@ -82,7 +224,70 @@ class ClaudeFormatter:
 {content}
 ---
 """
-    
+
+        # テンプレートを前後2パートに分割しておく（呼び出しごとのstr.replace走査を回避）
+        self._prompt_prefix, self._prompt_suffix = self.format_prompt.split("{content}")
+
+    def __del__(self):
+        """クリーンアップ処理"""
+        try:
+            if hasattr(self, 'session') and self.session:
+                self.session.close()
+            if hasattr(self, 'client') and self.client:
+                self.client.close()
+        except Exception:
+            pass
+
+    def _cache_path(self, markdown_content: str) -> str:
+        """コンテンツに対応するキャッシュファイルのパスを計算する"""
+        # モデルとプロンプトのバージョンもキーに含める（どちらかが変わればキャッシュミス）
+        key = hashlib.sha256(f"{self.model}|v1|{markdown_content}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _cache_get(self, markdown_content: str) -> Optional[str]:
+        """キャッシュされた整形結果を取得する（なければNone）"""
+        cache_path = self._cache_path(markdown_content)
+
+        # まずプロセス内メモを確認（同一実行内の重複チャンクはディスクも読まない）
+        memoized = self._memo.get(cache_path)
+        if memoized is not None:
+            self.stats["cache_hits"] += 1
+            return memoized
+
+        if not self.enable_cache:
+            return None
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                formatted_content = f.read()
+            self._memoize(cache_path, formatted_content)
+            self.stats["cache_hits"] += 1
+            return formatted_content
+        except OSError:
+            return None
+
+    def _cache_put(self, markdown_content: str, formatted_content: str) -> None:
+        """整形結果をキャッシュに保存する（アトミック書き込み）"""
+        cache_path = self._cache_path(markdown_content)
+        self._memoize(cache_path, formatted_content)
+
+        if not self.enable_cache:
+            return
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.tmp.{os.getpid()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(formatted_content)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self.logger.debug(f"キャッシュの書き込みに失敗しました: {e}")
+
+    def _memoize(self, key: str, formatted_content: str) -> None:
+        """プロセス内メモに登録する（上限を超えたら最も古いエントリを破棄）"""
+        if len(self._memo) >= 1024:
+            self._memo.pop(next(iter(self._memo)))
+        self._memo[key] = formatted_content
+
+
     def format_markdown(self, markdown_content: str, max_retries: int = 3, retry_delay: int = 2) -> str:
         """
         Claude APIを使用してMarkdownを整形する
@@ -97,24 +302,32 @@ class ClaudeFormatter:
         """
         if not markdown_content or not markdown_content.strip():
             return markdown_content
-        
+
+        # キャッシュに整形結果があればAPI呼び出しを省略
+        cached = self._cache_get(markdown_content)
+        if cached is not None:
+            self.logger.info("キャッシュされた整形結果を使用します")
+            return cached
+
         # コンテンツを長すぎる場合は分割して処理
         if len(markdown_content) > 100000:
             return self._process_large_content(markdown_content)
         
         # プロンプトを作成
-        prompt = self.format_prompt.replace("{content}", markdown_content)
+        prompt = f"{self._prompt_prefix}{markdown_content}{self._prompt_suffix}"
         
         # APIリクエストの準備
         headers = {
             "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
+            "content-type": "application/json",
+            "accept": "text/event-stream"
         }
-        
+
         data = {
             "model": self.model,
             "max_tokens": 100000,  # 十分な長さを確保
+            "stream": True,  # SSEストリーミングで逐次受信する
             "messages": [
                 {"role": "user", "content": prompt}
             ]
@@ -124,37 +337,93 @@ class ClaudeFormatter:
         for attempt in range(max_retries):
             try:
                 self.logger.info(f"Claude APIにリクエスト送信中 (試行 {attempt + 1}/{max_retries})...")
-                response = requests.post(CLAUDE_API_URL, headers=headers, json=data, timeout=60)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    formatted_content = result.get("content", [{}])[0].get("text", "")
+                self.rate_limiter.acquire()
+                self.stats["api_calls"] += 1
+                payload = _json_dumps(data)
+
+                if self.client is not None:
+                    # HTTP/2クライアント（httpx）でストリーミング受信
+                    with self.client.stream("POST", CLAUDE_API_URL, headers=headers,
+                                            content=payload, timeout=60) as response:
+                        status_code = response.status_code
+                        if status_code == 200 and 'text/event-stream' in response.headers.get('content-type', ''):
+                            formatted_content = self._read_stream(response)
+                        else:
+                            body = response.read()
+                            formatted_content = None
+                        retry_after_header = response.headers.get("Retry-After")
+                else:
+                    response = self.session.post(CLAUDE_API_URL, headers=headers, data=payload,
+                                                 timeout=60, stream=True)
+                    status_code = response.status_code
+                    if status_code == 200 and 'text/event-stream' in response.headers.get('Content-Type', ''):
+                        formatted_content = self._read_stream(response)
+                    else:
+                        body = response.content
+                        formatted_content = None
+                    retry_after_header = response.headers.get("Retry-After")
+
+                if status_code == 200:
+                    if formatted_content is None:
+                        # SSEでない場合は従来の一括パース
+                        result = _json_loads(body)
+                        formatted_content = result.get("content", [{}])[0].get("text", "")
                     self.logger.info("Markdownの整形に成功しました")
+                    self._cache_put(markdown_content, formatted_content)
                     return formatted_content
                 else:
-                    error_info = response.text
+                    error_info = body.decode('utf-8', errors='replace')
                     try:
-                        error_info = json.loads(error_info)
-                    except:
+                        error_info = _json_loads(body)
+                    except ValueError:
                         pass
-                    self.logger.error(f"APIエラー: {response.status_code}, {error_info}")
-                    
-                    # レート制限エラーの場合は長めに待機
-                    if response.status_code == 429:
-                        wait_time = retry_delay * 5
-                        self.logger.info(f"レート制限に達しました。{wait_time}秒後にリトライします...")
-                        time.sleep(wait_time)
-                    else:
-                        time.sleep(retry_delay)
-            
+                    self.logger.error(f"APIエラー: {status_code}, {error_info}")
+
+                    # 認証エラーなどリトライしても無意味なエラーは即座に中断
+                    if status_code not in RETRYABLE_STATUS_CODES:
+                        break
+
+                    # 指数バックオフ + ジッター（サーバーのRetry-Afterがあれば優先）
+                    wait_time = min(BACKOFF_CAP, retry_delay * (2 ** attempt)) + random.uniform(0, retry_delay)
+                    retry_after = _parse_retry_after(retry_after_header)
+                    if retry_after is not None:
+                        wait_time = max(wait_time, retry_after)
+                        self.logger.info(f"レート制限に達しました。{wait_time:.1f}秒後にリトライします...")
+                    time.sleep(wait_time)
+
+            except TRANSIENT_ERRORS as e:
+                self.logger.error(f"リクエスト実行エラー: {e}")
+                time.sleep(min(BACKOFF_CAP, retry_delay * (2 ** attempt)) + random.uniform(0, retry_delay))
             except Exception as e:
                 self.logger.error(f"リクエスト実行エラー: {e}")
-                time.sleep(retry_delay)
+                break
         
         # すべてのリトライが失敗した場合は元のコンテンツを返す
         self.logger.warning("Claude APIでの整形に失敗しました。元のコンテンツを返します。")
         return markdown_content
-    
+
+    def _read_stream(self, response) -> str:
+        """SSEレスポンスからテキストデルタを逐次読み取って結合する"""
+        try:
+            lines = response.iter_lines(decode_unicode=True)  # requests
+        except TypeError:
+            lines = response.iter_lines()  # httpx
+        buffer = io.StringIO()
+        for line in lines:
+            if not line or not line.startswith("data:"):
+                continue
+            try:
+                event = _json_loads(line[5:].strip())
+            except ValueError:
+                continue
+            event_type = event.get("type")
+            if event_type == "content_block_delta":
+                buffer.write(event.get("delta", {}).get("text", ""))
+            elif event_type == "message_stop":
+                break
+        return buffer.getvalue()
+
+
     def _process_large_content(self, markdown_content: str) -> str:
         """
         大きなコンテンツを分割して処理する
@@ -178,19 +447,109 @@ class ClaudeFormatter:
         
         self.logger.info(f"コンテンツを{len(chunks)}個のチャンクに分割しました")
         
-        # 各チャンクを処理
+        # httpxが利用可能な場合はチャンクを並列処理（逐次処理のN倍の待ち時間を回避）
+        if HTTPX_AVAILABLE and len(chunks) > 1:
+            try:
+                formatted_chunks = asyncio.run(self._aformat_chunks(chunks))
+                return "\n\n".join(formatted_chunks)
+            except Exception as e:
+                self.logger.warning(f"非同期処理に失敗したため逐次処理にフォールバックします: {e}")
+
+        # 各チャンクを処理（逐次フォールバック）
+        # レート制限はformat_markdown内のトークンバケットが適用する
         formatted_chunks = []
         for i, chunk in enumerate(chunks):
             self.logger.info(f"チャンク {i+1}/{len(chunks)} を処理中...")
             formatted_chunk = self.format_markdown(chunk)
             formatted_chunks.append(formatted_chunk)
-            
-            # APIレート制限を回避するために少し待機
-            if i < len(chunks) - 1:
-                time.sleep(2)
-        
+
         # 結合
         return "\n\n".join(formatted_chunks)
+
+    async def _aformat_chunks(self, chunks: List[str]) -> List[str]:
+        """すべてのチャンクをhttpx.AsyncClientで並列に整形する"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency
+        )
+        try:
+            # HTTP/2なら1本の接続で全チャンクを多重化できる
+            client_ctx = httpx.AsyncClient(http2=True, limits=limits)
+        except ImportError:
+            client_ctx = httpx.AsyncClient(limits=limits)
+        async with client_ctx as client:
+            tasks = [self._aformat_chunk(client, semaphore, chunk) for chunk in chunks]
+            return list(await asyncio.gather(*tasks))
+
+    async def _aformat_chunk(self, client, semaphore, chunk: str) -> str:
+        """単一チャンクを非同期で整形する（失敗時は元のチャンクを返す）"""
+        # キャッシュに整形結果があればAPI呼び出しを省略
+        cached = self._cache_get(chunk)
+        if cached is not None:
+            return cached
+
+        headers = {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+
+        data = {
+            "model": self.model,
+            "max_tokens": 100000,
+            "messages": [
+                {"role": "user", "content": f"{self._prompt_prefix}{chunk}{self._prompt_suffix}"}
+            ]
+        }
+
+        async with semaphore:
+            try:
+                await self.rate_limiter.acquire_async()
+                self.stats["api_calls"] += 1
+                response = await client.post(CLAUDE_API_URL, headers=headers, content=_json_dumps(data), timeout=60)
+                if response.status_code == 200:
+                    result = _json_loads(response.content)
+                    formatted_chunk = result.get("content", [{}])[0].get("text", "")
+                    self._cache_put(chunk, formatted_chunk)
+                    return formatted_chunk
+                self.logger.error(f"APIエラー: {response.status_code}")
+            except Exception as e:
+                self.logger.error(f"非同期リクエスト実行エラー: {e}")
+
+        # 失敗した場合は元のチャンクを返す
+        return chunk
+
+    async def format_markdown_async(self, markdown_content: str) -> str:
+        """
+        Claude APIを使用してMarkdownを非同期で整形する
+
+        Args:
+            markdown_content: 整形するMarkdownコンテンツ
+
+        Returns:
+            整形されたMarkdownコンテンツ
+        """
+        if not markdown_content or not markdown_content.strip():
+            return markdown_content
+
+        # httpxが利用できない場合は同期版をスレッドで実行
+        if not HTTPX_AVAILABLE:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, lambda: self.format_markdown(markdown_content))
+
+        # 同期パスと同じ分割ロジックを使用
+        if len(markdown_content) > 100000:
+            sections = self._split_by_headers(markdown_content)
+            if len(sections) <= 1 or max(len(s) for s in sections) > 90000:
+                chunks = self._split_by_size(markdown_content, chunk_size=90000)
+            else:
+                chunks = sections
+            formatted_chunks = await self._aformat_chunks(chunks)
+            return "\n\n".join(formatted_chunks)
+
+        formatted_chunks = await self._aformat_chunks([markdown_content])
+        return formatted_chunks[0]
     
     def _split_by_headers(self, markdown_content: str) -> List[str]:
         """
@@ -203,14 +562,14 @@ class ClaudeFormatter:
             分割されたセクションのリスト
         """
         # 大見出し（# または ##）でコンテンツを分割
-        header_pattern = r'^#{1,2}\s+'
         lines = markdown_content.split('\n')
-        
+
         sections = []
         current_section = []
-        
+
         for line in lines:
-            if re.match(header_pattern, line) and current_section:
+            # startswithで先にふるい落とし、正規表現の呼び出しを見出し候補行に限定する
+            if line.startswith('#') and current_section and _HEADER_RE.match(line):
                 # 新しいセクションが始まったら、現在のセクションを保存
                 sections.append('\n'.join(current_section))
                 current_section = [line]
@@ -236,28 +595,33 @@ class ClaudeFormatter:
         """
         if len(content) <= chunk_size:
             return [content]
-        
-        lines = content.split('\n')
+
+        # UTF-8バイト長基準で分割する。ASCII主体のMarkdown（典型例）では
+        # バイト位置と文字位置が一致するため、バイト列へのrfindで見つけた
+        # 改行位置をそのまま元の文字列のスライスに使える
+        data = content.encode('utf-8')
+        if len(data) == len(content):
+            source = data
+            newline = b'\n'
+        else:
+            # 非ASCIIを含む場合は文字単位で分割（従来挙動）
+            source = content
+            newline = '\n'
+
         chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for line in lines:
-            line_size = len(line) + 1  # +1 for newline
-            
-            if current_size + line_size > chunk_size and current_chunk:
-                # チャンクが最大サイズに達したら保存して新しいチャンクを開始
-                chunks.append('\n'.join(current_chunk))
-                current_chunk = [line]
-                current_size = line_size
-            else:
-                current_chunk.append(line)
-                current_size += line_size
-        
-        # 最後のチャンクを追加
-        if current_chunk:
-            chunks.append('\n'.join(current_chunk))
-        
+        start = 0
+        length = len(source)
+
+        while start < length:
+            end = min(start + chunk_size, length)
+            if end < length:
+                # チャンク境界直前の改行で区切る（行の途中で切らないため）
+                pos = source.rfind(newline, start, end)
+                if pos > start:
+                    end = pos + 1
+            chunks.append(content[start:end])
+            start = end
+
         return chunks
     
     def format_file(self, input_path: str, output_path: Optional[str] = None) -> str:
@@ -282,14 +646,14 @@ class ClaudeFormatter:
         # ファイル読み込み
         with open(input_path, 'r', encoding='utf-8') as f:
             content = f.read()
-        
-        # 整形処理
-        formatted_content = self.format_markdown(content)
-        
+
+        # 整形処理（変数を置き換えて入力文字列を早期に解放する）
+        content = self.format_markdown(content)
+
         # 結果を保存
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(formatted_content)
-        
+            f.write(content)
+
         return output_path
     
     def process_directory(self, input_dir: str, output_dir: Optional[str] = None, pattern: str = "*.md") -> Dict[str, str]:
@@ -304,38 +668,45 @@ class ClaudeFormatter:
         Returns:
             処理したファイルの辞書 {入力パス: 出力パス}
         """
-        import glob
-        
         # 出力ディレクトリの設定
         if output_dir is None:
             output_dir = input_dir
         else:
             os.makedirs(output_dir, exist_ok=True)
-        
-        # ファイル一覧を取得
-        file_paths = glob.glob(os.path.join(input_dir, pattern))
+
+        # パターンは一度だけコンパイルする（fnmatchの暗黙の再コンパイルを回避）
+        pattern_re = _compile_pattern(pattern)
+
+        def iter_files():
+            # os.scandirで遅延列挙する（globのようにリスト化とstatを待たない）
+            with os.scandir(input_dir) as it:
+                for entry in it:
+                    if entry.is_file() and pattern_re.match(entry.name):
+                        yield entry.path
+
         processed_files = {}
-        
-        self.logger.info(f"{len(file_paths)}個のファイルが見つかりました")
-        
-        # 各ファイルを処理
-        for input_path in file_paths:
-            try:
-                file_name = os.path.basename(input_path)
-                output_path = os.path.join(output_dir, file_name)
-                
-                self.logger.info(f"ファイルを処理中: {file_name}")
-                self.format_file(input_path, output_path)
-                
-                processed_files[input_path] = output_path
-                self.logger.info(f"ファイルの処理が完了しました: {file_name}")
-                
-                # APIレート制限を回避するために少し待機
-                time.sleep(2)
-            
-            except Exception as e:
-                self.logger.error(f"ファイル処理エラー {input_path}: {e}")
-        
+
+        def process_one(input_path: str) -> str:
+            file_name = os.path.basename(input_path)
+            output_path = os.path.join(output_dir, file_name)
+            self.logger.info(f"ファイルを処理中: {file_name}")
+            self.format_file(input_path, output_path)
+            return output_path
+
+        # 各ファイルは独立したAPI呼び出しなのでスレッドプールで並列処理する
+        # （レート制限はformat_markdown側の429リトライで吸収される）
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            # 列挙しながら順次サブミットする（列挙完了を待たずに処理を開始できる）
+            futures = {executor.submit(process_one, p): p for p in iter_files()}
+            self.logger.info(f"{len(futures)}個のファイルが見つかりました")
+            for future in as_completed(futures):
+                input_path = futures[future]
+                try:
+                    processed_files[input_path] = future.result()
+                    self.logger.info(f"ファイルの処理が完了しました: {os.path.basename(input_path)}")
+                except Exception as e:
+                    self.logger.error(f"ファイル処理エラー {input_path}: {e}")
+
         return processed_files
 
 def setup_logging():
@@ -1,819 +1,1302 @@
-"""
-Webクローラーの拡張コンポーネント
-- 非同期クロールエンジン
-- 並列処理のサポート
-- PDF生成機能の改善
-- Discord通知機能
-- ビジュアルクローリング機能
-"""
-
-import os
-import time
-import json
-import logging
-import asyncio
-import pdfkit
-import markdown
-from typing import Dict, List, Optional, Set, Tuple, Any, Union, Callable
-from datetime import datetime
-from urllib.parse import urlparse
-from discord_webhook import DiscordWebhook, DiscordEmbed
-import threading
-from concurrent.futures import ThreadPoolExecutor
-
-# ビジュアルクローリング機能をインポート
-try:
-    from visual_crawler import crawl_url_visual
-    VISUAL_CRAWLING_AVAILABLE = True
-except ImportError:
-    VISUAL_CRAWLING_AVAILABLE = False
-    logging.warning("ビジュアルクローリング機能が利用できません。依存ライブラリがインストールされていない可能性があります。")
-
-
-class PdfConverter:
-    """MarkdownファイルをPDF形式に変換するコンポーネント（改善版）"""
-    
-    def __init__(self, output_dir: str = "output", css_path: Optional[str] = None):
-        self.output_dir = output_dir
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # カスタムCSSのパス（指定がなければデフォルト使用）
-        self.css_path = css_path
-        
-        # デフォルトのCSSスタイル
-        self.default_css = """
-        body { 
-            font-family: 'Helvetica', 'Arial', sans-serif; 
-            line-height: 1.6; 
-            max-width: 1000px; 
-            margin: 0 auto; 
-            padding: 20px; 
-        }
-        h1, h2, h3, h4, h5, h6 { margin-top: 1.5em; color: #333; }
-        h1 { border-bottom: 2px solid #eee; padding-bottom: 10px; }
-        h2 { border-bottom: 1px solid #eee; padding-bottom: 5px; }
-        code { background-color: #f8f8f8; padding: 2px 4px; border-radius: 3px; }
-        pre { background-color: #f8f8f8; padding: 10px; border-radius: 5px; overflow-x: auto; }
-        blockquote { border-left: 5px solid #ccc; padding-left: 15px; color: #555; }
-        a { color: #0366d6; text-decoration: none; }
-        a:hover { text-decoration: underline; }
-        table { border-collapse: collapse; width: 100%; margin: 20px 0; }
-        table, th, td { border: 1px solid #ddd; }
-        th, td { padding: 10px; text-align: left; }
-        th { background-color: #f2f2f2; }
-        img { max-width: 100%; height: auto; }
-        """
-    
-    def convert(self, markdown_path: str, title: Optional[str] = None) -> str:
-        """MarkdownファイルをPDFに変換する（改善版）"""
-        # 入力ファイル名からPDFファイル名を生成
-        pdf_filename = os.path.basename(markdown_path).replace('.md', '.pdf')
-        pdf_path = os.path.join(self.output_dir, pdf_filename)
-        
-        try:
-            # Markdownを読み込む
-            with open(markdown_path, 'r', encoding='utf-8') as md_file:
-                md_content = md_file.read()
-            
-            # MarkdownをHTML形式に変換（拡張機能を有効化）
-            html_content = markdown.markdown(
-                md_content, 
-                extensions=[
-                    'markdown.extensions.tables', 
-                    'markdown.extensions.fenced_code',
-                    'markdown.extensions.toc',
-                    'markdown.extensions.footnotes'
-                ]
-            )
-            
-            # HTMLにスタイルとメタデータを追加
-            html_path = os.path.join(self.output_dir, "temp.html")
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(f"""<!DOCTYPE html>
-                <html>
-                <head>
-                    <meta charset="utf-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>{title or 'Crawled Content'}</title>
-                    <style>
-                    {self.default_css}
-                    </style>
-                </head>
-                <body>
-                    {html_content}
-                </body>
-                </html>""")
-            
-            # カスタムCSSがあれば使用
-            options = {
-                'page-size': 'A4',
-                'margin-top': '20mm',
-                'margin-right': '20mm',
-                'margin-bottom': '20mm',
-                'margin-left': '20mm',
-                'encoding': 'UTF-8',
-                'no-outline': None,
-                'enable-local-file-access': True
-            }
-            
-            if self.css_path and os.path.exists(self.css_path):
-                options['user-style-sheet'] = self.css_path
-                
-            # タイトルがあれば設定
-            if title:
-                options['title'] = title
-            
-            # Google Colab用の設定（パスを指定）
-            try:
-                config = pdfkit.configuration(wkhtmltopdf='/usr/bin/wkhtmltopdf')
-                
-                # wkhtmltopdfを使用してPDFに変換
-                pdfkit.from_file(html_path, pdf_path, options=options, configuration=config)
-            except Exception as e:
-                logging.warning(f"特定のwkhtmltopdfパスでの変換に失敗しました: {e}")
-                # パスを指定せずに再試行
-                pdfkit.from_file(html_path, pdf_path, options=options)
-                
-            # 一時ファイルを削除
-            if os.path.exists(html_path):
-                os.remove(html_path)
-                
-            return pdf_path
-            
-        except Exception as e:
-            logging.error(f"PDF変換エラー: {e}")
-            return None
-
-
-class DiscordNotifier:
-    """Discordに通知を送信するコンポーネント（改善版）"""
-    
-    def __init__(self, webhook_url: str):
-        self.webhook_url = webhook_url
-        
-    def notify(self, 
-               message: str, 
-               title: Optional[str] = None,
-               color: int = 0x3498db,  # デフォルト：青色
-               markdown_path: Optional[str] = None, 
-               pdf_path: Optional[str] = None,
-               diff_path: Optional[str] = None) -> bool:
-        """Discord通知を送信する（改善版：Embedsサポート）"""
-        try:
-            # Webhookインスタンスを作成
-            webhook = DiscordWebhook(url=self.webhook_url)
-            
-            # 埋め込みメッセージを作成
-            embed = DiscordEmbed(
-                title=title or "クロール結果通知",
-                description=message,
-                color=color
-            )
-            
-            # タイムスタンプを追加
-            embed.set_timestamp()
-            
-            # フッターを追加
-            embed.set_footer(text="Webサイトクローラー")
-            
-            # 埋め込みメッセージをWebhookに追加
-            webhook.add_embed(embed)
-            
-            # ファイルリストを作成
-            file_paths = []
-            if markdown_path and os.path.exists(markdown_path):
-                file_paths.append((markdown_path, os.path.basename(markdown_path)))
-            
-            if pdf_path and os.path.exists(pdf_path):
-                file_paths.append((pdf_path, os.path.basename(pdf_path)))
-                
-            if diff_path and os.path.exists(diff_path):
-                file_paths.append((diff_path, os.path.basename(diff_path)))
-            
-            # ファイルを分割して送信（Discordの添付ファイル制限に対応）
-            if file_paths:
-                # 最大8MBの制限があるため、ファイルを小分けにして送信
-                remaining_files = file_paths.copy()
-                current_batch = []
-                current_size = 0
-                max_size = 8 * 1024 * 1024  # 8MB in bytes
-                
-                while remaining_files:
-                    file_path, file_name = remaining_files[0]
-                    file_size = os.path.getsize(file_path)
-                    
-                    # 単一ファイルが8MBを超える場合はスキップ
-                    if file_size > max_size:
-                        logging.warning(f"ファイルサイズが大きすぎるためスキップ: {file_name}")
-                        remaining_files.pop(0)
-                        continue
-                    
-                    # このバッチに追加できるか確認
-                    if current_size + file_size <= max_size:
-                        current_batch.append((file_path, file_name))
-                        current_size += file_size
-                        remaining_files.pop(0)
-                    else:
-                        # このバッチを送信して新しいバッチを開始
-                        if current_batch:
-                            self._send_webhook_with_files(webhook, current_batch)
-                            # 次のバッチのために新しいWebhookを作成
-                            webhook = DiscordWebhook(url=self.webhook_url)
-                            current_batch = []
-                            current_size = 0
-                
-                # 最後のバッチを送信
-                if current_batch:
-                    self._send_webhook_with_files(webhook, current_batch)
-                    
-                return True
-            
-            else:
-                # ファイルなしで通知を送信
-                response = webhook.execute()
-                
-                # レスポンスコードをチェック
-                if response and 200 <= response.status_code < 300:
-                    logging.info("Discord通知を送信しました")
-                    return True
-                else:
-                    status_code = response.status_code if response else 'No response'
-                    logging.error(f"Discord通知の送信に失敗: {status_code}")
-                    return False
-                
-        except Exception as e:
-            logging.error(f"Discord通知エラー: {e}")
-            return False
-    
-    def _send_webhook_with_files(self, webhook, file_batch):
-        """ファイルバッチをDiscordに送信する"""
-        for file_path, file_name in file_batch:
-            with open(file_path, 'rb') as f:
-                webhook.add_file(file=f.read(), filename=file_name)
-        
-        response = webhook.execute()
-        if not response or not (200 <= response.status_code < 300):
-            status_code = response.status_code if response else 'No response'
-            logging.error(f"ファイル付きDiscord通知の送信に失敗: {status_code}")
-
-
-class AsyncCrawler:
-    """並列処理を活用した非同期クローラーエンジン"""
-    
-    def __init__(self, config, components):
-        """
-        非同期クローラーの初期化
-
-        Args:
-            config: クローラー設定
-            components: 必要なコンポーネント（url_filter, fetcher, parser, markdown_converter, cache, repository）
-        """
-        self.config = config
-        self.url_filter = components['url_filter']
-        self.fetcher = components['fetcher']
-        self.parser = components['parser']
-        self.markdown_converter = components['markdown_converter']
-        self.cache = components.get('cache')
-        self.repository = components['repository']
-
-        # ビジュアルクローリングモードの設定
-        self.visual_mode = getattr(config, 'visual_mode', False)
-        self.visual_config = getattr(config, 'visual_config', {})
-
-        # クロール状態の追跡
-        self.visited_urls = set()
-        self.queued_urls = set([config.base_url])
-        self.queue = asyncio.Queue()
-        self.queue.put_nowait(config.base_url)
-
-        # 差分情報の追跡
-        self.new_pages = []
-        self.updated_pages = []
-        self.deleted_pages = []
-        self.page_diffs = {}
-
-        # 統計データ
-        self.stats = {
-            'start_time': time.time(),
-            'end_time': None,
-            'processed_urls': 0,
-            'successful_fetches': 0,
-            'failed_fetches': 0,
-            'skipped_urls': 0,
-            'visual_mode': self.visual_mode
-        }
-
-        # 並列処理の制御
-        self.max_workers = config.max_workers
-        self.semaphore = asyncio.Semaphore(self.max_workers)
-
-        # 状態制御
-        self.is_running = False
-        self.stop_event = asyncio.Event()
-    
-    async def crawl(self) -> Tuple[Dict, Dict]:
-        """Webサイトを非同期でクロールする"""
-        self.is_running = True
-        workers = []
-        
-        # 進捗ロギング用タスク
-        progress_task = asyncio.create_task(self._log_progress())
-        
-        try:
-            # ワーカータスクを作成
-            for _ in range(self.max_workers):
-                worker = asyncio.create_task(self._worker())
-                workers.append(worker)
-            
-            # すべてのワーカーが完了するまで待機
-            await asyncio.gather(*workers)
-            
-        except asyncio.CancelledError:
-            logging.info("クロールがキャンセルされました")
-            # すべてのワーカーをキャンセル
-            for worker in workers:
-                worker.cancel()
-        finally:
-            # 進捗ロギング用タスクをキャンセル
-            progress_task.cancel()
-            self.is_running = False
-            
-            # 削除されたページを特定（差分検知が有効な場合）
-            if self.cache and self.config.diff_detection:
-                cached_urls = self.cache.get_all_urls()
-                current_urls = set(self.repository.get_all().keys())
-                self.deleted_pages = list(cached_urls - current_urls)
-                
-                # 削除されたページをキャッシュから削除
-                if self.deleted_pages:
-                    self.cache.delete_urls(self.deleted_pages)
-                
-                # 統計情報を記録
-                self.stats['end_time'] = time.time()
-                duration_seconds = int(self.stats['end_time'] - self.stats['start_time'])
-                
-                # クロール履歴を保存
-                self.cache.save_crawl_history(
-                    page_count=self.repository.count(),
-                    new_count=len(self.new_pages),
-                    updated_count=len(self.updated_pages),
-                    deleted_count=len(self.deleted_pages),
-                    duration_seconds=duration_seconds
-                )
-            else:
-                self.stats['end_time'] = time.time()
-            
-            # 差分情報を作成
-            diff_data = {
-                'total': self.repository.count(),
-                'new_pages': self.new_pages,
-                'updated_pages': self.updated_pages,
-                'deleted_pages': self.deleted_pages,
-                'diffs': self.page_diffs,
-                'has_changes': bool(self.new_pages or self.updated_pages or self.deleted_pages),
-                'duration_seconds': int(self.stats['end_time'] - self.stats['start_time'])
-            }
-            
-            # リポジトリを確定
-            self.repository.finalize()
-            
-            logging.info(f"クロールが完了しました。訪問したURL数: {len(self.visited_urls)}、保存したページ数: {self.repository.count()}。")
-            logging.info(f"変更点: 新規: {len(self.new_pages)}、更新: {len(self.updated_pages)}、削除: {len(self.deleted_pages)}。")
-            
-            return self.repository, diff_data
-    
-    async def _worker(self):
-        """非同期ワーカープロセス"""
-        while not self.stop_event.is_set():
-            try:
-                # キューが空の場合はクロール完了
-                if self.queue.empty() and all(u in self.visited_urls for u in self.queued_urls):
-                    break
-                
-                # タイムアウト付きでURLを取得（キューが空の場合に永遠に待機しないため）
-                try:
-                    url = await asyncio.wait_for(self.queue.get(), timeout=1.0)
-                except asyncio.TimeoutError:
-                    continue
-                
-                # 既に訪問済みのURLならスキップ
-                if url in self.visited_urls:
-                    self.queue.task_done()
-                    continue
-                
-                # セマフォーを使用して同時実行数を制限
-                async with self.semaphore:
-                    await self._process_url(url)
-                
-                # タスク完了通知
-                self.queue.task_done()
-                
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logging.error(f"ワーカープロセスでエラー発生: {e}")
-    
-    async def _process_url(self, url):
-        """URLを処理する"""
-        try:
-            # 訪問済みとしてマーク
-            self.visited_urls.add(url)
-            self.stats['processed_urls'] += 1
-
-            # ビジュアルモードが有効かつライブラリが利用可能な場合
-            if self.visual_mode and VISUAL_CRAWLING_AVAILABLE:
-                # スレッドプールでビジュアルクローリングを実行
-                with ThreadPoolExecutor(max_workers=1) as executor:
-                    future = executor.submit(crawl_url_visual, url, self.visual_config)
-                    page_data = await asyncio.get_event_loop().run_in_executor(
-                        None, lambda: future.result()
-                    )
-
-                if "error" in page_data:
-                    logging.error(f"ビジュアルクローリングエラー {url}: {page_data['error']}")
-                    self.stats['failed_fetches'] += 1
-                    self.repository.add({'url': url, 'title': 'Error', 'html_content': ''}, status='error')
-                    return
-
-                # リンクはビジュアルモードでは抽出されないため空のリストを使用
-                links = []
-
-                logging.info(f"ビジュアルモードでページをクロール: {url}")
-
-            else:
-                # 通常のクローリングプロセス
-                # キャッシュからページ情報を取得
-                cached_page = None
-                if self.cache and self.config.diff_detection:
-                    cached_page = self.cache.get_page(url)
-
-                # ページのHTMLを取得（条件付きリクエスト）
-                etag = cached_page.get('etag') if cached_page else None
-                last_modified = cached_page.get('last_modified') if cached_page else None
-
-                html, headers_info = await self.fetcher.fetch_async(url, etag, last_modified)
-
-                # 304 Not Modified の場合、キャッシュから前回のコンテンツを使用
-                if headers_info.get('status_code') == 304 and cached_page:
-                    logging.info(f"キャッシュされたコンテンツを使用: {url}")
-                    page_data = {
-                        'url': url,
-                        'title': cached_page['title'],
-                        'html_content': '', # HTMLは保存不要
-                        'markdown_content': cached_page['markdown_content'],
-                        'etag': cached_page['etag'],
-                        'last_modified': cached_page['last_modified'],
-                        'meta_description': cached_page.get('meta_description', '')
-                    }
-                    self.repository.add(page_data)
-                    return
-
-                # HTMLが取得できなかった場合はスキップ
-                if html is None:
-                    self.stats['skipped_urls'] += 1
-                    self.repository.add({'url': url, 'title': 'Error', 'html_content': ''}, status='skipped')
-                    return
-
-                self.stats['successful_fetches'] += 1
-
-                # HTMLを解析してコンテンツとリンクを抽出
-                page_data, links = self.parser.parse(html, url)
-
-                # コンテンツがない場合はスキップ
-                if not page_data.get('html_content'):
-                    self.stats['skipped_urls'] += 1
-                    return
-
-                # ヘッダー情報を追加
-                page_data['etag'] = headers_info.get('etag')
-                page_data['last_modified'] = headers_info.get('last_modified')
-
-                # HTMLをMarkdownに変換
-                page_data = self.markdown_converter.convert(page_data)
-
-            # 差分検知（有効な場合）- ビジュアルモードでも共通
-            if self.cache and self.config.diff_detection:
-                markdown_content = page_data.get('markdown_content', '')
-
-                # キャッシュに追加または更新
-                is_update = self.cache.add_or_update_page(page_data)
-
-                if is_update:
-                    # コンテンツが変更されている場合のみ更新ページとしてマーク
-                    if self.cache.is_content_changed(url, markdown_content):
-                        self.updated_pages.append(url)
-                        self.page_diffs[url] = self.cache.get_diff(url, markdown_content)
-                else:
-                    # 新規ページ
-                    self.new_pages.append(url)
-
-            # コンテンツを保存
-            self.repository.add(page_data)
-
-            # 新しいリンクをキューに追加（ビジュアルモードでは空のリストになる可能性がある）
-            await self._add_new_links_to_queue(links)
-
-        except Exception as e:
-            logging.error(f"URL処理エラー {url}: {e}")
-            self.stats['failed_fetches'] += 1
-            self.repository.add({'url': url, 'title': 'Error', 'html_content': ''}, status='error')
-    
-    async def _add_new_links_to_queue(self, links):
-        """新しいリンクをキューに追加する"""
-        for link in links:
-            # 訪問済みかキューに入っている場合はスキップ
-            if link in self.visited_urls or link in self.queued_urls:
-                continue
-                
-            # 最大ページ数に達していたらスキップ
-            if len(self.visited_urls) + len(self.queued_urls) >= self.config.max_pages:
-                break
-                
-            # キューに追加
-            self.queued_urls.add(link)
-            await self.queue.put(link)
-    
-    async def _log_progress(self):
-        """現在の進捗を定期的にログに記録する"""
-        try:
-            while self.is_running:
-                queue_size = self.queue.qsize()
-                visited = len(self.visited_urls)
-                total = visited + queue_size
-                
-                if total > 0:
-                    progress = (visited / (visited + queue_size)) * 100
-                    elapsed = time.time() - self.stats['start_time']
-                    pages_per_second = visited / elapsed if elapsed > 0 else 0
-                    
-                    logging.info(f"進捗: {visited}/{total} ({progress:.1f}%) 完了 - 処理速度: {pages_per_second:.2f} ページ/秒")
-                
-                await asyncio.sleep(10)  # 10秒ごとに進捗を更新
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logging.error(f"進捗ロギングエラー: {e}")
-    
-    def stop(self):
-        """クロールを停止する"""
-        if self.is_running:
-            self.stop_event.set()
-            logging.info("クロールを停止中...")
-
-
-def generate_sitemap(repository, output_dir, domain, url_blacklist=None):
-    """サイトマップXMLを生成する"""
-    from xml.dom import minidom
-    import xml.etree.ElementTree as ET
-    
-    # XMLのルート要素とネームスペースを作成
-    root = ET.Element("urlset")
-    root.set("xmlns", "http://www.sitemaps.org/schemas/sitemap/0.9")
-    
-    # 現在の日付
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # コンテンツを取得
-    contents = repository.get_all()
-    
-    # 除外URLパターン（指定がなければ空のセット）
-    url_blacklist = url_blacklist or set()
-    
-    # URLを追加
-    for url, page_data in contents.items():
-        # 除外URLパターンに一致するURLはスキップ
-        skip = False
-        for pattern in url_blacklist:
-            if pattern in url:
-                skip = True
-                break
-                
-        if skip:
-            continue
-            
-        url_element = ET.SubElement(root, "url")
-        loc = ET.SubElement(url_element, "loc")
-        loc.text = url
-        
-        lastmod = ET.SubElement(url_element, "lastmod")
-        lastmod.text = today
-        
-        # 更新頻度の推測（パスの深さによって変更）
-        path_depth = url.count('/') - 2  # http://domain.com/ の基本的な部分を除く
-        
-        changefreq = ET.SubElement(url_element, "changefreq")
-        if path_depth <= 1:  # トップレベルページ
-            changefreq.text = "daily"
-        elif path_depth == 2:  # セカンドレベルページ
-            changefreq.text = "weekly"
-        else:  # 深いレベルのページ
-            changefreq.text = "monthly"
-        
-        # 優先度の設定（パスの深さに応じて下げる）
-        priority = ET.SubElement(url_element, "priority")
-        if path_depth == 0:  # ホームページ
-            priority.text = "1.0"
-        else:
-            priority_value = max(0.1, 1.0 - (path_depth * 0.2))
-            priority.text = f"{priority_value:.1f}"
-    
-    # XMLをきれいにフォーマット
-    xmlstr = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
-    
-    # ファイルに保存
-    sitemap_path = os.path.join(output_dir, f"sitemap-{domain}.xml")
-    with open(sitemap_path, 'w', encoding='utf-8') as f:
-        f.write(xmlstr)
-        
-    return sitemap_path
-
-
-def run_colab_crawler(config):
-    """Google Colab向けの改善されたクローラー実行関数"""
-    from crawler_components import (
-        UrlFilter, Fetcher, Parser, MarkdownConverter,
-        ContentRepository, CrawlCache, FileExporter
-    )
-
-    # ビジュアルモードの確認
-    visual_mode = getattr(config, 'visual_mode', False)
-    if visual_mode:
-        if not VISUAL_CRAWLING_AVAILABLE:
-            logging.warning("ビジュアルクローリングモードが指定されましたが、必要な依存関係が不足しています。標準モードにフォールバックします。")
-            config.visual_mode = False
-        else:
-            logging.info("ビジュアルクローリングモードが有効です。")
-
-    # ロガーの設定
-    log_file = os.path.join(config.output_dir, "crawler.log")
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(log_file)
-        ]
-    )
-
-    try:
-        # 出力ディレクトリを作成
-        os.makedirs(config.output_dir, exist_ok=True)
-
-        # ドメイン名を取得
-        domain = urlparse(config.base_url).netloc
-
-        # 各コンポーネントの初期化
-        url_filter = UrlFilter(config)
-        fetcher = Fetcher(config)
-        parser = Parser(url_filter)
-        markdown_converter = MarkdownConverter()
-        repository = ContentRepository()
-
-        # 差分検知が有効な場合はキャッシュを初期化
-        cache = CrawlCache(domain, config.cache_dir) if config.diff_detection else None
-
-        # 非同期クローラーを初期化
-        components = {
-            'url_filter': url_filter,
-            'fetcher': fetcher,
-            'parser': parser,
-            'markdown_converter': markdown_converter,
-            'repository': repository,
-            'cache': cache
-        }
-
-        crawler = AsyncCrawler(config, components)
-        
-        # クローラーを実行（非同期実行をイベントループで処理）
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            repository, diff_data = loop.run_until_complete(crawler.crawl())
-        finally:
-            loop.close()
-        
-        # 結果がない場合はエラー
-        if repository.count() == 0:
-            logging.error("No content was crawled.")
-            if config.discord_webhook:
-                notifier = DiscordNotifier(config.discord_webhook)
-                notifier.notify(
-                    message=f"Webサイトのクロールが完了しましたが、コンテンツは取得できませんでした。\n**URL**: {config.base_url}",
-                    title="クロール失敗",
-                    color=0xff0000  # 赤色
-                )
-            return None, None, None
-        
-        # 変更がなく、スキップオプションが有効な場合はスキップ
-        if config.skip_no_changes and not diff_data['has_changes'] and cache:
-            logging.info("No changes detected. Skipping file generation and notification.")
-            if config.discord_webhook:
-                notifier = DiscordNotifier(config.discord_webhook)
-                notifier.notify(
-                    message=f"Webサイトのクロールが完了しましたが、前回から変更はありませんでした。\n**URL**: {config.base_url}\n**取得ページ数**: {repository.count()}",
-                    title="変更なし",
-                    color=0x3498db  # 青色
-                )
-            return None, None, None
-        
-        # Markdownファイル名の生成
-        markdown_filename = f"{domain}.md"
-        
-        # Markdownファイルとして出力
-        exporter = FileExporter(config.output_dir)
-        markdown_path = exporter.export_markdown(repository, markdown_filename)
-        logging.info(f"Exported Markdown to {markdown_path}")
-        
-        # 差分レポートを出力（差分検知が有効な場合）
-        diff_report_path = None
-        if config.diff_detection and diff_data['has_changes']:
-            diff_report_filename = f"{domain}_diff_report.md"
-            diff_report_path = exporter.export_diff_report(diff_data, diff_report_filename)
-            logging.info(f"Exported diff report to {diff_report_path}")
-        
-        # 概要レポートを出力
-        summary_filename = f"{domain}_summary.md"
-        summary_path = exporter.export_summary(repository, diff_data, summary_filename)
-        logging.info(f"Exported summary to {summary_path}")
-        
-        # PDFファイルとして出力
-        pdf_converter = PdfConverter(config.output_dir)
-        pdf_path = pdf_converter.convert(markdown_path, title=f"{domain} - クロール結果")
-        if pdf_path:
-            logging.info(f"Exported PDF to {pdf_path}")
-        
-        # 差分レポートのPDFを生成（差分がある場合）
-        diff_report_pdf_path = None
-        if diff_report_path:
-            diff_report_pdf_path = pdf_converter.convert(diff_report_path, title=f"{domain} - 差分レポート")
-            if diff_report_pdf_path:
-                logging.info(f"Exported diff report PDF to {diff_report_pdf_path}")
-                
-        # サイトマップを生成
-        try:
-            sitemap_path = generate_sitemap(repository, config.output_dir, domain)
-            logging.info(f"Generated sitemap at {sitemap_path}")
-        except Exception as e:
-            logging.error(f"Failed to generate sitemap: {e}")
-            sitemap_path = None
-        
-        # Discord通知
-        if config.discord_webhook:
-            notifier = DiscordNotifier(config.discord_webhook)
-            
-            # 差分検知が有効かつ変更がある場合
-            if config.diff_detection and diff_data['has_changes']:
-                message = f"Webサイトのクロールが完了しました。**変更が検出されました**。\n"
-                message += f"**URL**: {config.base_url}\n"
-                message += f"**取得ページ数**: {diff_data['total']}\n"
-                message += f"**新規ページ**: {len(diff_data['new_pages'])}\n"
-                message += f"**更新ページ**: {len(diff_data['updated_pages'])}\n"
-                message += f"**削除ページ**: {len(diff_data['deleted_pages'])}\n"
-                
-                # 所要時間があれば表示
-                if 'duration_seconds' in diff_data:
-                    minutes, seconds = divmod(diff_data['duration_seconds'], 60)
-                    message += f"**所要時間**: {minutes}分{seconds}秒"
-                
-                # 差分レポートを添付
-                success = notifier.notify(
-                    message=message,
-                    title=f"{domain} - クロール完了（変更あり）",
-                    color=0x2ecc71,  # 緑色
-                    markdown_path=diff_report_path,
-                    pdf_path=diff_report_pdf_path or pdf_path,
-                )
-            else:
-                # 変更がない場合または差分検知が無効の場合
-                message = f"Webサイトのクロールが完了しました。\n**URL**: {config.base_url}\n**取得ページ数**: {repository.count()}"
-                if 'duration_seconds' in diff_data:
-                    minutes, seconds = divmod(diff_data['duration_seconds'], 60)
-                    message += f"\n**所要時間**: {minutes}分{seconds}秒"
-                    
-                success = notifier.notify(
-                    message=message,
-                    title=f"{domain} - クロール完了",
-                    color=0x3498db,  # 青色
-                    markdown_path=markdown_path,
-                    pdf_path=pdf_path,
-                )
-                
-            if success:
-                logging.info("Discord通知を送信しました")
-            else:
-                logging.error("Discord通知の送信に失敗しました")
-        
-        logging.info("処理が正常に完了しました")
-        
-        return markdown_path, pdf_path, diff_report_path
-        
-    except Exception as e:
-        logging.error(f"実行中にエラーが発生しました: {e}", exc_info=True)
-        if config.discord_webhook:
-            notifier = DiscordNotifier(config.discord_webhook)
-            notifier.notify(
-                message=f"Webサイトのクロール中にエラーが発生しました。\n**URL**: {config.base_url}\n**エラー**: {str(e)}",
-                title="クロールエラー",
-                color=0xff0000  # 赤色
-            )
+"""
+Webクローラーの拡張コンポーネント
+- 非同期クロールエンジン
+- 並列処理のサポート
+- PDF生成機能の改善
+- Discord通知機能
+- ビジュアルクローリング機能
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import json
+import atexit
+import shutil
+import contextlib
+import traceback
+import logging
+import asyncio
+import pdfkit
+import markdown
+import requests
+from typing import Dict, List, Optional, Set, Tuple, Any, Union, Callable
+from datetime import datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter, Retry
+from discord_webhook import DiscordWebhook, DiscordEmbed
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ビジュアルクローリング機能をインポート
+try:
+    from visual_crawler import crawl_url_visual
+    VISUAL_CRAWLING_AVAILABLE = True
+except ImportError:
+    VISUAL_CRAWLING_AVAILABLE = False
+    logging.warning("ビジュアルクローリング機能が利用できません。依存ライブラリがインストールされていない可能性があります。")
+
+# aiohttpが利用可能なら接続を全クロールで共有する（なければrequestsにフォールバック）
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Playwrightが利用可能ならPDF生成に使用（なければwkhtmltopdfにフォールバック）
+try:
+    from playwright.sync_api import sync_playwright
+    PLAYWRIGHT_AVAILABLE = True
+except ImportError:
+    PLAYWRIGHT_AVAILABLE = False
+
+# requests-toolbeltが利用可能なら添付ファイルをストリーミング送信する
+try:
+    from requests_toolbelt import MultipartEncoder
+    MULTIPART_STREAMING_AVAILABLE = True
+except ImportError:
+    MULTIPART_STREAMING_AVAILABLE = False
+
+# httpxが利用可能なら非同期通知をHTTP/2で多重化する（なければスレッド送信のまま）
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+
+class PdfConverter:
+    """MarkdownファイルをPDF形式に変換するコンポーネント（改善版）"""
+    
+    def __init__(self, output_dir: str = "output", css_path: Optional[str] = None):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # カスタムCSSのパス（指定がなければデフォルト使用）
+        self.css_path = css_path
+
+        # wkhtmltopdfのパス解決は1回だけ行い、convert()呼び出し間で再利用する
+        # （Google Colabでは/usr/binにあるが、なければpdfkitにPATH解決させる）
+        try:
+            self.pdfkit_config = pdfkit.configuration(wkhtmltopdf='/usr/bin/wkhtmltopdf')
+        except Exception:
+            self.pdfkit_config = None
+
+        # 常駐ヘッドレスChromium（Playwrightがある場合のみ、初回変換時に起動）
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = threading.Lock()
+        
+        # デフォルトのCSSスタイル
+        self.default_css = """
+        body { 
+            font-family: 'Helvetica', 'Arial', sans-serif; 
+            line-height: 1.6; 
+            max-width: 1000px; 
+            margin: 0 auto; 
+            padding: 20px; 
+        }
+        h1, h2, h3, h4, h5, h6 { margin-top: 1.5em; color: #333; }
+        h1 { border-bottom: 2px solid #eee; padding-bottom: 10px; }
+        h2 { border-bottom: 1px solid #eee; padding-bottom: 5px; }
+        code { background-color: #f8f8f8; padding: 2px 4px; border-radius: 3px; }
+        pre { background-color: #f8f8f8; padding: 10px; border-radius: 5px; overflow-x: auto; }
+        blockquote { border-left: 5px solid #ccc; padding-left: 15px; color: #555; }
+        a { color: #0366d6; text-decoration: none; }
+        a:hover { text-decoration: underline; }
+        table { border-collapse: collapse; width: 100%; margin: 20px 0; }
+        table, th, td { border: 1px solid #ddd; }
+        th, td { padding: 10px; text-align: left; }
+        th { background-color: #f2f2f2; }
+        img { max-width: 100%; height: auto; }
+        """
+
+        # HTMLラッパーはタイトルと本文以外不変なので、テンプレート片を事前に組み立てる
+        self._html_head = (
+            '<!DOCTYPE html>\n<html>\n<head>\n'
+            '<meta charset="utf-8">\n'
+            '<meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+            '<title>'
+        )
+        self._html_style = f'</title>\n<style>\n{self.default_css}\n</style>\n</head>\n<body>\n'
+        self._html_tail = '\n</body>\n</html>'
+
+    def convert(self, markdown_path: str, title: Optional[str] = None) -> str:
+        """MarkdownファイルをPDFに変換する（改善版）"""
+        # 入力ファイル名からPDFファイル名を生成
+        pdf_filename = os.path.basename(markdown_path).replace('.md', '.pdf')
+        pdf_path = os.path.join(self.output_dir, pdf_filename)
+
+        try:
+            # 変換元が前回と同一（mtime・サイズ・タイトル）なら既存のPDFを再利用する
+            # （python-markdownの再変換とwkhtmltopdfの起動を丸ごと省略できる）
+            meta_path = pdf_path + '.meta'
+            cache_key = None
+            try:
+                src_stat = os.stat(markdown_path)
+                cache_key = f"{src_stat.st_mtime_ns}:{src_stat.st_size}:{title or ''}"
+            except OSError:
+                pass
+
+            if cache_key and os.path.exists(pdf_path):
+                try:
+                    with open(meta_path, 'r', encoding='utf-8') as meta_file:
+                        if meta_file.read() == cache_key:
+                            logging.info("変換元が未変更のため既存のPDFを再利用: %s", pdf_path)
+                            return pdf_path
+                except OSError:
+                    pass
+
+            # Markdownを読み込む
+            with open(markdown_path, 'r', encoding='utf-8') as md_file:
+                md_content = md_file.read()
+            
+            # MarkdownをHTML形式に変換（拡張機能を有効化）
+            html_content = markdown.markdown(
+                md_content, 
+                extensions=[
+                    'markdown.extensions.tables', 
+                    'markdown.extensions.fenced_code',
+                    'markdown.extensions.toc',
+                    'markdown.extensions.footnotes'
+                ]
+            )
+            
+            # HTMLにスタイルとメタデータを追加（事前構築済みのテンプレート片を連結）
+            html_document = (
+                self._html_head + (title or 'Crawled Content')
+                + self._html_style + html_content + self._html_tail
+            )
+
+            # カスタムCSSがあれば使用
+            options = {
+                'page-size': 'A4',
+                'margin-top': '20mm',
+                'margin-right': '20mm',
+                'margin-bottom': '20mm',
+                'margin-left': '20mm',
+                'encoding': 'UTF-8',
+                'no-outline': None,
+                'enable-local-file-access': True
+            }
+            
+            if self.css_path and os.path.exists(self.css_path):
+                options['user-style-sheet'] = self.css_path
+                
+            # タイトルがあれば設定
+            if title:
+                options['title'] = title
+            
+            # Playwrightがあれば常駐のヘッドレスChromiumでレンダリングする
+            # （wkhtmltopdfのプロセス起動コストと大型文書でのメモリ肥大を回避）
+            converted = False
+            if PLAYWRIGHT_AVAILABLE:
+                try:
+                    self._render_with_chromium(html_document, pdf_path)
+                    converted = True
+                except Exception as e:
+                    logging.warning("Chromiumでの変換に失敗しました。wkhtmltopdfで再試行します: %s", e)
+
+            if not converted:
+                # HTMLは一時ファイルを経由せず、wkhtmltopdfのstdinへ直接渡す
+                # （ディスク往復の削減と、並列変換時の temp.html 競合の解消）
+                if self.pdfkit_config is not None:
+                    try:
+                        # wkhtmltopdfを使用してPDFに変換
+                        pdfkit.from_string(html_document, pdf_path, options=options,
+                                           configuration=self.pdfkit_config)
+                    except Exception as e:
+                        logging.warning("特定のwkhtmltopdfパスでの変換に失敗しました: %s", e)
+                        # パスを指定せずに再試行
+                        pdfkit.from_string(html_document, pdf_path, options=options)
+                else:
+                    pdfkit.from_string(html_document, pdf_path, options=options)
+
+            # 次回の再利用判定のために変換元のキーを記録
+            if cache_key:
+                with open(meta_path, 'w', encoding='utf-8') as meta_file:
+                    meta_file.write(cache_key)
+
+            return pdf_path
+            
+        except Exception as e:
+            logging.error("PDF変換エラー: %s", e)
+            return None
+
+    def _render_with_chromium(self, html_document: str, pdf_path: str):
+        """常駐のヘッドレスChromiumでHTMLをPDFにレンダリングする
+
+        ブラウザは初回変換時に1度だけ起動し、以降の変換で再利用する。
+        PlaywrightのsyncAPIはスレッドセーフではないため、レンダリングは
+        ロックで直列化する（エンジン起動の償却が目的なのでこれで十分）。
+        """
+        with self._browser_lock:
+            if self._browser is None:
+                self._playwright = sync_playwright().start()
+                self._browser = self._playwright.chromium.launch(
+                    args=['--disable-dev-shm-usage']
+                )
+
+            page = self._browser.new_page()
+            try:
+                page.set_content(html_document, wait_until='load')
+                page.pdf(
+                    path=pdf_path,
+                    format='A4',
+                    margin={'top': '20mm', 'right': '20mm',
+                            'bottom': '20mm', 'left': '20mm'}
+                )
+            finally:
+                page.close()
+
+    def __del__(self):
+        """クリーンアップ処理"""
+        try:
+            if self._browser is not None:
+                self._browser.close()
+            if self._playwright is not None:
+                self._playwright.stop()
+        except Exception:
+            pass
+
+
+# Discord Webhook送信用の共有セッション
+# （keep-aliveで接続を再利用し、通知のたびにTLSハンドシェイクを行わない）
+_WEBHOOK_SESSION = requests.Session()
+_WEBHOOK_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=10,
+    # Discordの429はRetry-Afterを返すため、アダプタ側で指数バックオフ付きの
+    # 再送を行う（通知がレート制限で黙って失われないようにする）
+    max_retries=Retry(
+        total=5,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True
+    )
+))
+
+# DiscordのWebhook添付ファイル上限（8MB）
+MAX_DISCORD_FILE = 8 * 1024 * 1024
+
+# 通知Embedの色（Discordの慣例色）
+DISCORD_BLUE = 0x3498db   # 情報・完了（変更なし）
+DISCORD_GREEN = 0x2ecc71  # 完了（変更あり）
+DISCORD_RED = 0xff0000    # エラー
+
+# 通知タイトルのテンプレート
+TITLE_COMPLETE = "{domain} - クロール完了"
+TITLE_CHANGES = "{domain} - クロール完了（変更あり）"
+TITLE_NO_CHANGES = "変更なし"
+TITLE_FAILED = "クロール失敗"
+TITLE_ERROR = "クロールエラー"
+
+# クロール完了通知の本文テンプレート（集計済みのsummary辞書をformat_mapで埋め込む）
+COMPLETION_TEMPLATE = (
+    "Webサイトのクロールが完了しました。\n"
+    "**URL**: {base_url}\n"
+    "**取得ページ数**: {pages}\n"
+    "**所要時間**: {duration}"
+)
+CHANGES_TEMPLATE = (
+    "Webサイトのクロールが完了しました。**変更が検出されました**。\n"
+    "**URL**: {base_url}\n"
+    "**取得ページ数**: {pages}\n"
+    "**新規ページ**: {new}\n"
+    "**更新ページ**: {updated}\n"
+    "**削除ページ**: {deleted}\n"
+    "**所要時間**: {duration}"
+)
+
+# 通知のバックグラウンド送信用スレッドプール
+# （呼び出し側をDiscordへの往復時間でブロックしない。終了時は送信完了を待つ）
+_NOTIFY_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="discord-notify")
+atexit.register(_NOTIFY_POOL.shutdown, wait=True)
+
+# HTTP/2対応の非同期Webhookクライアント（httpxがある場合のみ、初回使用時に生成）
+# 複数の通知が1本のTLS接続上で多重化され、2本目以降のハンドシェイクを省ける
+_ASYNC_WEBHOOK_CLIENT = None
+
+
+def _get_async_webhook_client():
+    """共有のhttpx.AsyncClientを返す（h2が無い環境ではHTTP/1.1で生成）"""
+    global _ASYNC_WEBHOOK_CLIENT
+    if _ASYNC_WEBHOOK_CLIENT is None:
+        limits = httpx.Limits(max_keepalive_connections=4, max_connections=8)
+        timeout = httpx.Timeout(10.0, connect=3.0)
+        try:
+            _ASYNC_WEBHOOK_CLIENT = httpx.AsyncClient(
+                http2=True, timeout=timeout, limits=limits)
+        except ImportError:
+            # http2=Trueはh2パッケージを必要とする
+            _ASYNC_WEBHOOK_CLIENT = httpx.AsyncClient(timeout=timeout, limits=limits)
+    return _ASYNC_WEBHOOK_CLIENT
+
+
+def _gate_discord_attachment(path):
+    """添付上限内ならパスを、超過時はNoneとメッセージ用の注記を返す
+
+    上限超えのファイルはアップロード後に413で拒否されるため、
+    送信前に除外して帯域とレート制限枠の浪費を防ぐ。
+    """
+    if not path:
+        return None, None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None, None
+    if size > MAX_DISCORD_FILE:
+        return None, (
+            f"**添付省略**: {os.path.basename(path)}"
+            f"（{size // 1024}KBが上限8MBを超過。{path} を参照）"
+        )
+    return path, None
+
+
+def _safe_notify_error(webhook_url, base_url, error_text):
+    """エラー通知をベストエフォートで送信する（失敗しても例外を外へ出さない）
+
+    共有セッションのリトライポリシーを通さず短いタイムアウトで1回だけ
+    POSTし、Discord側の障害時でも終了処理を長時間ブロックしない。
+    """
+    try:
+        webhook = DiscordWebhook(url=webhook_url)
+        embed = DiscordEmbed(
+            title=TITLE_ERROR,
+            description=(
+                f"Webサイトのクロール中にエラーが発生しました。\n"
+                f"**URL**: {base_url}\n**エラー**: {error_text}"
+            ),
+            color=DISCORD_RED
+        )
+        embed.set_timestamp()
+        embed.set_footer(text="Webサイトクローラー")
+        webhook.add_embed(embed)
+        requests.post(webhook.url, json=webhook.json, timeout=(2, 3))
+    except Exception as e:
+        logging.error("エラー通知の送信に失敗しました: %s", e)
+
+
+def _log_notify_result(future):
+    """バックグラウンド通知の結果をログに記録する"""
+    try:
+        if future.result():
+            logging.info("Discord通知を送信しました")
+        else:
+            logging.error("Discord通知の送信に失敗しました")
+    except Exception as e:
+        logging.error("Discord通知エラー: %s", e)
+
+
+class DiscordNotifier:
+    """Discordに通知を送信するコンポーネント（改善版）"""
+
+    def __init__(self, webhook_url: str):
+        self.webhook_url = webhook_url
+        self.session = _WEBHOOK_SESSION
+
+    def _post_webhook(self, webhook, files=None):
+        """Webhookペイロードを共有セッション経由で送信する"""
+        if files:
+            response = self.session.post(
+                webhook.url,
+                data={'payload_json': json.dumps(webhook.json)},
+                files=files,
+                timeout=(3.05, 60)
+            )
+        else:
+            response = self.session.post(webhook.url, json=webhook.json, timeout=(3.05, 10))
+
+        # レート制限の残量が尽きていたら、ウィンドウが回復するまで待ってから戻る
+        # （連続送信する呼び出し側が次のPOSTで429を踏まないようにする）
+        if response is not None and response.headers.get('X-RateLimit-Remaining') == '0':
+            try:
+                time.sleep(float(response.headers.get('X-RateLimit-Reset-After', 0)))
+            except (TypeError, ValueError):
+                pass
+
+        return response
+
+    def notify_async(self, **kwargs):
+        """通知をバックグラウンドで送信する
+
+        呼び出し側はDiscordへの往復を待たずに処理を続けられる。
+        結果の確認が必要な場合は返されたFutureを使う。
+        """
+        return _NOTIFY_POOL.submit(self.notify, **kwargs)
+
+    async def anotify(self,
+                      message: str,
+                      title: Optional[str] = None,
+                      color: int = DISCORD_BLUE,
+                      markdown_path: Optional[str] = None,
+                      pdf_path: Optional[str] = None,
+                      diff_path: Optional[str] = None) -> bool:
+        """notify()の非同期版
+
+        httpxが利用可能な場合は共有のHTTP/2クライアントで送信し、並行する
+        通知（進捗・完了・ファイル添付）が1本のTLS接続上で多重化される。
+        httpxが無い環境ではスレッドプール経由で同期版にフォールバックする。
+        """
+        if not HTTPX_AVAILABLE:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_NOTIFY_POOL, lambda: self.notify(
+                message=message, title=title, color=color,
+                markdown_path=markdown_path, pdf_path=pdf_path, diff_path=diff_path))
+
+        try:
+            webhook = DiscordWebhook(url=self.webhook_url)
+            embed = DiscordEmbed(
+                title=title or "クロール結果通知",
+                description=message,
+                color=color
+            )
+            embed.set_timestamp()
+            embed.set_footer(text="Webサイトクローラー")
+            webhook.add_embed(embed)
+
+            # 添付ファイルを集める（上限超過はスキップ）
+            files = {}
+            for path in (markdown_path, pdf_path, diff_path):
+                if not path:
+                    continue
+                try:
+                    if os.stat(path).st_size > MAX_DISCORD_FILE:
+                        logging.warning("ファイルサイズが大きすぎるためスキップ: %s", os.path.basename(path))
+                        continue
+                    with open(path, 'rb') as f:
+                        files[f'files[{len(files)}]'] = (os.path.basename(path), f.read())
+                except OSError as e:
+                    logging.error("ファイルの読み込みに失敗しました: %s - %s", path, e)
+
+            client = _get_async_webhook_client()
+            if files:
+                response = await client.post(
+                    self.webhook_url,
+                    data={'payload_json': json.dumps(webhook.json)},
+                    files=files
+                )
+            else:
+                response = await client.post(self.webhook_url, json=webhook.json)
+
+            if 200 <= response.status_code < 300:
+                logging.info("Discord通知を送信しました")
+                return True
+            logging.error("Discord通知の送信に失敗: %s", response.status_code)
+            return False
+
+        except Exception as e:
+            logging.error("Discord通知エラー: %s", e)
+            return False
+
+    def notify(self,
+               message: str,
+               title: Optional[str] = None,
+               color: int = DISCORD_BLUE,
+               markdown_path: Optional[str] = None, 
+               pdf_path: Optional[str] = None,
+               diff_path: Optional[str] = None) -> bool:
+        """Discord通知を送信する（改善版：Embedsサポート）"""
+        try:
+            # Webhookインスタンスを作成
+            webhook = DiscordWebhook(url=self.webhook_url)
+            
+            # 埋め込みメッセージを作成
+            embed = DiscordEmbed(
+                title=title or "クロール結果通知",
+                description=message,
+                color=color
+            )
+            
+            # タイムスタンプを追加
+            embed.set_timestamp()
+            
+            # フッターを追加
+            embed.set_footer(text="Webサイトクローラー")
+            
+            # 埋め込みメッセージをWebhookに追加
+            webhook.add_embed(embed)
+            
+            # ファイルリストを作成（存在確認とサイズ取得を1回のstatで済ませる）
+            file_paths = []
+            for path in (markdown_path, pdf_path, diff_path):
+                if not path:
+                    continue
+                try:
+                    file_stat = os.stat(path)
+                except OSError:
+                    continue
+                file_paths.append((path, os.path.basename(path), file_stat.st_size))
+            
+            # ファイルを分割して送信（Discordの添付ファイル制限に対応）
+            if file_paths:
+                # 最大8MBの制限があるため、まずファイルをバッチに分割する
+                max_size = MAX_DISCORD_FILE
+                batches = []
+                current_batch = []
+                current_size = 0
+
+                for file_path, file_name, file_size in file_paths:
+                    # 単一ファイルが8MBを超える場合はスキップ
+                    if file_size > max_size:
+                        logging.warning("ファイルサイズが大きすぎるためスキップ: %s", file_name)
+                        continue
+
+                    # このバッチに収まらなければ新しいバッチを開始
+                    if current_batch and current_size + file_size > max_size:
+                        batches.append(current_batch)
+                        current_batch = []
+                        current_size = 0
+
+                    current_batch.append((file_path, file_name))
+                    current_size += file_size
+
+                if current_batch:
+                    batches.append(current_batch)
+
+                # 添付できるファイルがなければメッセージのみ送信
+                if not batches:
+                    response = self._post_webhook(webhook)
+                    return bool(response and 200 <= response.status_code < 300)
+
+                # 先頭バッチは埋め込み付きWebhookを使い、全バッチを並列で送信する
+                # （バッチごとの往復遅延を直列に積み上げない）
+                webhooks = [webhook]
+                webhooks += [DiscordWebhook(url=self.webhook_url) for _ in batches[1:]]
+
+                with ThreadPoolExecutor(max_workers=min(4, len(batches))) as executor:
+                    futures = [
+                        executor.submit(self._send_webhook_with_files, wh, batch)
+                        for wh, batch in zip(webhooks, batches)
+                    ]
+                    for future in futures:
+                        future.result()
+
+                return True
+            
+            else:
+                # ファイルなしで通知を送信
+                response = self._post_webhook(webhook)
+
+                # レスポンスコードをチェック
+                if response and 200 <= response.status_code < 300:
+                    logging.info("Discord通知を送信しました")
+                    return True
+                else:
+                    status_code = response.status_code if response else 'No response'
+                    logging.error("Discord通知の送信に失敗: %s", status_code)
+                    return False
+                
+        except Exception as e:
+            logging.error("Discord通知エラー: %s", e)
+            return False
+    
+    def _send_webhook_with_files(self, webhook, file_batch):
+        """ファイルバッチをDiscordに送信する"""
+        if MULTIPART_STREAMING_AVAILABLE:
+            response = self._stream_webhook_with_files(webhook, file_batch)
+        else:
+            files = {}
+            for i, (file_path, file_name) in enumerate(file_batch):
+                # 1MB単位のチャンク読み込みで巨大な一括read()の割り当てを避ける
+                with open(file_path, 'rb') as f:
+                    buf = io.BytesIO()
+                    shutil.copyfileobj(f, buf, length=1024 * 1024)
+                    files[f'files[{i}]'] = (file_name, buf.getvalue())
+
+            response = self._post_webhook(webhook, files=files)
+
+        if not response or not (200 <= response.status_code < 300):
+            status_code = response.status_code if response else 'No response'
+            logging.error("ファイル付きDiscord通知の送信に失敗: %s", status_code)
+
+    def _stream_webhook_with_files(self, webhook, file_batch):
+        """添付ファイルをメモリに載せず、ディスクからソケットへ直接流して送信する"""
+        handles = []
+        try:
+            fields = {'payload_json': ('', json.dumps(webhook.json), 'application/json')}
+            for i, (file_path, file_name) in enumerate(file_batch):
+                # 64KBバッファで読み出し、添付サイズによらず常駐メモリを一定に保つ
+                f = open(file_path, 'rb', buffering=64 * 1024)
+                handles.append(f)
+                fields[f'files[{i}]'] = (file_name, f, 'application/octet-stream')
+
+            encoder = MultipartEncoder(fields=fields)
+            return self.session.post(
+                webhook.url,
+                data=encoder,
+                headers={'Content-Type': encoder.content_type},
+                timeout=(3.05, 60)
+            )
+        finally:
+            for f in handles:
+                f.close()
+
+
+class AsyncCrawler:
+    """並列処理を活用した非同期クローラーエンジン"""
+    
+    def __init__(self, config, components):
+        """
+        非同期クローラーの初期化
+
+        Args:
+            config: クローラー設定
+            components: 必要なコンポーネント（url_filter, fetcher, parser, markdown_converter, cache, repository）
+        """
+        self.config = config
+        self.url_filter = components['url_filter']
+        self.fetcher = components['fetcher']
+        self.parser = components['parser']
+        self.markdown_converter = components['markdown_converter']
+        self.cache = components.get('cache')
+        self.repository = components['repository']
+
+        # ビジュアルクローリングモードの設定
+        self.visual_mode = getattr(config, 'visual_mode', False)
+        self.visual_config = getattr(config, 'visual_config', {})
+
+        # クロール状態の追跡
+        # seen_urlsは「訪問済み∪キュー投入済み」の単一セット（重複判定は1回の参照で済む）
+        self.visited_urls = set()
+        self.seen_urls = {config.base_url}
+        self.queue = asyncio.Queue()
+        self.queue.put_nowait(config.base_url)
+        self._in_flight = 0  # 処理中のURL数（終了判定用）
+
+        # 差分情報の追跡
+        self.new_pages = []
+        self.updated_pages = []
+        self.deleted_pages = []
+        self.page_diffs = {}
+
+        # 統計データ（ホットパスの加算は属性で行い、最後にstats辞書へまとめる）
+        self._start_time = time.time()
+        self._end_time = None
+        self._processed_urls = 0
+        self._successful_fetches = 0
+        self._failed_fetches = 0
+        self._skipped_urls = 0
+        self.stats = {}
+
+        # 並列処理の制御
+        self.max_workers = config.max_workers
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+
+        # ホストごとの同時接続数の上限（単一サーバーへの集中を防ぐ）
+        self._host_semaphores = {}
+        self._host_limit = getattr(config, 'max_connections_per_host', 16)
+
+        # ビジュアルクローリング用の共有スレッドプール
+        # （URLごとにThreadPoolExecutorを生成するコストを償却する）
+        self._visual_executor = None
+        if self.visual_mode and VISUAL_CRAWLING_AVAILABLE:
+            self._visual_executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="visual"
+            )
+
+        # 共有HTTPセッション（crawl()開始時にイベントループ内で生成する）
+        self._session = None
+
+        # 状態制御
+        self.is_running = False
+        self.stop_event = asyncio.Event()
+    
+    async def crawl(self) -> Tuple[Dict, Dict]:
+        """Webサイトを非同期でクロールする"""
+        self.is_running = True
+        workers = []
+
+        # 共有HTTPセッションを生成（TCP/TLSハンドシェイクをURLごとに繰り返さない）
+        if AIOHTTP_AVAILABLE and not self.visual_mode:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_workers * 2,
+                limit_per_host=self.max_workers,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.fetcher.headers,
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout)
+            )
+
+        # 進捗ロギング用タスク
+        progress_task = asyncio.create_task(self._log_progress())
+
+        try:
+            # ワーカータスクを作成
+            for _ in range(self.max_workers):
+                worker = asyncio.create_task(self._worker())
+                workers.append(worker)
+            
+            # すべてのワーカーが完了するまで待機
+            await asyncio.gather(*workers)
+            
+        except asyncio.CancelledError:
+            logging.info("クロールがキャンセルされました")
+            # すべてのワーカーをキャンセル
+            for worker in workers:
+                worker.cancel()
+        finally:
+            # 進捗ロギング用タスクをキャンセル
+            progress_task.cancel()
+            self.is_running = False
+
+            # 共有HTTPセッションをクローズ
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
+
+            # Fetcherが自前で生成したセッションがあればそれも閉じる
+            if hasattr(self.fetcher, 'aclose'):
+                await self.fetcher.aclose()
+
+            # ビジュアルクローリング用スレッドプールを解放
+            if self._visual_executor is not None:
+                self._visual_executor.shutdown(wait=False)
+            
+            # 削除されたページを特定（差分検知が有効な場合）
+            if self.cache and self.config.diff_detection:
+                cached_urls = self.cache.get_all_urls()
+                current_urls = set(self.repository.get_all().keys())
+                self.deleted_pages = list(cached_urls - current_urls)
+                
+                # 削除されたページをキャッシュから削除
+                if self.deleted_pages:
+                    self.cache.delete_urls(self.deleted_pages)
+                
+                # 統計情報を記録
+                self._end_time = time.time()
+                duration_seconds = int(self._end_time - self._start_time)
+
+                # クロール履歴を保存
+                self.cache.save_crawl_history(
+                    page_count=self.repository.count(),
+                    new_count=len(self.new_pages),
+                    updated_count=len(self.updated_pages),
+                    deleted_count=len(self.deleted_pages),
+                    duration_seconds=duration_seconds
+                )
+            else:
+                self._end_time = time.time()
+
+            # カウンタ属性を統計辞書へまとめる
+            self.stats = {
+                'start_time': self._start_time,
+                'end_time': self._end_time,
+                'processed_urls': self._processed_urls,
+                'successful_fetches': self._successful_fetches,
+                'failed_fetches': self._failed_fetches,
+                'skipped_urls': self._skipped_urls,
+                'visual_mode': self.visual_mode
+            }
+
+            # 差分情報を作成
+            diff_data = {
+                'total': self.repository.count(),
+                'new_pages': self.new_pages,
+                'updated_pages': self.updated_pages,
+                'deleted_pages': self.deleted_pages,
+                'diffs': self.page_diffs,
+                'has_changes': bool(self.new_pages or self.updated_pages or self.deleted_pages),
+                'duration_seconds': int(self._end_time - self._start_time)
+            }
+            
+            # リポジトリを確定
+            self.repository.finalize()
+            
+            logging.info("クロールが完了しました。訪問したURL数: %s、保存したページ数: %s。", len(self.visited_urls), self.repository.count())
+            logging.info("変更点: 新規: %s、更新: %s、削除: %s。", len(self.new_pages), len(self.updated_pages), len(self.deleted_pages))
+            
+            return self.repository, diff_data
+    
+    async def _worker(self):
+        """非同期ワーカープロセス
+
+        タイムアウト付きポーリングは行わず、キューで無期限に待機する。
+        クロール完了時（または停止要求時）はNoneの番兵が投入され、
+        それを受け取ったワーカーが順次終了する。
+        """
+        while True:
+            url = await self.queue.get()
+            try:
+                # Noneはシャットダウン用の番兵
+                if url is None or self.stop_event.is_set():
+                    return
+
+                # 既に訪問済みのURLならスキップ
+                if url in self.visited_urls:
+                    continue
+
+                # 処理中カウンタを更新しつつ、全体とホスト単位のセマフォーで同時実行数を制限
+                self._in_flight += 1
+                try:
+                    async with self.semaphore, self._get_host_semaphore(url):
+                        await self._process_url(url)
+                finally:
+                    self._in_flight -= 1
+
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logging.error("ワーカープロセスでエラー発生: %s", e)
+            finally:
+                # タスク完了通知
+                self.queue.task_done()
+
+                # 最後のURLを処理し終えたら、待機中の全ワーカーへ番兵を配る
+                if url is not None and self.queue.empty() and self._in_flight == 0:
+                    for _ in range(self.max_workers):
+                        self.queue.put_nowait(None)
+    
+    def _get_host_semaphore(self, url):
+        """ホストごとの同時接続数を制限するセマフォーを取得する"""
+        host = urlparse(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores.setdefault(
+                host, asyncio.Semaphore(self._host_limit)
+            )
+        return semaphore
+
+    async def _process_url(self, url):
+        """URLを処理する"""
+        try:
+            # 訪問済みとしてマーク
+            self.visited_urls.add(url)
+            self._processed_urls += 1
+
+            # ビジュアルモードが有効かつライブラリが利用可能な場合
+            if self.visual_mode and VISUAL_CRAWLING_AVAILABLE:
+                # 共有スレッドプールでビジュアルクローリングを実行
+                page_data = await asyncio.get_running_loop().run_in_executor(
+                    self._visual_executor, crawl_url_visual, url, self.visual_config
+                )
+
+                if "error" in page_data:
+                    logging.error("ビジュアルクローリングエラー %s: %s", url, page_data['error'])
+                    self._failed_fetches += 1
+                    self.repository.add({'url': url, 'title': 'Error', 'html_content': ''}, status='error')
+                    return
+
+                # リンクはビジュアルモードでは抽出されないため空のリストを使用
+                links = []
+
+                logging.info("ビジュアルモードでページをクロール: %s", url)
+
+            else:
+                # 通常のクローリングプロセス
+                # キャッシュからページ情報を取得
+                cached_page = None
+                if self.cache and self.config.diff_detection:
+                    cached_page = self.cache.get_page(url)
+
+                # ページのHTMLを取得（条件付きリクエスト）
+                etag = cached_page.get('etag') if cached_page else None
+                last_modified = cached_page.get('last_modified') if cached_page else None
+
+                html, headers_info = await self.fetcher.fetch_async(
+                    url, etag, last_modified, session=self._session
+                )
+
+                # 304 Not Modified の場合、キャッシュから前回のコンテンツを使用
+                if headers_info.get('status_code') == 304 and cached_page:
+                    logging.info("キャッシュされたコンテンツを使用: %s", url)
+                    page_data = {
+                        'url': url,
+                        'title': cached_page['title'],
+                        'html_content': '', # HTMLは保存不要
+                        'markdown_content': cached_page['markdown_content'],
+                        'etag': cached_page['etag'],
+                        'last_modified': cached_page['last_modified'],
+                        'meta_description': cached_page.get('meta_description', '')
+                    }
+                    self.repository.add(page_data)
+                    return
+
+                # HTMLが取得できなかった場合はスキップ
+                if html is None:
+                    self._skipped_urls += 1
+                    self.repository.add({'url': url, 'title': 'Error', 'html_content': ''}, status='skipped')
+                    return
+
+                self._successful_fetches += 1
+
+                # HTMLを解析してコンテンツとリンクを抽出
+                page_data, links = self.parser.parse(html, url)
+
+                # コンテンツがない場合はスキップ
+                if not page_data.get('html_content'):
+                    self._skipped_urls += 1
+                    return
+
+                # ヘッダー情報を追加
+                page_data['etag'] = headers_info.get('etag')
+                page_data['last_modified'] = headers_info.get('last_modified')
+
+                # HTMLをMarkdownに変換
+                page_data = self.markdown_converter.convert(page_data)
+
+            # 差分検知（有効な場合）- ビジュアルモードでも共通
+            if self.cache and self.config.diff_detection:
+                # キャッシュへの追加・更新と差分計算を1回のパスで実行
+                status, diff = self.cache.upsert_and_diff(page_data)
+
+                if status == 'new':
+                    self.new_pages.append(url)
+                elif status == 'updated':
+                    self.updated_pages.append(url)
+                    self.page_diffs[url] = diff
+
+            # コンテンツを保存
+            self.repository.add(page_data)
+
+            # 新しいリンクをキューに追加（ビジュアルモードでは空のリストになる可能性がある）
+            self._add_new_links_to_queue(links)
+
+        except Exception as e:
+            logging.error("URL処理エラー %s: %s", url, e)
+            self._failed_fetches += 1
+            self.repository.add({'url': url, 'title': 'Error', 'html_content': ''}, status='error')
+    
+    def _add_new_links_to_queue(self, links):
+        """新しいリンクをキューに追加する
+
+        キューは容量無制限なのでput_nowaitは失敗せず、リンクごとに
+        イベントループへ制御を返さずに一括で投入できる。
+        """
+        for link in links:
+            # 訪問済みかキューに入っている場合はスキップ
+            if link in self.seen_urls:
+                continue
+
+            # 最大ページ数に達していたらスキップ
+            if len(self.seen_urls) >= self.config.max_pages:
+                break
+
+            # キューに追加
+            self.seen_urls.add(link)
+            self.queue.put_nowait(link)
+    
+    async def _log_progress(self):
+        """現在の進捗を定期的にログに記録する"""
+        try:
+            while self.is_running:
+                queue_size = self.queue.qsize()
+                visited = len(self.visited_urls)
+                total = visited + queue_size
+                
+                if total > 0:
+                    progress = (visited / (visited + queue_size)) * 100
+                    elapsed = time.time() - self._start_time
+                    pages_per_second = visited / elapsed if elapsed > 0 else 0
+                    
+                    logging.info("進捗: %s/%s (%.1f%%) 完了 - 処理速度: %.2f ページ/秒", visited, total, progress, pages_per_second)
+                
+                await asyncio.sleep(10)  # 10秒ごとに進捗を更新
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logging.error("進捗ロギングエラー: %s", e)
+    
+    def stop(self):
+        """クロールを停止する"""
+        if self.is_running:
+            self.stop_event.set()
+
+            # キューで待機中のワーカーを番兵で起こして終了させる
+            for _ in range(self.max_workers):
+                self.queue.put_nowait(None)
+
+            logging.info("クロールを停止中...")
+
+
+def generate_sitemap(repository, output_dir, domain, url_blacklist=None):
+    """サイトマップXMLを生成する"""
+    from lxml import etree
+
+    # 現在の日付
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    # コンテンツを取得
+    contents = repository.get_all()
+
+    # 除外URLパターン（指定がなければ空のセット）
+    # パターンは1つの正規表現にまとめ、URLごとの部分文字列走査を1パスにする
+    url_blacklist = url_blacklist or set()
+    blacklist_re = re.compile('|'.join(map(re.escape, url_blacklist))) if url_blacklist else None
+
+    sitemap_path = os.path.join(output_dir, f"sitemap-{domain}.xml")
+
+    # ツリー全体をメモリに構築せず、URL要素を逐次ファイルへ書き出す
+    # （URL数に関係なくメモリ使用量が一定になる）
+    with etree.xmlfile(sitemap_path, encoding='utf-8') as xf:
+        xf.write_declaration()
+        with xf.element('urlset', nsmap={None: "http://www.sitemaps.org/schemas/sitemap/0.9"}):
+            for url, page_data in contents.items():
+                # 除外URLパターンに一致するURLはスキップ
+                if blacklist_re and blacklist_re.search(url):
+                    continue
+
+                # 更新頻度の推測（パスの深さによって変更）
+                path_depth = url.count('/') - 2  # http://domain.com/ の基本的な部分を除く
+
+                if path_depth <= 1:  # トップレベルページ
+                    changefreq = "daily"
+                elif path_depth == 2:  # セカンドレベルページ
+                    changefreq = "weekly"
+                else:  # 深いレベルのページ
+                    changefreq = "monthly"
+
+                # 優先度の設定（パスの深さに応じて下げる）
+                if path_depth == 0:  # ホームページ
+                    priority = "1.0"
+                else:
+                    priority_value = max(0.1, 1.0 - (path_depth * 0.2))
+                    priority = f"{priority_value:.1f}"
+
+                url_element = etree.Element("url")
+                etree.SubElement(url_element, "loc").text = url
+                etree.SubElement(url_element, "lastmod").text = today
+                etree.SubElement(url_element, "changefreq").text = changefreq
+                etree.SubElement(url_element, "priority").text = priority
+                xf.write(url_element, pretty_print=True)
+
+    return sitemap_path
+
+
+def run_colab_crawler(config):
+    """Google Colab向けの改善されたクローラー実行関数"""
+    from crawler_components import (
+        UrlFilter, Fetcher, Parser, MarkdownConverter,
+        ContentRepository, CrawlCache, FileExporter
+    )
+
+    # ビジュアルモードの確認
+    visual_mode = getattr(config, 'visual_mode', False)
+    if visual_mode:
+        if not VISUAL_CRAWLING_AVAILABLE:
+            logging.warning("ビジュアルクローリングモードが指定されましたが、必要な依存関係が不足しています。標準モードにフォールバックします。")
+            config.visual_mode = False
+        else:
+            logging.info("ビジュアルクローリングモードが有効です。")
+
+    # ロガーの設定
+    log_file = os.path.join(config.output_dir, "crawler.log")
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler(log_file)
+        ]
+    )
+
+    # Discord通知用インスタンスは1つだけ作り、成功・失敗の両経路で共有する
+    notifier = DiscordNotifier(config.discord_webhook) if config.discord_webhook else None
+
+    try:
+        # 出力ディレクトリを作成
+        os.makedirs(config.output_dir, exist_ok=True)
+
+        # ドメイン名を取得
+        domain = urlparse(config.base_url).netloc
+
+        # 各コンポーネントの初期化
+        url_filter = UrlFilter(config)
+        fetcher = Fetcher(config)
+        parser = Parser(url_filter)
+        markdown_converter = MarkdownConverter()
+        repository = ContentRepository()
+
+        # 差分検知が有効な場合はキャッシュを初期化
+        cache = CrawlCache(domain, config.cache_dir) if config.diff_detection else None
+
+        # 非同期クローラーを初期化
+        components = {
+            'url_filter': url_filter,
+            'fetcher': fetcher,
+            'parser': parser,
+            'markdown_converter': markdown_converter,
+            'repository': repository,
+            'cache': cache
+        }
+
+        crawler = AsyncCrawler(config, components)
+        
+        # クローラーを実行（非同期実行をイベントループで処理）
+        # 後始末はExitStackに登録し、例外経路でも確定的に実行されるようにする
+        with contextlib.ExitStack() as stack:
+            loop = asyncio.new_event_loop()
+            stack.callback(loop.close)
+            stack.callback(asyncio.set_event_loop, None)
+            asyncio.set_event_loop(loop)
+            repository, diff_data = loop.run_until_complete(crawler.crawl())
+
+        # 通知・判定で繰り返し使う集計値はクロール直後に1回だけ辞書へまとめる
+        # （repository.count() のようなリポジトリ呼び出しを通知経路から排除する）
+        minutes, seconds = divmod(diff_data['duration_seconds'], 60)
+        summary = {
+            'base_url': config.base_url,
+            'domain': domain,
+            'pages': diff_data['total'],
+            'new': len(diff_data['new_pages']),
+            'updated': len(diff_data['updated_pages']),
+            'deleted': len(diff_data['deleted_pages']),
+            'duration': f"{minutes}分{seconds}秒",
+        }
+
+        # 結果がない場合はエラー
+        if summary['pages'] == 0:
+            logging.error("No content was crawled.")
+            if notifier:
+                notifier.notify_async(
+                    message=f"Webサイトのクロールが完了しましたが、コンテンツは取得できませんでした。\n**URL**: {config.base_url}",
+                    title=TITLE_FAILED,
+                    color=DISCORD_RED
+                ).add_done_callback(_log_notify_result)
+            return None, None, None
+        
+        # 変更がなく、スキップオプションが有効な場合はスキップ
+        if config.skip_no_changes and not diff_data['has_changes'] and cache:
+            logging.info("No changes detected. Skipping file generation and notification.")
+            if notifier:
+                notifier.notify_async(
+                    message=f"Webサイトのクロールが完了しましたが、前回から変更はありませんでした。\n**URL**: {config.base_url}\n**取得ページ数**: {summary['pages']}",
+                    title=TITLE_NO_CHANGES,
+                    color=DISCORD_BLUE
+                ).add_done_callback(_log_notify_result)
+            return None, None, None
+        
+        # Markdownファイル名の生成
+        markdown_filename = f"{domain}.md"
+        
+        # 各種ファイルを並行してエクスポートする（書き込みI/O同士を重ねる）
+        exporter = FileExporter(config.output_dir)
+        summary_filename = f"{domain}_summary.md"
+        export_diff = config.diff_detection and diff_data['has_changes']
+
+        async def _run_exports():
+            tasks = [
+                asyncio.to_thread(exporter.export_markdown, repository, markdown_filename),
+                asyncio.to_thread(exporter.export_summary, repository, diff_data, summary_filename)
+            ]
+            if export_diff:
+                tasks.append(asyncio.to_thread(
+                    exporter.export_diff_report, diff_data, f"{domain}_diff_report.md"
+                ))
+            return await asyncio.gather(*tasks)
+
+        export_results = asyncio.run(_run_exports())
+
+        markdown_path = export_results[0]
+        logging.info("Exported Markdown to %s", markdown_path)
+
+        summary_path = export_results[1]
+        logging.info("Exported summary to %s", summary_path)
+
+        # 差分レポート（差分検知が有効な場合）
+        diff_report_path = export_results[2] if export_diff else None
+        if diff_report_path:
+            logging.info("Exported diff report to %s", diff_report_path)
+        
+        # PDFファイルとして出力（本文と差分レポートを並行して変換する）
+        pdf_converter = PdfConverter(config.output_dir)
+
+        async def _convert_pdfs():
+            tasks = [asyncio.to_thread(
+                pdf_converter.convert, markdown_path, title=f"{domain} - クロール結果"
+            )]
+            if diff_report_path:
+                tasks.append(asyncio.to_thread(
+                    pdf_converter.convert, diff_report_path, title=f"{domain} - 差分レポート"
+                ))
+            return await asyncio.gather(*tasks)
+
+        pdf_results = asyncio.run(_convert_pdfs())
+
+        pdf_path = pdf_results[0]
+        if pdf_path:
+            logging.info("Exported PDF to %s", pdf_path)
+
+        # 差分レポートのPDF（差分がある場合）
+        diff_report_pdf_path = pdf_results[1] if diff_report_path else None
+        if diff_report_pdf_path:
+            logging.info("Exported diff report PDF to %s", diff_report_pdf_path)
+                
+        # サイトマップを生成
+        try:
+            sitemap_path = generate_sitemap(repository, config.output_dir, domain)
+            logging.info("Generated sitemap at %s", sitemap_path)
+        except Exception as e:
+            logging.error("Failed to generate sitemap: %s", e)
+            sitemap_path = None
+        
+        # Discord通知
+        if notifier:
+            # 差分検知が有効かつ変更がある場合
+            if config.diff_detection and diff_data['has_changes']:
+                # 8MB超のファイルは添付せず、メッセージに注記を残す
+                attach_md, md_note = _gate_discord_attachment(diff_report_path)
+                attach_pdf, pdf_note = _gate_discord_attachment(diff_report_pdf_path or pdf_path)
+
+                parts = [CHANGES_TEMPLATE.format_map(summary)]
+                parts.extend(note for note in (md_note, pdf_note) if note)
+                message = "\n".join(parts)
+
+                # 差分レポートを添付（送信はバックグラウンドで行い、完了を待たない）
+                notifier.notify_async(
+                    message=message,
+                    title=TITLE_CHANGES.format(domain=domain),
+                    color=DISCORD_GREEN,
+                    markdown_path=attach_md,
+                    pdf_path=attach_pdf,
+                ).add_done_callback(_log_notify_result)
+            else:
+                # 変更がない場合または差分検知が無効の場合
+                # 8MB超のファイルは添付せず、メッセージに注記を残す
+                attach_md, md_note = _gate_discord_attachment(markdown_path)
+                attach_pdf, pdf_note = _gate_discord_attachment(pdf_path)
+
+                parts = [COMPLETION_TEMPLATE.format_map(summary)]
+                parts.extend(note for note in (md_note, pdf_note) if note)
+                message = "\n".join(parts)
+
+                notifier.notify_async(
+                    message=message,
+                    title=TITLE_COMPLETE.format(domain=domain),
+                    color=DISCORD_BLUE,
+                    markdown_path=attach_md,
+                    pdf_path=attach_pdf,
+                ).add_done_callback(_log_notify_result)
+
+        logging.info("処理が正常に完了しました")
+        
+        return markdown_path, pdf_path, diff_report_path
+        
+    except Exception:
+        # 短い要約だけを即時にログし、完全なトレースバックの整形は
+        # バックグラウンドへ回す（呼び出し側へ早く制御を返す）
+        exc_type, exc_val, exc_tb = sys.exc_info()
+        short_error = ''.join(traceback.format_exception_only(exc_type, exc_val)).strip()
+        logging.error("実行中にエラーが発生しました: %s", short_error)
+        _NOTIFY_POOL.submit(lambda: logging.error(
+            "Traceback:\n%s",
+            ''.join(traceback.format_exception(exc_type, exc_val, exc_tb))
+        ))
+
+        if notifier:
+            # エラー通知はデーモンスレッドで投げ、最大3秒だけ完了を待つ
+            # （Discord側の障害時でも呼び出し側へすぐ制御を返す）
+            notify_thread = threading.Thread(
+                target=_safe_notify_error,
+                args=(notifier.webhook_url, config.base_url, short_error),
+                daemon=True
+            )
+            notify_thread.start()
+            notify_thread.join(timeout=3.0)
         return None, None, None
\ No newline at end of file
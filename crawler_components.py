@@ -1,1655 +1,2185 @@
-"""
-再利用可能なWebクローラーコンポーネント
-- 非同期サポート追加
-- エラーハンドリング強化
-- パフォーマンス最適化
-"""
-
-import os
-import re
-import time
-import json
-import hashlib
-import logging
-import sqlite3
-import asyncio
-import requests
-import html2text
-import markdown
-from urllib.parse import urlparse, urljoin, parse_qs, urlencode
-from typing import Set, Dict, List, Optional, Tuple, Any, Union, Callable
-from datetime import datetime
-import difflib
-import lxml.html
-from concurrent.futures import ThreadPoolExecutor
-from dataclasses import dataclass, field
-from contextlib import contextmanager
-
-# 見出し修正ユーティリティをインポート
-from heading_fixer import fix_concatenated_headings
-
-
-# 設定クラス
-@dataclass
-class CrawlerConfig:
-    """クローラーの設定を管理するクラス"""
-    base_url: str
-    max_pages: int = 100
-    delay: float = 1.0
-    user_agent: str = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    timeout: int = 10
-    max_retries: int = 3
-    max_workers: int = 5  # 並列実行用のワーカー数
-    output_dir: str = "output"
-    cache_dir: str = "cache"
-    discord_webhook: Optional[str] = None
-    diff_detection: bool = True
-    skip_no_changes: bool = True
-    normalize_urls: bool = True  # URL正規化の有効化
-    respect_robots_txt: bool = True  # robots.txtの尊重
-    follow_redirects: bool = True  # リダイレクトの追跡
-    static_extensions: Set[str] = field(default_factory=lambda: {
-        '.jpg', '.jpeg', '.png', '.gif', '.svg', '.css',
-        '.js', '.pdf', '.zip', '.tar', '.gz', '.mp3',
-        '.mp4', '.avi', '.mov', '.webm', '.webp', '.ico'
-    })
-    
-    @classmethod
-    def from_dict(cls, config_dict: Dict[str, Any]) -> 'CrawlerConfig':
-        """辞書から設定オブジェクトを作成する"""
-        return cls(**{k: v for k, v in config_dict.items() if k in cls.__annotations__})
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """設定を辞書に変換する"""
-        return {k: v for k, v in self.__dict__.items()}
-    
-    @classmethod
-    def from_json(cls, json_path: str) -> 'CrawlerConfig':
-        """JSONファイルから設定オブジェクトを作成する"""
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                config_dict = json.load(f)
-            return cls.from_dict(config_dict)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logging.error(f"設定ファイルの読み込みに失敗しました: {e}")
-            raise
-
-
-class UrlFilter:
-    """URLをフィルタリングして、同一ドメイン内のURLのみを許可するコンポーネント（改善版）"""
-    
-    def __init__(self, config: CrawlerConfig):
-        """
-        URLフィルタークラスの初期化
-        
-        Args:
-            config: クローラーの設定
-        """
-        self.base_url = config.base_url
-        self.base_domain = urlparse(config.base_url).netloc
-        self.static_extensions = config.static_extensions
-        self.normalize_urls = config.normalize_urls
-        
-        # 除外パターンの正規表現（オプション）
-        self.exclude_patterns = [
-            r'\/(?:calendar|login|logout|signup|register|password-reset)(?:\/|$)',
-            r'\/feed(?:\/|$)',
-            r'\/wp-admin(?:\/|$)',
-            r'\/wp-content\/(?:cache|uploads)(?:\/|$)',
-            r'\/cart(?:\/|$)',
-            r'\/checkout(?:\/|$)',
-            r'\/my-account(?:\/|$)',
-        ]
-        self.exclude_regex = re.compile('|'.join(self.exclude_patterns))
-    
-    def normalize_url(self, url: str) -> str:
-        """URLを正規化する（相対URLを絶対URLに変換、フラグメントの削除等）"""
-        # 相対URLを絶対URLに変換
-        normalized_url = urljoin(self.base_url, url)
-        
-        # フラグメント (#) を削除
-        normalized_url = normalized_url.split('#')[0]
-        
-        if self.normalize_urls:
-            # クエリパラメータを正規化（オプション）
-            parsed = urlparse(normalized_url)
-            if parsed.query:
-                # クエリパラメータを正規化：アルファベット順にソート
-                params = parse_qs(parsed.query)
-                # UTM系パラメータなど、特定のトラッキングパラメータを除外
-                for param in list(params.keys()):
-                    if param.startswith('utm_') or param in ['fbclid', 'gclid', 'ref']:
-                        del params[param]
-                # クエリを再構築
-                normalized_query = urlencode(params, doseq=True)
-                # URLを再構築
-                normalized_url = parsed._replace(query=normalized_query).geturl()
-            
-        # トレーリングスラッシュを統一
-        if normalized_url.endswith('/'):
-            normalized_url = normalized_url[:-1]
-            
-        return normalized_url
-    
-    def should_crawl(self, url: str) -> bool:
-        """URLがクロール対象かどうかを判定する"""
-        # 空のURLはクロールしない
-        if not url:
-            return False
-        
-        # URLを正規化
-        url = self.normalize_url(url)
-        
-        # URLのドメインを取得
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        
-        # 同一ドメインでない場合はクロールしない
-        if domain != self.base_domain:
-            return False
-        
-        # 静的ファイルはクロールしない
-        path = parsed_url.path.lower()
-        if any(path.endswith(ext) for ext in self.static_extensions):
-            return False
-        
-        # メールアドレスリンクはクロールしない
-        if url.startswith('mailto:'):
-            return False
-        
-        # 電話番号リンクはクロールしない
-        if url.startswith('tel:'):
-            return False
-        
-        # 除外パターンに該当するURLはクロールしない
-        if self.exclude_regex.search(parsed_url.path):
-            return False
-            
-        return True
-
-
-class Fetcher:
-    """指定されたURLからHTMLコンテンツを取得するコンポーネント（改善版）"""
-    
-    def __init__(self, config: CrawlerConfig):
-        self.delay = config.delay
-        self.max_retries = config.max_retries
-        self.timeout = config.timeout
-        self.follow_redirects = config.follow_redirects
-        self.last_request_time = 0
-        
-        # ユーザーエージェントをより多様化
-        self.headers = {
-            'User-Agent': config.user_agent,
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',  # 圧縮対応
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Cache-Control': 'max-age=0'
-        }
-        
-        # ドメインごとのリクエスト制限を追跡するための辞書
-        self.domain_last_request = {}
-        
-        # セッションオブジェクトの作成（接続の再利用によるパフォーマンス向上）
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        
-    def __del__(self):
-        """クリーンアップ処理"""
-        try:
-            if hasattr(self, 'session') and self.session:
-                self.session.close()
-        except Exception:
-            pass
-        
-    def _wait_for_rate_limit(self, domain: str):
-        """ドメインごとのレート制限を適用する"""
-        current_time = time.time()
-        
-        # ドメイン固有の最終リクエスト時間を取得
-        domain_last_time = self.domain_last_request.get(domain, 0)
-        
-        # グローバルな最終リクエスト時間との間で長い方を取得
-        last_time = max(self.last_request_time, domain_last_time)
-        
-        elapsed = current_time - last_time
-        if elapsed < self.delay:
-            time.sleep(self.delay - elapsed)
-            
-        # 最終リクエスト時間を更新
-        current_time = time.time()
-        self.last_request_time = current_time
-        self.domain_last_request[domain] = current_time
-        
-    async def fetch_async(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Tuple[Optional[str], Dict[str, str]]:
-        """URLからHTMLコンテンツを非同期で取得する"""
-        # 非同期実行のためのラッパー
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: self.fetch(url, etag, last_modified))
-        
-    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Tuple[Optional[str], Dict[str, str]]:
-        """URLからHTMLコンテンツを取得する"""
-        # ドメインを抽出してレート制限を適用
-        domain = urlparse(url).netloc
-        self._wait_for_rate_limit(domain)
-        
-        # 条件付きリクエスト用ヘッダーを準備
-        headers = {}
-        if etag:
-            headers['If-None-Match'] = etag
-        if last_modified:
-            headers['If-Modified-Since'] = last_modified
-            
-        retries = 0
-        retry_delay = self.delay
-        
-        while retries <= self.max_retries:
-            try:
-                response = self.session.get(
-                    url, 
-                    headers=headers, 
-                    timeout=self.timeout,
-                    allow_redirects=self.follow_redirects
-                )
-                
-                # ステータスコードに基づく処理
-                if response.status_code == 304:  # Not Modified
-                    logging.info(f"Content not modified: {url}")
-                    return None, {
-                        'etag': etag,
-                        'last_modified': last_modified,
-                        'status_code': 304
-                    }
-                
-                elif response.status_code == 429:  # Too Many Requests
-                    # レート制限に引っかかった場合、遅延を増加させる
-                    retry_after = int(response.headers.get('Retry-After', retry_delay * 2))
-                    logging.warning(f"Rate limited: {url}. Retrying after {retry_after} seconds.")
-                    time.sleep(retry_after)
-                    retries += 1
-                    continue
-                    
-                elif response.status_code >= 400:  # エラーコード
-                    if response.status_code == 404:
-                        logging.warning(f"Page not found: {url}")
-                        return None, {'status_code': 404, 'error': 'Not Found'}
-                        
-                    logging.warning(f"Failed to fetch {url}: status code {response.status_code}")
-                    if retries < self.max_retries:
-                        retries += 1
-                        time.sleep(retry_delay * (2 ** retries))  # 指数バックオフ
-                        continue
-                    return None, {'status_code': response.status_code, 'error': f'HTTP error: {response.status_code}'}
-                
-                # content-typeがHTMLでない場合はスキップ
-                content_type = response.headers.get('Content-Type', '')
-                if 'text/html' not in content_type.lower():
-                    logging.info(f"Skipping non-HTML content: {url}, Content-Type: {content_type}")
-                    return None, {'status_code': response.status_code, 'content_type': content_type}
-                
-                # ヘッダー情報を取得
-                headers_info = {
-                    'etag': response.headers.get('ETag'),
-                    'last_modified': response.headers.get('Last-Modified'),
-                    'content_type': content_type,
-                    'status_code': response.status_code,
-                    'encoding': response.encoding
-                }
-                
-                # テキストエンコーディングの処理を改善
-                if response.encoding is None:
-                    # エンコーディングの自動検出
-                    response.encoding = response.apparent_encoding
-                
-                try:
-                    return response.text, headers_info
-                except UnicodeDecodeError as e:
-                    logging.error(f"Unicode decode error for {url}: {e}")
-                    # フォールバックとしてバイナリからUTF-8でデコード
-                    return response.content.decode('utf-8', errors='replace'), headers_info
-                
-            except requests.exceptions.Timeout as e:
-                logging.warning(f"Timeout for {url}: {e}")
-                retries += 1
-                if retries <= self.max_retries:
-                    time.sleep(retry_delay * (2 ** retries))
-                else:
-                    return None, {'status_code': 0, 'error': f'Timeout: {str(e)}'}
-                
-            except requests.exceptions.TooManyRedirects as e:
-                logging.error(f"Too many redirects for {url}: {e}")
-                return None, {'status_code': 0, 'error': f'Too many redirects: {str(e)}'}
-                
-            except requests.RequestException as e:
-                logging.error(f"Error fetching {url}: {e}")
-                retries += 1
-                if retries <= self.max_retries:
-                    time.sleep(retry_delay * (2 ** retries))
-                else:
-                    return None, {'status_code': 0, 'error': str(e)}
-        
-        return None, {'status_code': 0, 'error': 'Max retries exceeded'}
-
-
-class Parser:
-    """HTMLコンテンツを解析し、コンテンツとリンクを抽出するコンポーネント（改善版）"""
-    
-    def __init__(self, url_filter: UrlFilter):
-        self.url_filter = url_filter
-        
-        # メインコンテンツを特定するためのセレクタ（優先順）
-        self.content_selectors = [
-            '//main', '//article', 
-            '//div[@id="content"]', '//div[@class="content"]',
-            '//div[@id="main"]', '//div[@class="main"]',
-            '//div[contains(@class, "post-content")]', '//div[contains(@class, "entry-content")]',
-            '//div[@role="main"]'
-        ]
-        
-        # 不要な要素を除外するセレクタ
-        self.exclude_selectors = [
-            '//header', '//footer', '//nav', 
-            '//aside', '//div[contains(@class, "sidebar")]',
-            '//div[contains(@class, "advertisement")]', '//div[contains(@class, "ad-")]',
-            '//script', '//style', '//iframe', '//noscript',
-            '//div[contains(@class, "comment")]'
-        ]
-    
-    def parse(self, html: str, url: str) -> Tuple[Dict, List[str]]:
-        """HTMLからコンテンツとリンクを抽出する"""
-        try:
-            # lxmlを使用してHTMLを解析
-            doc = lxml.html.fromstring(html)
-            doc.make_links_absolute(url)  # 相対リンクを絶対URLに変換
-            
-            # タイトルを抽出
-            title_elem = doc.xpath('//title')
-            title = title_elem[0].text_content().strip() if title_elem else "No Title"
-            
-            # ページのメタ情報を抽出
-            meta_description = ""
-            meta_elems = doc.xpath('//meta[@name="description"]')
-            if meta_elems:
-                meta_description = meta_elems[0].get('content', '')
-            
-            # メインコンテンツを抽出
-            content_elem = None
-            for selector in self.content_selectors:
-                elements = doc.xpath(selector)
-                if elements:
-                    content_elem = elements[0]
-                    break
-            
-            # メインコンテンツが見つからない場合はbody全体を使用
-            if not content_elem:
-                body_elem = doc.xpath('//body')
-                content_elem = body_elem[0] if body_elem else doc
-            
-            # 不要な要素を除外（コピーを作成して処理）
-            content_elem_copy = copy_element(content_elem)
-            for selector in self.exclude_selectors:
-                for element in content_elem_copy.xpath(selector):
-                    parent = element.getparent()
-                    if parent is not None:  # 親がある場合のみ削除
-                        parent.remove(element)
-            
-            # HTMLコンテンツを取得
-            html_content = lxml.html.tostring(content_elem_copy, encoding='unicode')
-            
-            # リンクを抽出
-            links = []
-            for a_tag in doc.xpath('//a[@href]'):
-                href = a_tag.get('href')
-                if self.url_filter.should_crawl(href):
-                    normalized_url = self.url_filter.normalize_url(href)
-                    links.append(normalized_url)
-            
-            # ページ情報の辞書を作成（拡張版）
-            page_data = {
-                'url': url,
-                'title': title,
-                'meta_description': meta_description,
-                'html_content': html_content,
-                'fetch_time': datetime.now().isoformat(),
-            }
-            
-            return page_data, links
-            
-        except Exception as e:
-            logging.error(f"Error parsing HTML from {url}: {e}")
-            # エラー時は空のデータと空のリンクリストを返す
-            return {'url': url, 'title': 'Error', 'html_content': ''}, []
-
-
-def copy_element(element):
-    """lxml要素のディープコピーを作成する（直接deepcopyが使えないため）"""
-    return lxml.html.fromstring(lxml.html.tostring(element, encoding='unicode'))
-
-
-class MarkdownConverter:
-    """HTMLコンテンツをMarkdown形式に変換するコンポーネント（改善版）"""
-
-    def __init__(self, config: Optional[Dict] = None):
-        self.converter = html2text.HTML2Text()
-        self.converter.ignore_links = False
-        self.converter.ignore_images = False
-        self.converter.ignore_tables = False
-        self.converter.body_width = 0  # 行の折り返しを無効化
-        self.converter.unicode_snob = True  # Unicode文字を維持
-        self.converter.single_line_break = True  # 単一の改行を維持
-        self.converter.wrap_links = False  # リンクを折り返さない
-        self.converter.emphasis_mark = '*'  # 強調のマークとして*を使用
-        self.converter.skip_internal_links = True  # アンカーリンクをスキップ
-
-        # オプション設定を適用
-        if config:
-            for key, value in config.items():
-                if hasattr(self.converter, key):
-                    setattr(self.converter, key, value)
-
-    def convert(self, page_data: Dict) -> Dict:
-        """HTMLをMarkdownに変換する"""
-        title = page_data['title']
-        html_content = page_data['html_content']
-        url = page_data['url']
-        meta_description = page_data.get('meta_description', '')
-
-        # HTMLの前処理（不要な要素や属性の削除）
-        html_content = self._preprocess_html(html_content)
-
-        # HTMLをMarkdownに変換
-        try:
-            markdown_content = self.converter.handle(html_content)
-
-            # 画像パスを修正（相対パスがある場合）
-            markdown_content = self._fix_image_paths(markdown_content, url)
-
-            # 変換後の後処理
-            markdown_content = self._postprocess_markdown(markdown_content)
-
-        except Exception as e:
-            logging.error(f"Markdown conversion error for {url}: {e}")
-            markdown_content = f"コンテンツの変換中にエラーが発生しました: {str(e)}"
-
-        # Markdownタイトルを作成
-        markdown_title = f"# {title}\n\n"
-
-        # メタ説明を追加（あれば）
-        meta_section = f"*{meta_description}*\n\n" if meta_description else ""
-
-        # URL情報を追加
-        url_info = f"*出典: {url}*\n\n"
-
-        # 最終的なMarkdownコンテンツを組み立て
-        full_markdown = markdown_title + meta_section + url_info + markdown_content
-
-        # 結果を返す
-        result = page_data.copy()
-        result['markdown_content'] = full_markdown
-
-        return result
-
-    def _preprocess_html(self, html_content: str) -> str:
-        """HTMLの前処理を行う"""
-        try:
-            # lxmlを使用してHTMLを解析
-            doc = lxml.html.fromstring(html_content)
-
-            # すべての特殊文字パターンを定義（より網羅的に）
-            special_chars = ['ðï', 'ðï¸', 'â', '\xa0', '\u2028', '\u2029']
-            emoji_pattern = re.compile(
-                "["
-                "\U0001F600-\U0001F64F"  # 絵文字
-                "\U0001F300-\U0001F5FF"  # シンボル
-                "\U0001F680-\U0001F6FF"  # 乗り物とマップ記号
-                "\U0001F700-\U0001F77F"  # 顔文字
-                "\U0001F780-\U0001F7FF"  # 絵文字の追加
-                "\U0001F800-\U0001F8FF"  # 絵文字の追加
-                "\U0001F900-\U0001F9FF"  # 絵文字の追加
-                "\U0001FA00-\U0001FA6F"  # 絵文字の追加
-                "\U0001FA70-\U0001FAFF"  # 絵文字の追加
-                "\U00002702-\U000027B0"  # その他のシンボル
-                "\U000024C2-\U0001F251"
-                "]+", flags=re.UNICODE
-            )
-
-            # 「Direct link to」などの不要なテキストを含むa要素を修正
-            for a_elem in doc.xpath('//a[contains(text(), "Direct link to")]'):
-                # テキストを空にする
-                a_elem.text = ""
-
-            # スペーシング修正：見出し内の不要なスペースを調整
-            for h in doc.xpath('//h1 | //h2 | //h3 | //h4 | //h5 | //h6'):
-                if h.text:
-                    # 連続スペースを1つに置換
-                    h.text = re.sub(r'\s+', ' ', h.text).strip()
-
-                    # 絵文字や特殊文字を削除
-                    h.text = emoji_pattern.sub('', h.text)
-                    for char in special_chars:
-                        h.text = h.text.replace(char, '')
-
-            # 見出し要素内のaタグを特別処理（見出しリンクを確実に処理）
-            for a in doc.xpath('//h1//a | //h2//a | //h3//a | //h4//a | //h5//a | //h6//a'):
-                if a.text:
-                    # 特殊文字を削除しつつスペースを調整
-                    a.text = re.sub(r'\s+', ' ', a.text).strip()
-                    a.text = emoji_pattern.sub('', a.text)
-                    for char in special_chars:
-                        a.text = a.text.replace(char, '')
-
-            # ドキュメント全体の特殊文字を処理 - 強化版
-            # 特に見出し要素を優先して処理
-            for h in doc.xpath('//h1 | //h2 | //h3 | //h4 | //h5 | //h6'):
-                # 見出し内のすべてのテキストを徹底的にチェック
-                if h.text:
-                    # 絵文字と特殊文字をすべて削除
-                    h.text = emoji_pattern.sub('', h.text)
-                    # 特定の特殊文字を明示的に削除
-                    h.text = h.text.replace('ðï', '').replace('ðï¸', '')
-                    # その他の特殊文字
-                    for char in special_chars:
-                        h.text = h.text.replace(char, '')
-
-                # 見出し内のすべての子要素も徹底的にチェック
-                for child in h.xpath('.//*'):
-                    if child.text:
-                        child.text = emoji_pattern.sub('', child.text)
-                        child.text = child.text.replace('ðï', '').replace('ðï¸', '')
-                        for char in special_chars:
-                            child.text = child.text.replace(char, '')
-
-            # ドキュメント全体の特殊文字を処理（残りの要素）
-            for elem in doc.xpath('//*'):
-                # テキストノードをチェック
-                if elem.text:
-                    # 絵文字を削除
-                    elem.text = emoji_pattern.sub('', elem.text)
-                    # 特殊文字を削除
-                    elem.text = elem.text.replace('ðï', '').replace('ðï¸', '')
-                    for char in special_chars:
-                        elem.text = elem.text.replace(char, '')
-
-                # テイルテキストもチェック
-                if elem.tail:
-                    elem.tail = emoji_pattern.sub('', elem.tail)
-                    elem.tail = elem.tail.replace('ðï', '').replace('ðï¸', '')
-                    for char in special_chars:
-                        elem.tail = elem.tail.replace(char, '')
-
-            # カテゴリページのフォーマットを修正（h2内の絵文字などを削除）
-            for h2 in doc.xpath('//h2'):
-                # スペースの後の数字（items）などが含まれている場合は削除
-                if h2.text and re.search(r'\d+\s*items', h2.text):
-                    h2.text = re.sub(r'\d+\s*items', '', h2.text)
-
-            # テーブル整形の改善
-            for table in doc.xpath('//table'):
-                # Markdownでの表組み変換を改善するためのクラスを追加
-                table.attrib['class'] = 'markdown-table'
-
-                # テーブルのセルを整形
-                for cell in table.xpath('.//th | .//td'):
-                    if cell.text:
-                        cell.text = cell.text.strip()
-                        cell.text = emoji_pattern.sub('', cell.text)
-                        for char in special_chars:
-                            cell.text = cell.text.replace(char, '')
-
-            # コードブロックの整形
-            for code in doc.xpath('//pre/code | //code'):
-                # コードブロック内のHTML実体参照を保持しておく
-                if code.text:
-                    # インデントと空白を保持しながら特殊文字のみ削除
-                    code.text = emoji_pattern.sub('', code.text)
-                    for char in special_chars:
-                        code.text = code.text.replace(char, '')
-
-            # 属性値も処理
-            for elem in doc.xpath('//*[@*]'):  # 属性を持つすべての要素
-                for attr_name in elem.attrib:
-                    if isinstance(elem.attrib[attr_name], str):
-                        # 特殊文字を削除
-                        elem.attrib[attr_name] = emoji_pattern.sub('', elem.attrib[attr_name])
-                        for char in special_chars:
-                            elem.attrib[attr_name] = elem.attrib[attr_name].replace(char, '')
-
-            # 最終的なセーフティネット - 不要な文字を削除
-            for elem in doc.xpath('//*'):
-                # テキストをUnicode正規化
-                if hasattr(elem, 'text') and elem.text:
-                    # 不要な特殊文字を削除
-                    elem.text = re.sub(r'[^\x00-\x7F\u0080-\u00FF\u0100-\u017F\u0180-\u024F\u0370-\u03FF\u0400-\u04FF\s\.,;:!?\-_\'\"\/\\\[\]\(\)\{\}\+\*\&\^\%\$\#\@<>=~`|]', '', elem.text)
-
-                if hasattr(elem, 'tail') and elem.tail:
-                    elem.tail = re.sub(r'[^\x00-\x7F\u0080-\u00FF\u0100-\u017F\u0180-\u024F\u0370-\u03FF\u0400-\u04FF\s\.,;:!?\-_\'\"\/\\\[\]\(\)\{\}\+\*\&\^\%\$\#\@<>=~`|]', '', elem.tail)
-
-            # HTML文字列に戻す
-            html_cleaned = lxml.html.tostring(doc, encoding='unicode')
-
-            # 最終的なセーフティネット：直接文字列置換で残っている可能性のある特殊文字を削除
-            for char in special_chars:
-                html_cleaned = html_cleaned.replace(char, '')
-
-            # 複数の連続改行を整理
-            html_cleaned = re.sub(r'\n{3,}', '\n\n', html_cleaned)
-
-            return html_cleaned
-        except Exception as e:
-            logging.warning(f"HTML preprocessing error: {e}")
-            # エラーが発生した場合は元のHTMLを返す
-            return html_content
-
-    def _postprocess_markdown(self, markdown_content: str) -> str:
-        """Markdown変換後の後処理を行う"""
-        # 処理順序を最適化 - 最初にダブルダッシュを処理
-        markdown_content = re.sub(r'\n--\n', '\n\n', markdown_content)
-
-        # 特殊文字を先に削除
-        markdown_content = markdown_content.replace('â', '')
-        markdown_content = markdown_content.replace('ðï¸', '')
-        markdown_content = markdown_content.replace('ðï', '')
-
-        # 「Direct link to」などの不要なテキストを削除
-        markdown_content = re.sub(r'\[â\]\([^)]+\s+"Direct link to [^"]+"\)', '', markdown_content)
-        markdown_content = re.sub(r'\[\]\([^)]+\s+"Direct link to [^"]+"\)', '', markdown_content)
-        markdown_content = re.sub(r'\[[^\]]*\]\([^)]+\s+"Direct link to [^"]+"\)', '', markdown_content)
-
-        # 見出し修正を優先的に先に処理 (重要: 他の変換の前に行う)
-        # 複数行にまたがる見出しを一行に結合
-        # 例: ## [
-        # Text] -> ## [Text]
-        for _ in range(3):
-            # 見出しタグの後の改行を修正
-            markdown_content = re.sub(r'(#{1,6})\s*\n\s*', r'\1 ', markdown_content)
-
-            # 見出しのリンク開始括弧内の改行を修正
-            markdown_content = re.sub(r'(#{1,6}\s*)\[\s*\n\s*', r'\1[', markdown_content)
-
-            # 見出しのリンクテキスト内の改行を修正
-            markdown_content = re.sub(r'(\[\s*[^\n\]]*)\n\s*([^\]]*\])', r'\1 \2', markdown_content)
-
-            # 見出しのリンク全体の途中改行を修正
-            markdown_content = re.sub(r'(#{1,6}\s+\[[^\]]+\])\s*\n\s*(\([^)]+\))', r'\1\2', markdown_content)
-
-            # 見出し全体が複数行に分かれている場合を修正
-            markdown_content = re.sub(r'(#{1,6}\s+[A-Za-z][^\n]*)\s*\n\s*([A-Za-z][^\n]*)', r'\1 \2', markdown_content)
-
-            # リンクテキストとURL間の改行を修正（例: [Search for PositionsAPI URL: /api/Position/search\nOpen](https://...)）
-            markdown_content = re.sub(r'(\[(?:[^\[\]]|\[[^\[\]]*\])*?)\n\s*([^\]]*?\]\([^)]+\))', r'\1 \2', markdown_content)
-
-            # リンクのURL部分が改行されている場合も修正
-            markdown_content = re.sub(r'(\]\()([^)\n]*)\n\s*([^)]*\))', r'\1\2\3', markdown_content)
-
-        # カテゴリページの見出しフォーマットを改善（特殊文字を削除しつつ）
-        markdown_content = re.sub(r'##\s*\[(ðï¸\s*)?([^\]]*?)(\s*\d+\s*items)?\]\(([^)]+)\)', r'## [\2](\4)', markdown_content)
-
-        # 見出し内のスペース調整
-        markdown_content = re.sub(r'(#{1,6})\s*\[ ', r'\1 [', markdown_content)
-
-        # マークダウンリンク内の特殊文字のみを置換
-        markdown_content = re.sub(r'\[ðï¸\s*([^\]]*?)(\s*\d+\s*items)?\]', r'[\1]', markdown_content)
-
-        # 見出し行内の特殊文字を削除（すべての見出しレベルに対応） - より強力なパターン
-        # 複数のパターンを試して確実に削除
-        for _ in range(2):  # 複数回適用して確実に削除
-            # パターン1: 見出し + [ðï¸? + テキスト] + (URL)
-            markdown_content = re.sub(r'(#{1,6})\s+\[(ðï¸?\s*)?([^\]]*?)\](\([^)]+\))', r'\1 [\3]\4', markdown_content)
-
-            # パターン2: 見出し + [ðï + テキスト] + (URL)
-            markdown_content = re.sub(r'(#{1,6})\s*\[ðï\s*([^\]]*)\]\(([^)]+)\)', r'\1 [\2](\3)', markdown_content)
-
-            # パターン3: 見出し + [ðï¸ + テキスト] + (URL)
-            markdown_content = re.sub(r'(#{1,6})\s*\[ðï¸\s*([^\]]*)\]\(([^)]+)\)', r'\1 [\2](\3)', markdown_content)
-
-            # すべての見出し内のリンクテキスト内にある特殊文字を強制的に削除
-            markdown_content = re.sub(r'(#{1,6}\s+\[)([^\]]*?)(ðï¸?)([^\]]*?)(\]\([^)]+\))', r'\1\2\4\5', markdown_content)
-            markdown_content = re.sub(r'(#{1,6}\s+\[)([^\]]*?)(ðï)([^\]]*?)(\]\([^)]+\))', r'\1\2\4\5', markdown_content)
-
-        # 任意のリンクパターンの修正 - 特に見出し以外の場所にある分割されたリンク
-        # 例: [Search    for    PositionsAPI    URL:    /api/Position/search\n Open](...) のような場合
-        markdown_content = re.sub(r'\[([^\]]*?)\n\s*([^\]]*?)\](\([^)]+\))', r'[\1 \2]\3', markdown_content)
-
-        # 複数の連続スペースをひとつに修正（リンク内での整形）
-        markdown_content = re.sub(r'\[([^\]]*?)\s{2,}([^\]]*?)\]', r'[\1 \2]', markdown_content)
-
-        # リンク全体を包括的に処理する - 改善版アルゴリズム
-        # リンクパターン検出
-        link_pattern = re.compile(r'\[([^\]]*?)\]\(([^)]*?)\)')
-
-        def fix_link(match):
-            # リンクテキスト内の処理
-            link_text = match.group(1)
-            url = match.group(2)
-
-            # 1. リンクテキスト内の改行を修正
-            link_text = re.sub(r'\s*\n\s*', ' ', link_text)
-
-            # 2. リンクテキスト内の複数スペースを単一スペースに
-            link_text = re.sub(r'\s+', ' ', link_text).strip()
-
-            # 3. APIエンドポイントパス内のスペースを削除
-            # "/api/Path/ search" → "/api/Path/search" だが、"search Open" はそのまま
-            if '/api/' in link_text or '/v1/' in link_text:
-                # API パスのパターンを検出してスペースを削除
-                link_text = re.sub(r'(\/[a-zA-Z0-9\/-]+\/)\s+([a-zA-Z0-9-]+)', r'\1\2', link_text)
-
-            # 4. URL内のすべてのスペースと改行コードを削除
-            # URL部分の改行コードやエンコード済み改行コードを削除
-            url = re.sub(r'\s+', '', url)
-            url = url.replace('%0A', '')  # エンコードされた改行も削除
-            url = url.replace('%20', '')  # エンコードされたスペースも削除
-
-            return f"[{link_text}]({url})"
-
-        # すべてのリンクを処理
-        markdown_content = link_pattern.sub(fix_link, markdown_content)
-
-        # リンク後の説明文を適切に区切る処理（改良版）
-        # URL直後に続く説明文があれば改行して区切る
-        markdown_content = re.sub(r'(\]\([^)]+\))([\w])', r'\1\n\2', markdown_content)
-
-        # 見出し + URL + 説明文のパターンをより強固に処理
-        heading_desc_pattern = r'(#{1,6}\s+\[[^\]]+\]\([^)]+\))\s+([A-Z][a-z])'
-        while re.search(heading_desc_pattern, markdown_content):
-            markdown_content = re.sub(heading_desc_pattern, r'\1\n\n\2', markdown_content)
-
-        # カテゴリページの説明文が見出しとリンクされている場合、適切に分離
-        category_desc_pattern = r'(#{1,6}\s*\[[^\]]+\]\([^)]+\))([A-Za-z])'
-        while re.search(category_desc_pattern, markdown_content):
-            markdown_content = re.sub(category_desc_pattern, r'\1\n\2', markdown_content)
-
-        # 見出し連結パターンを検出して修正
-        # ## [何か](URL)## [別の何か] を ## [何か](URL)\n\n## [別の何か] に変換
-        concatenated_pattern = r'(#{1,6}\s*\[[^\]]+\]\([^)]+\))(#{1,6}\s*\[)'
-        markdown_content = re.sub(concatenated_pattern, r'\1\n\n\2', markdown_content)
-
-        # リンク付き見出し同士が連続している場合
-        dup_pattern = r'(#{1,6}\s*\[[^\]]+\])\(([^)]+)\)(#{1,6}\s*\[)'
-        markdown_content = re.sub(dup_pattern, r'\1(\2)\n\n\3', markdown_content)
-
-        # 異なるレベルの見出し連結を処理
-        # ### 見出し## [別の見出し] を ### 見出し\n\n## [別の見出し] に変換
-        level_mix_pattern = r'(#{1,6}[^\n\#]{1,50})(#{1,6}\s*\[)'
-        markdown_content = re.sub(level_mix_pattern, r'\1\n\n\2', markdown_content)
-
-        # 空白を含む連結見出しを処理
-        # ## [何か](URL)    ## [別の何か] を ## [何か](URL)\n\n## [別の何か] に変換
-        spaced_pattern = r'(#{1,6}\s*\[[^\]]+\]\([^)]+\))\s{2,}(#{1,6})'
-        markdown_content = re.sub(spaced_pattern, r'\1\n\n\2', markdown_content)
-
-        # 見出し後の閉じない括弧のパターン
-        # ## [何か](https://example  ## [次] → ## [何か](https://example)\n\n## [次]
-        broken_pattern = r'(#{1,6}\s*\[[^\]]+\]\([^)#\n]{5,})\s+(#{1,6}\s*\[)'
-        markdown_content = re.sub(broken_pattern, r'\1)\n\n\2', markdown_content)
-
-        # 最終段階: 3つ以上の連続改行を2つに整理
-        markdown_content = re.sub(r'\n{3,}', '\n\n', markdown_content)
-
-        # 連続する空白を1つに
-        markdown_content = re.sub(r' {2,}', ' ', markdown_content)
-
-        # リスト項目の間隔を最適化
-        markdown_content = re.sub(r'(\* .*)\n\n(?=\* )', r'\1\n', markdown_content)
-        markdown_content = re.sub(r'(\]\([^)]+\))\n\n(\*)', r'\1\n\2', markdown_content)
-
-        # 見出しの後ろに不要な## マークが残っている場合は削除
-        markdown_content = re.sub(r'##\s*$', '', markdown_content)
-
-        # テーブル内の特殊文字も削除
-        markdown_content = re.sub(r'\|(.*?)ðï¸(.*?)\|', r'|\1\2|', markdown_content)
-        markdown_content = re.sub(r'\|(.*?)ðï(.*?)\|', r'|\1\2|', markdown_content)
-
-        # 表組みの整形を改善
-        markdown_content = self._improve_tables(markdown_content)
-
-        # JSONやコードブロックを整形
-        markdown_content = self._format_code_blocks(markdown_content)
-
-        # 見出しの前後に適切な改行を追加して読みやすくする
-        markdown_content = re.sub(r'\n(#{1,6}\s+[^\n]+)\n', r'\n\1\n\n', markdown_content)
-
-        # 複数見出しの間の余分な改行を修正（最大2行まで）
-        markdown_content = re.sub(r'(#{1,6}[^\n]+)\n\n\n+(#{1,6})', r'\1\n\n\2', markdown_content)
-
-        # 残っている特殊文字を最終的に削除（セーフティネット）- 強化版
-        # 特殊文字を直接削除
-        markdown_content = markdown_content.replace('ðï¸', '')
-        markdown_content = markdown_content.replace('ðï', '')
-
-        # 見出し行をすべて抽出して特殊文字を除去（最終的な手段）- 徹底的に除去
-        lines = markdown_content.splitlines()
-        for i, line in enumerate(lines):
-            # 見出し行を対象に
-            if line.startswith('#'):
-                # 最も問題の多い特殊文字パターンを直接削除（様々なバリエーションに対応）
-                lines[i] = line.replace('ðï¸', '').replace('ðï', '')
-
-                # 正規表現でも削除してバックアップ（Unicode対応）
-                lines[i] = re.sub(r'ð[ï]?[¸]?', '', lines[i])
-
-                # 特殊な見出しパターンを修正（例: ## [ðï¸ Account] → ## [Account]）
-                lines[i] = re.sub(r'(#{1,6})\s*\[\s*ðï¸?\s*([^\]]+)\]', r'\1 [\2]', lines[i])
-
-                # 特殊文字で始まるリンクテキストの修正
-                if '[ð' in lines[i]:
-                    lines[i] = re.sub(r'\[ð[ï]?[¸]?\s*([^\]]+)\]', r'[\1]', lines[i])
-
-        # 処理後の行を結合
-        markdown_content = '\n'.join(lines)
-
-        # 最後のセーフティネット - 特殊文字を含む見出しの修正
-        # すべての見出し+リンクパターンを検索して特殊文字を削除
-        markdown_content = re.sub(r'(#{1,6}\s+)\[(ð[ï]?[¸]?\s*)?([^\]]*?)\](\([^)]+\))', r'\1[\3]\4', markdown_content)
-
-        # コンテンツの区切りを明確にする（見出し間の区切り）
-        markdown_content = re.sub(r'(#{2,4}\s+[^\n]+)\n([^#\n])', r'\1\n\n\2', markdown_content)
-
-        # 非ASCII文字を確実に処理
-        try:
-            # まずはヘッダーや重要なセクションを保持する方法を試す
-            clean_content = ''
-            for line in markdown_content.splitlines():
-                # 見出し行やその他の重要なパターンは特別に処理
-                if re.match(r'^#{1,6}\s+', line):
-                    # 見出し行内の特殊文字に絞って徹底的に削除
-                    # 最初にðï¸パターンを直接削除（最重要の問題文字）
-                    line = line.replace('ðï¸', '').replace('ðï', '')
-
-                    # 特殊な見出しパターンを修正
-                    line = re.sub(r'(#{1,6})\s*\[\s*ð[ï]?[¸]?\s*([^\]]+)\]', r'\1 [\2]', line)
-
-                    # 特殊文字で始まるリンクテキストの修正
-                    if '[ð' in line:
-                        line = re.sub(r'\[ð[ï]?[¸]?\s*([^\]]+)\]', r'[\1]', line)
-
-                    # 最後に残りの特殊文字も削除
-                    line = re.sub(r'[^\x00-\x7F\u0080-\u00FF\u0100-\u017F\u0180-\u024F\u0370-\u03FF\u0400-\u04FF\s\[\]\(\)\*\|\.,:;\'"!?-]', '', line)
-                elif '[' in line or '*' in line or '|' in line:
-                    # その他の重要パターン（リンク・リスト・表）内の特殊文字を削除
-                    line = line.replace('ðï¸', '').replace('ðï', '')
-                    line = re.sub(r'[^\x00-\x7F\u0080-\u00FF\u0100-\u017F\u0180-\u024F\u0370-\u03FF\u0400-\u04FF\s\[\]\(\)\*\|\.,:;\'"!?-]', '', line)
-                else:
-                    # 一般のテキスト行はより厳密に処理
-                    line = re.sub(r'[^\x00-\x7F]', '', line)
-
-                clean_content += line + '\n'
-            markdown_content = clean_content
-        except Exception:
-            # エラーが発生した場合は単純に非ASCII文字を削除するフォールバック
-            markdown_bytes = markdown_content.encode('ascii', 'ignore')
-            markdown_content = markdown_bytes.decode('ascii')
-
-        # 全体的な整理（余分な改行を最終調整）
-        markdown_content = re.sub(r'\n{3,}', '\n\n', markdown_content)
-
-        return markdown_content
-
-    def _format_code_blocks(self, markdown_content: str) -> str:
-        """コードブロックとJSONの整形を行う（改良版）"""
-        # 既存コードブロックのパターン（より柔軟な対応）
-        code_block_pattern = r'```(?:json|javascript|js|typescript|ts|python|py|bash|sh|xml|html|css)?\s*\n(.*?)\n```'
-
-        # コードとして扱うキーワードリスト（言語検出用）
-        code_keywords = {
-            'javascript': ['function', 'const', 'var', 'let', '=>', 'return', 'import ', 'export ', 'class ', 'extends'],
-            'typescript': ['interface', 'type ', 'enum ', 'namespace', '<T>', 'implements'],
-            'python': ['def ', 'class ', 'import ', 'from ', 'if __name__', 'return', 'self.', 'async def'],
-            'bash': ['#!/bin/bash', 'chmod', 'sudo ', 'apt ', 'yum ', 'grep ', 'awk ', 'sed '],
-            'json': ['":', '": ', '"name":', '"version":', '"dependencies":'],
-            'xml': ['<?xml', '<tag>', '</tag>', '<node ', '<element'],
-            'html': ['<!DOCTYPE', '<html>', '</html>', '<div>', '<span>', '<p>']
-        }
-
-        def detect_language(code_text):
-            """コードブロックの言語を検出する"""
-            # JSON形式を優先的に検出
-            if code_text.strip().startswith('{') and code_text.strip().endswith('}') and ('"' in code_text or ':' in code_text):
-                try:
-                    # JSON構文として解析可能か確認
-                    # シングルクォートをダブルクォートに置換（JavaScriptスタイルをJSON対応にする）
-                    test_json = code_text.replace("'", '"').replace("//", "#")
-                    json.loads(test_json.strip())
-                    return 'json'
-                except:
-                    pass
-
-            # 各言語の特徴的なキーワードを探す
-            for lang, keywords in code_keywords.items():
-                # いくつかのキーワードが存在するかチェック
-                matches = sum(1 for keyword in keywords if keyword in code_text.lower())
-                if matches >= 2:  # 2つ以上のキーワードがマッチしたら
-                    return lang
-
-            # 単一行の簡単な検出
-            code_lower = code_text.lower()
-            if 'function' in code_lower or 'const ' in code_lower or code_lower.count(';') > 2:
-                return 'javascript'
-            if code_lower.count('def ') > 0 or code_lower.count('import ') > 0:
-                return 'python'
-            if code_lower.count('<') > 2 and code_lower.count('>') > 2:
-                return 'html' if '<html' in code_lower or '<body' in code_lower else 'xml'
-
-            # 判別できない場合は空文字を返す
-            return ''
-
-        def format_code_block(match):
-            """コードブロックを整形する"""
-            code = match.group(1)
-            # 言語タグを取得（定義されていれば）
-            if '```' in match.group(0) and match.group(0).split('```')[1].strip():
-                language = match.group(0).split('```')[1].strip()
-            else:
-                language = ''
-
-            # 空のコードブロックは処理しない
-            if not code.strip():
-                return match.group(0)
-
-            # JSONの整形を試みる
-            if language.lower() == 'json' or (not language and (code.strip().startswith('{') and code.strip().endswith('}'))):
-                try:
-                    # シングルクォートをダブルクォートに置換（JavaScriptスタイルのJSONも対応）
-                    json_code = code.replace("'", '"').replace("//", "#")
-                    parsed_json = json.loads(json_code.strip())
-                    formatted_json = json.dumps(parsed_json, indent=2)
-                    return f"```json\n{formatted_json}\n```"
-                except:
-                    # JSON解析に失敗した場合は通常のコードとして処理
-                    if not language:
-                        language = detect_language(code)
-
-            # 言語が指定されていない場合は自動検出
-            if not language:
-                language = detect_language(code)
-
-            # コードのインデント整形
-            # 行頭の共通インデントを検出して削除
-            lines = code.split('\n')
-            if len(lines) > 1:
-                # 空でない行のみを対象に共通インデント検出
-                non_empty_lines = [line for line in lines if line.strip()]
-                if non_empty_lines:
-                    # 各行のインデント数を計算
-                    indents = [len(line) - len(line.lstrip()) for line in non_empty_lines]
-                    # 最小のインデント数を共通インデントとして使用
-                    common_indent = min(indents) if indents else 0
-
-                    # 共通インデントを削除
-                    if common_indent > 0:
-                        formatted_lines = []
-                        for line in lines:
-                            if line.strip():  # 空行は無視
-                                # 共通インデント分だけ削除
-                                formatted_lines.append(line[common_indent:])
-                            else:
-                                formatted_lines.append(line)
-
-                        code = "\n".join(formatted_lines)
-
-            # 言語タグを準備（検出した言語または指定された言語）
-            lang_tag = language if language else ''
-
-            # PDFフォーマット改善のため前後に空行を追加
-            return f"\n```{lang_tag}\n{code}\n```\n"
-
-        # コードブロックを整形
-        markdown_content = re.sub(code_block_pattern, format_code_block, markdown_content, flags=re.DOTALL)
-
-        # インラインJSONの検出と整形（段落内の１行JSONなど）
-        lines = markdown_content.split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-
-            # cURLコマンド内のJSONパラメータは整形しない
-            prev_line = lines[i-1].lower() if i > 0 else ""
-            current_line = lines[i].lower()
-
-            # curl内のJSONやdataパラメータをスキップする
-            is_curl_json = (('curl' in prev_line or '-d' in prev_line or '--data' in prev_line) and
-                           line.startswith('{') and line.endswith('}'))
-
-            # 単一行のJSONらしき構造を検出して整形（cURLコマンドは除外）
-            if (not is_curl_json and line.startswith('{') and line.endswith('}') and '"' in line and ':' in line and
-                len(line) > 10 and not line.startswith('```')):
-                try:
-                    # JSONとして解析
-                    parsed_json = json.loads(line.replace("'", '"'))
-                    # 整形されたJSONを作成
-                    formatted_json = json.dumps(parsed_json, indent=2)
-                    # コードブロックに置き換え
-                    lines[i] = f"```json\n{formatted_json}\n```"
-                except:
-                    # JSONではない場合はそのまま
-                    pass
-
-            # コードブロックっぽい連続した行を探す（ブレース開始など）
-            elif i < len(lines) - 2 and not lines[i].startswith('#') and not lines[i].startswith('```'):
-                # 開始ブレース・括弧があるかチェック
-                if (('{' in lines[i] and lines[i].strip().endswith('{')) or
-                    ('(' in lines[i] and lines[i].strip().endswith('('))):
-
-                    # コードブロックの範囲を特定
-                    start_idx = i
-                    block_content = [lines[i]]
-                    matching_char = '}' if '{' in lines[i] else ')'
-
-                    # 終了ブレース・括弧を探す
-                    j = i + 1
-                    while j < min(i + 30, len(lines)):  # 最大30行までを探索範囲とする
-                        if matching_char in lines[j]:
-                            block_content.append(lines[j])
-                            end_idx = j
-                            break
-                        block_content.append(lines[j])
-                        j += 1
-                    else:
-                        # 終了文字が見つからなかった場合
-                        i += 1
-                        continue
-
-                    # コードブロックとしての整形を試みる
-                    code_text = "\n".join(block_content)
-
-                    # 言語を自動検出
-                    language = detect_language(code_text)
-
-                    # JSONの場合は特別処理
-                    if language == 'json':
-                        try:
-                            # JavaScriptスタイルJSONをスタンダードJSONに変換
-                            json_code = code_text.replace("'", '"').replace("//", "#")
-                            parsed_json = json.loads(json_code.strip())
-                            formatted_json = json.dumps(parsed_json, indent=2)
-                            lines[start_idx] = f"```json\n{formatted_json}\n```"
-                        except:
-                            # 通常のコードブロックとして整形
-                            lines[start_idx] = f"```{language}\n{code_text}\n```"
-                    else:
-                        # 非JSONコードとして整形
-                        lines[start_idx] = f"```{language}\n{code_text}\n```"
-
-                    # 整形した分の行を削除
-                    for _ in range(end_idx - start_idx):
-                        if start_idx + 1 < len(lines):
-                            lines.pop(start_idx + 1)
-
-                    # インデックス更新
-                    i = start_idx
-
-            i += 1
-
-        # 行を結合して戻す
-        return '\n'.join(lines)
-
-    def _improve_tables(self, markdown_content: str) -> str:
-        """表組みのマークダウン表現を改善する（PDF出力向け強化版）"""
-        # 前処理: 表の前後に十分な改行を確保して表を分離する
-        markdown_content = re.sub(r'([^\n])\n(\|[^\n]+\|)', r'\1\n\n\2', markdown_content)
-        markdown_content = re.sub(r'(\|[^\n]+\|)\n([^\n])', r'\1\n\n\2', markdown_content)
-
-        # 見出し同士が連結している場合に分離する
-        markdown_content = re.sub(r'(#{1,6}[^\n]+)\n(#{1,6})', r'\1\n\n\2', markdown_content)
-
-        # マークダウンの表を検出して改善
-        table_pattern = r'(\|[^\n]+\|\n\|[-:| ]+\|\n(?:\|[^\n]+\|\n)+)'
-
-        def fix_table(match):
-            table = match.group(1)
-
-            # 空の表は処理しない
-            if not table.strip():
-                return table
-
-            # 行に分割
-            lines = table.strip().split('\n')
-            if len(lines) < 2:
-                return table
-
-            # 各行のセル数と最大幅を計算
-            max_cells = 0
-            row_cells = []
-
-            for line in lines:
-                # |で分割し、前後の空セルを取り除く
-                cells = [c.strip() for c in line.split('|')[1:-1]]
-                row_cells.append(cells)
-                max_cells = max(max_cells, len(cells))
-
-            # 各列の最大文字幅を計算（見た目を整えるため）
-            col_widths = [0] * max_cells
-            for row in row_cells:
-                for i, cell in enumerate(row):
-                    if i < max_cells:
-                        col_widths[i] = max(col_widths[i], len(cell))
-
-            # ヘッダー行を修正（2行目の区切り行）
-            if len(lines) > 1:
-                header_sep = []
-                for i, width in enumerate(col_widths):
-                    # 元の区切り行をチェックして左右寄せを保持
-                    align_marker = ""
-                    if i < len(row_cells[1]):
-                        cell = row_cells[1][i]
-                        if cell.startswith(':') and cell.endswith(':'):
-                            align_marker = ":"  # 中央寄せ
-                            col_sep = ':' + '-' * max(3, width) + ':'
-                        elif cell.startswith(':'):
-                            align_marker = ":"  # 左寄せ
-                            col_sep = ':' + '-' * max(3, width) + ' '
-                        elif cell.endswith(':'):
-                            align_marker = ":"  # 右寄せ
-                            col_sep = ' ' + '-' * max(3, width) + ':'
-                        else:
-                            col_sep = '-' * max(3, width + 2)  # デフォルト（左寄せ）
-                    else:
-                        col_sep = '-' * max(3, width + 2)  # 新しい列はデフォルト
-
-                    header_sep.append(col_sep)
-
-                # 区切り行を再構築
-                lines[1] = '|' + '|'.join(header_sep) + '|'
-
-            # 各行を再構築
-            formatted_lines = []
-            for i, row in enumerate(row_cells):
-                if i == 1:  # 区切り行はすでに処理済み
-                    continue
-
-                # 各セルを整形
-                formatted_cells = []
-                for j in range(max_cells):
-                    if j < len(row):
-                        cell = row[j]
-                        # セルの内容をクリーンアップ - 特殊文字を削除
-                        cell = re.sub(r'[^\x00-\x7F\s\.,;:!?\-_\'\"\/\\\[\]\(\)\{\}\+\*\&\^\%\$\#\@<>=~`|]', '', cell)
-                        formatted_cells.append(cell)
-                    else:
-                        # 足りないセルを空で追加
-                        formatted_cells.append('')
-
-                # 行を再構築
-                formatted_lines.append('| ' + ' | '.join(formatted_cells) + ' |')
-
-            # 区切り行を挿入
-            if len(formatted_lines) > 0:
-                formatted_lines.insert(1, lines[1])
-
-            # 修正された表を返す（PDF表示向けに前後に適切な余白を追加）
-            return '\n\n' + '\n'.join(formatted_lines) + '\n\n'
-
-        # 表組みを修正
-        markdown_content = re.sub(table_pattern, fix_table, markdown_content)
-
-        # シンプルな表のパターン（ヘッダーなし）も検出
-        simple_table_pattern = r'(\|[^\n]+\|\n(?:\|[^\n]+\|\n){2,})'
-
-        def fix_simple_table(match):
-            table = match.group(1)
-            lines = table.strip().split('\n')
-
-            # すでに整形済みの表は処理しない（区切り行がある場合）
-            if any(re.match(r'\|\s*[-:]+\s*\|', line) for line in lines):
-                return table
-
-            # ヘッダー区切り行を作成して挿入
-            header_line = lines[0]
-            cells_count = header_line.count('|') - 1
-            sep_line = '|' + '|'.join([' ----- ' for _ in range(cells_count)]) + '|'
-
-            # 新しい表を構築
-            new_table = [lines[0], sep_line] + lines[1:]
-            return '\n\n' + '\n'.join(new_table) + '\n\n'
-
-        # シンプルな表も修正
-        markdown_content = re.sub(simple_table_pattern, fix_simple_table, markdown_content)
-
-        return markdown_content
-
-    def _fix_image_paths(self, markdown_content: str, base_url: str) -> str:
-        """Markdown内の画像パスを修正する"""
-        # ![alt](relative/path.jpg) 形式の画像タグを検出して修正
-        def replace_img_path(match):
-            alt_text = match.group(1)
-            img_path = match.group(2)
-
-            # 既に絶対URLなら変更しない
-            if img_path.startswith(('http://', 'https://', '//')):
-                return f"![{alt_text}]({img_path})"
-
-            # 相対パスを絶対パスに変換
-            absolute_path = urljoin(base_url, img_path)
-            return f"![{alt_text}]({absolute_path})"
-
-        # 画像パターンを正規表現で検索して置換
-        return re.sub(r'!\[(.*?)\]\(([^)]+)\)', replace_img_path, markdown_content)
-
-
-class ContentRepository:
-    """クロールしたコンテンツを管理するコンポーネント（改善版）"""
-    
-    def __init__(self):
-        self.contents = {}  # URLをキーとしたコンテンツ辞書
-        self.urls_by_status = {
-            'success': set(),  # 正常に取得できたURL
-            'error': set(),    # エラーが発生したURL
-            'skipped': set(),  # スキップされたURL
-        }
-        self.metadata = {
-            'start_time': datetime.now().isoformat(),
-            'end_time': None,
-            'total_urls': 0,
-            'success_count': 0,
-            'error_count': 0,
-            'skipped_count': 0,
-        }
-        
-    def add(self, page_data: Dict, status: str = 'success') -> None:
-        """コンテンツを追加する"""
-        url = page_data['url']
-        self.contents[url] = page_data
-        
-        # ステータス別URLセットを更新
-        if status in self.urls_by_status:
-            self.urls_by_status[status].add(url)
-            
-        # メタデータを更新
-        self.metadata['total_urls'] += 1
-        status_count_key = f'{status}_count'
-        if status_count_key in self.metadata:
-            self.metadata[status_count_key] += 1
-        
-    def get(self, url: str) -> Optional[Dict]:
-        """URLに対応するコンテンツを取得する"""
-        return self.contents.get(url)
-    
-    def get_all(self) -> Dict[str, Dict]:
-        """すべてのコンテンツを取得する"""
-        return self.contents
-    
-    def get_urls_by_status(self, status: str) -> Set[str]:
-        """指定されたステータスのURLセットを取得する"""
-        return self.urls_by_status.get(status, set())
-    
-    def count(self) -> int:
-        """コンテンツの数を取得する"""
-        return len(self.contents)
-    
-    def finalize(self) -> None:
-        """クロール完了時にメタデータを更新する"""
-        self.metadata['end_time'] = datetime.now().isoformat()
-        
-    def get_metadata(self) -> Dict:
-        """リポジトリのメタデータを取得する"""
-        if self.metadata['end_time'] is None:
-            self.metadata['end_time'] = datetime.now().isoformat()
-            
-        # 各カウントを最新の状態に更新
-        self.metadata['success_count'] = len(self.urls_by_status['success'])
-        self.metadata['error_count'] = len(self.urls_by_status['error'])
-        self.metadata['skipped_count'] = len(self.urls_by_status['skipped'])
-        
-        return self.metadata
-
-
-class CrawlCache:
-    """クロール結果を永続的に保存し、差分検知に使用するコンポーネント（改善版）"""
-    
-    def __init__(self, domain: str, cache_dir: str = "cache"):
-        self.domain = domain
-        self.cache_dir = cache_dir
-        os.makedirs(cache_dir, exist_ok=True)
-        
-        self.db_path = os.path.join(cache_dir, f"{domain}.db")
-        self._initialize_db()
-        
-    def _initialize_db(self):
-        """データベースを初期化する"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # pages テーブルを作成（拡張版）
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pages (
-            url TEXT PRIMARY KEY,
-            title TEXT,
-            content_hash TEXT,
-            etag TEXT,
-            last_modified TEXT,
-            last_crawled TEXT,
-            markdown_content TEXT,
-            meta_description TEXT,
-            status_code INTEGER
-        )
-        ''')
-        
-        # crawl_history テーブルを作成
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS crawl_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            crawl_date TEXT,
-            page_count INTEGER,
-            new_count INTEGER,
-            updated_count INTEGER,
-            deleted_count INTEGER,
-            duration_seconds INTEGER
-        )
-        ''')
-        
-        # インデックスを作成（パフォーマンス向上）
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_last_crawled ON pages(last_crawled)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawl_history_date ON crawl_history(crawl_date)')
-        
-        conn.commit()
-        conn.close()
-    
-    def _get_connection(self):
-        """SQLite接続を取得する（接続プールの実装）"""
-        return sqlite3.connect(self.db_path)
-    
-    @contextmanager
-    def _db_transaction(self):
-        """データベーストランザクションのコンテキストマネージャ"""
-        conn = self._get_connection()
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        except Exception as e:
-            conn.rollback()
-            logging.error(f"Database transaction error: {e}")
-            raise
-        finally:
-            conn.close()
-    
-    def get_page(self, url: str) -> Optional[Dict]:
-        """URLに対応するキャッシュされたページ情報を取得する"""
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM pages WHERE url = ?', (url,))
-            row = cursor.fetchone()
-            
-        if row:
-            return dict(row)
-        return None
-    
-    def add_or_update_page(self, page_data: Dict) -> bool:
-        """ページ情報をキャッシュに追加または更新する"""
-        url = page_data['url']
-        title = page_data['title']
-        markdown_content = page_data.get('markdown_content', '')
-        meta_description = page_data.get('meta_description', '')
-        content_hash = self._compute_hash(markdown_content)
-        etag = page_data.get('etag')
-        last_modified = page_data.get('last_modified')
-        status_code = page_data.get('status_code', 200)
-        last_crawled = datetime.now().isoformat()
-        
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            
-            # 既存のページかチェック
-            cursor.execute('SELECT content_hash FROM pages WHERE url = ?', (url,))
-            row = cursor.fetchone()
-            
-            is_update = row is not None
-            
-            if is_update:
-                # 更新
-                cursor.execute('''
-                UPDATE pages 
-                SET title = ?, content_hash = ?, etag = ?, last_modified = ?, 
-                    last_crawled = ?, markdown_content = ?, meta_description = ?, status_code = ?
-                WHERE url = ?
-                ''', (title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code, url))
-            else:
-                # 新規追加
-                cursor.execute('''
-                INSERT INTO pages 
-                (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code))
-            
-            conn.commit()
-        
-        return is_update
-    
-    def get_all_urls(self) -> Set[str]:
-        """キャッシュに保存されているすべてのURLを取得する"""
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT url FROM pages')
-            urls = {row[0] for row in cursor.fetchall()}
-        
-        return urls
-    
-    def delete_urls(self, urls: List[str]) -> int:
-        """指定されたURLをキャッシュから削除する"""
-        if not urls:
-            return 0
-            
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            
-            # SQLインジェクション対策のためにプレースホルダーを使用
-            placeholders = ', '.join(['?'] * len(urls))
-            cursor.execute(f'DELETE FROM pages WHERE url IN ({placeholders})', urls)
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-        
-        return deleted_count
-    
-    def save_crawl_history(self, page_count: int, new_count: int, updated_count: int, deleted_count: int, duration_seconds: int) -> int:
-        """クロール履歴を保存する（拡張版：所要時間を追加）"""
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            
-            crawl_date = datetime.now().isoformat()
-            
-            cursor.execute('''
-            INSERT INTO crawl_history 
-            (crawl_date, page_count, new_count, updated_count, deleted_count, duration_seconds)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (crawl_date, page_count, new_count, updated_count, deleted_count, duration_seconds))
-            
-            history_id = cursor.lastrowid
-            conn.commit()
-        
-        return history_id
-    
-    def is_content_changed(self, url: str, markdown_content: str) -> bool:
-        """ページのコンテンツが前回のクロール時から変更されているかどうかを確認する"""
-        current_hash = self._compute_hash(markdown_content)
-        
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT content_hash FROM pages WHERE url = ?', (url,))
-            row = cursor.fetchone()
-        
-        if not row:
-            return True  # 新規ページなので変更ありとみなす
-        
-        return current_hash != row[0]
-    
-    def _compute_hash(self, content: str) -> str:
-        """コンテンツのハッシュ値を計算する"""
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()
-    
-    def get_diff(self, url: str, current_content: str) -> str:
-        """前回のコンテンツとの差分を取得する（改善版：コンテキスト差分表示）"""
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT markdown_content FROM pages WHERE url = ?', (url,))
-            row = cursor.fetchone()
-
-        if not row:
-            return "新規ページ"
-
-        old_content = row[0]
-        if not old_content:
-            return "前回のコンテンツが空"
-
-        # 差分を計算（コンテキスト形式、より多くのコンテキスト行を表示）
-        diff = difflib.unified_diff(
-            old_content.splitlines(),
-            current_content.splitlines(),
-            fromfile="前回のバージョン",
-            tofile="現在のバージョン",
-            lineterm='',
-            n=3  # コンテキスト行数を3行に増加
-        )
-
-        return '\n'.join(diff)
-    
-    def get_history(self, limit: int = 10) -> List[Dict]:
-        """最新のクロール履歴を取得する"""
-        with self._db_transaction() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT * FROM crawl_history 
-            ORDER BY crawl_date DESC 
-            LIMIT ?
-            ''', (limit,))
-            
-            history = [dict(row) for row in cursor.fetchall()]
-        
-        return history
-
-
-class FileExporter:
-    """クロールしたコンテンツをファイルに出力するコンポーネント（改善版）"""
-    
-    def __init__(self, output_dir: str = "output"):
-        self.output_dir = output_dir
-        os.makedirs(output_dir, exist_ok=True)
-        
-    def export_markdown(self, repository: ContentRepository, filename: str) -> str:
-        """コンテンツをMarkdownファイルとしてエクスポートする"""
-        contents = repository.get_all()
-
-        # 出力ファイルのパス
-        output_path = os.path.join(self.output_dir, filename)
-
-        # コンテンツを目次付きでまとめる
-        markdown_contents = []
-
-        # 目次の作成
-        toc = ["# 目次\n"]
-        for i, (url, page_data) in enumerate(sorted(contents.items()), 1):
-            title = page_data.get('title', 'タイトルなし')
-            toc.append(f"{i}. [{title}](#{self._make_anchor(title)})")
-
-        markdown_contents.append("\n".join(toc) + "\n\n---\n\n")
-
-        # 本文の追加
-        for url, page_data in sorted(contents.items()):
-            if 'markdown_content' in page_data:
-                markdown_contents.append(page_data['markdown_content'])
-
-        # ファイルに書き込む
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n\n---\n\n'.join(markdown_contents))
-
-        return output_path
-    
-    def _make_anchor(self, text: str) -> str:
-        """テキストからアンカーIDを生成する"""
-        # 小文字に変換し、アルファベット・数字・ハイフン以外の文字をハイフンに置換
-        anchor = re.sub(r'[^\w\- ]', '', text.lower())
-        # スペースをハイフンに置換し、連続するハイフンを1つにまとめる
-        anchor = re.sub(r'[\- ]+', '-', anchor)
-        return anchor.strip('-')
-    
-    def export_diff_report(self, diff_data: Dict, filename: str) -> str:
-        """差分レポートをMarkdownファイルとして出力する（改善版）"""
-        output_path = os.path.join(self.output_dir, filename)
-
-        with open(output_path, 'w', encoding='utf-8') as f:
-            # レポートヘッダーとメタデータ
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            f.write(f"# 差分レポート - {now}\n\n")
-
-            # サマリー情報
-            f.write("## サマリー\n\n")
-            f.write(f"- 合計ページ数: {diff_data['total']}\n")
-            f.write(f"- 新規ページ: {len(diff_data['new_pages'])}\n")
-            f.write(f"- 更新ページ: {len(diff_data['updated_pages'])}\n")
-            f.write(f"- 削除ページ: {len(diff_data['deleted_pages'])}\n")
-            # 経過時間があれば表示
-            if 'duration_seconds' in diff_data:
-                duration = diff_data['duration_seconds']
-                minutes, seconds = divmod(duration, 60)
-                f.write(f"- クロール時間: {minutes}分{seconds}秒\n")
-            f.write("\n")
-
-            # 新規ページ
-            if diff_data['new_pages']:
-                f.write("## 新規ページ\n\n")
-                for url in sorted(diff_data['new_pages']):
-                    f.write(f"- [{url}]({url})\n")
-                f.write("\n")
-
-            # 更新ページ
-            if diff_data['updated_pages']:
-                f.write("## 更新ページ\n\n")
-                for url in sorted(diff_data['updated_pages']):
-                    f.write(f"- [{url}]({url})\n")
-                f.write("\n")
-
-            # 削除ページ
-            if diff_data['deleted_pages']:
-                f.write("## 削除ページ\n\n")
-                for url in sorted(diff_data['deleted_pages']):
-                    f.write(f"- {url}\n")
-                f.write("\n")
-
-            # 詳細な差分情報
-            if diff_data.get('diffs'):
-                f.write("## 詳細な差分\n\n")
-                for url, diff in sorted(diff_data['diffs'].items()):
-                    f.write(f"### {url}\n\n")
-                    f.write("```diff\n")
-                    f.write(diff)
-                    f.write("\n```\n\n")
-
-        return output_path
-    
-    def export_summary(self, repository: ContentRepository, diff_data: Dict, filename: str) -> str:
-        """クロール結果の概要レポートをエクスポートする"""
-        output_path = os.path.join(self.output_dir, filename)
-
-        metadata = repository.get_metadata()
-
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(f"# クロール概要レポート - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-
-            # クロール概要
-            f.write("## クロール情報\n\n")
-            f.write(f"- 開始時間: {metadata['start_time']}\n")
-            f.write(f"- 終了時間: {metadata['end_time']}\n")
-            if 'duration_seconds' in diff_data:
-                minutes, seconds = divmod(diff_data['duration_seconds'], 60)
-                f.write(f"- 所要時間: {minutes}分{seconds}秒\n")
-            f.write(f"- 合計URL: {metadata['total_urls']}\n")
-            f.write(f"- 成功: {metadata['success_count']}\n")
-            f.write(f"- エラー: {metadata['error_count']}\n")
-            f.write(f"- スキップ: {metadata['skipped_count']}\n\n")
-
-            # 差分概要
-            f.write("## 変更概要\n\n")
-            f.write(f"- 新規ページ: {len(diff_data['new_pages'])}\n")
-            f.write(f"- 更新ページ: {len(diff_data['updated_pages'])}\n")
-            f.write(f"- 削除ページ: {len(diff_data['deleted_pages'])}\n\n")
-
-            # エラーページのリスト
-            error_urls = repository.get_urls_by_status('error')
-            if error_urls:
-                f.write("## エラーページ\n\n")
-                for url in sorted(error_urls):
-                    f.write(f"- {url}\n")
-                f.write("\n")
-
+"""
+再利用可能なWebクローラーコンポーネント
+- 非同期サポート追加
+- エラーハンドリング強化
+- パフォーマンス最適化
+"""
+
+import os
+import re
+import time
+import json
+import hashlib
+import logging
+import functools
+import sqlite3
+import threading
+import asyncio
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse, urljoin, parse_qs, urlencode
+from typing import Set, Dict, List, Optional, Tuple, Any, Union, Callable
+from datetime import datetime
+import difflib
+from copy import deepcopy
+
+# 重量級モジュール（html2text, lxml）は起動コスト削減のため、
+# 使用するクラスの初期化時に遅延インポートする
+
+
+@functools.lru_cache(maxsize=8192)
+def _urlparse(url: str):
+    """urlparseのメモ化ラッパー
+
+    同じURLがフィルタ・正規化・フェッチの各段階で繰り返しパースされる
+    ため、結果をキャッシュする。ParseResultは不変なので共有しても安全。
+    """
+    return urlparse(url)
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from contextlib import contextmanager
+
+# 見出し修正ユーティリティをインポート
+from heading_fixer import fix_concatenated_headings
+
+# aiohttpが利用可能なら非同期フェッチに使用（なければスレッドプールにフォールバック）
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# orjsonが利用可能ならJSON整形に使用（標準jsonより数倍高速。なければ標準jsonを使用）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    _json_loads = orjson.loads
+
+    def _json_dumps_indent2(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+else:
+    _json_loads = json.loads
+
+    def _json_dumps_indent2(obj) -> str:
+        return json.dumps(obj, indent=2)
+
+
+def _try_parse_json(text: str):
+    """JSONとして解析を試み、失敗したらNoneを返す
+
+    まず原文のまま解析する（正しいJSON文字列内のアポストロフィを
+    クォート置換で壊さないため）。失敗した場合のみ、従来どおり
+    シングルクォート置換でJavaScript風リテラルの救済を試す。
+    """
+    stripped = text.strip()
+    try:
+        return _json_loads(stripped)
+    except Exception:
+        pass
+    try:
+        return _json_loads(stripped.replace("'", '"').replace("//", "#"))
+    except Exception:
+        return None
+
+
+# 設定クラス
+@dataclass(slots=True)
+class CrawlerConfig:
+    """クローラーの設定を管理するクラス
+
+    slots=Trueにより属性アクセスが辞書参照ではなくスロット参照になり、
+    should_crawl/fetchのホットパスでの読み出しが速くなる。
+    （複数箇所でフィールドを書き換えているためfrozenにはしない）
+    """
+    base_url: str
+    max_pages: int = 100
+    delay: float = 1.0
+    user_agent: str = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    timeout: int = 10
+    max_retries: int = 3
+    max_workers: int = 5  # 並列実行用のワーカー数
+    output_dir: str = "output"
+    cache_dir: str = "cache"
+    discord_webhook: Optional[str] = None
+    diff_detection: bool = True
+    skip_no_changes: bool = True
+    normalize_urls: bool = True  # URL正規化の有効化
+    respect_robots_txt: bool = True  # robots.txtの尊重
+    follow_redirects: bool = True  # リダイレクトの追跡
+    static_extensions: Set[str] = field(default_factory=lambda: {
+        '.jpg', '.jpeg', '.png', '.gif', '.svg', '.css',
+        '.js', '.pdf', '.zip', '.tar', '.gz', '.mp3',
+        '.mp4', '.avi', '.mov', '.webm', '.webp', '.ico'
+    })
+    # ビジュアルクローリング関連（crawler_advanced/crawler_config_utilが使用。
+    # slots化に伴い、後付け属性ではなく正式なフィールドとして宣言する）
+    visual_mode: bool = False
+    visual_config: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, config_dict: Dict[str, Any]) -> 'CrawlerConfig':
+        """辞書から設定オブジェクトを作成する"""
+        return cls(**{k: v for k, v in config_dict.items() if k in cls.__annotations__})
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """設定を辞書に変換する"""
+        return asdict(self)
+    
+    @classmethod
+    def from_json(cls, json_path: str) -> 'CrawlerConfig':
+        """JSONファイルから設定オブジェクトを作成する"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                config_dict = json.load(f)
+            return cls.from_dict(config_dict)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logging.error(f"設定ファイルの読み込みに失敗しました: {e}")
+            raise
+
+
+class UrlFilter:
+    """URLをフィルタリングして、同一ドメイン内のURLのみを許可するコンポーネント（改善版）"""
+    
+    def __init__(self, config: CrawlerConfig):
+        """
+        URLフィルタークラスの初期化
+        
+        Args:
+            config: クローラーの設定
+        """
+        self.base_url = config.base_url
+        self.base_domain = _urlparse(config.base_url).netloc
+        self.static_extensions = config.static_extensions
+        # str.endswithはタプルを直接受け取れる（C実装の比較で高速）
+        self._static_ext_tuple = tuple(config.static_extensions)
+        self.normalize_urls = config.normalize_urls
+        
+        # 除外パターンの正規表現（オプション）
+        self.exclude_patterns = [
+            r'\/(?:calendar|login|logout|signup|register|password-reset)(?:\/|$)',
+            r'\/feed(?:\/|$)',
+            r'\/wp-admin(?:\/|$)',
+            r'\/wp-content\/(?:cache|uploads)(?:\/|$)',
+            r'\/cart(?:\/|$)',
+            r'\/checkout(?:\/|$)',
+            r'\/my-account(?:\/|$)',
+        ]
+        self.exclude_regex = re.compile('|'.join(self.exclude_patterns))
+
+        # 同じhrefは1ページ内・サイト内で何度も現れるため、正規化結果と
+        # 判定結果をインスタンスごとにメモ化する（urlparse/urljoinの削減）
+        self.normalize_url = functools.lru_cache(maxsize=65536)(self._normalize_url_impl)
+        self.should_crawl_normalized = functools.lru_cache(maxsize=65536)(
+            self._should_crawl_normalized_impl)
+
+    def _normalize_url_impl(self, url: str) -> str:
+        """URLを正規化する（相対URLを絶対URLに変換、フラグメントの削除等）"""
+        # 相対URLを絶対URLに変換
+        normalized_url = urljoin(self.base_url, url)
+        
+        # フラグメント (#) を削除
+        normalized_url = normalized_url.split('#')[0]
+        
+        if self.normalize_urls:
+            # クエリパラメータを正規化（オプション）
+            parsed = _urlparse(normalized_url)
+            if parsed.query:
+                # クエリパラメータを正規化：アルファベット順にソート
+                params = parse_qs(parsed.query)
+                # UTM系パラメータなど、特定のトラッキングパラメータを除外
+                for param in list(params.keys()):
+                    if param.startswith('utm_') or param in ['fbclid', 'gclid', 'ref']:
+                        del params[param]
+                # クエリを再構築
+                normalized_query = urlencode(params, doseq=True)
+                # URLを再構築
+                normalized_url = parsed._replace(query=normalized_query).geturl()
+            
+        # トレーリングスラッシュを統一
+        if normalized_url.endswith('/'):
+            normalized_url = normalized_url[:-1]
+            
+        return normalized_url
+    
+    def should_crawl(self, url: str) -> bool:
+        """URLがクロール対象かどうかを判定する"""
+        return self.should_crawl_normalized(url) is not None
+
+    def _should_crawl_normalized_impl(self, url: str) -> Optional[str]:
+        """クロール対象なら正規化済みURLを、対象外ならNoneを返す
+
+        呼び出し側が正規化のために再度normalize_urlを呼ばずに済むよう、
+        判定と正規化を1回で行う。
+        """
+        # 空のURLはクロールしない
+        if not url:
+            return None
+
+        # URLを正規化
+        url = self.normalize_url(url)
+
+        # URLのドメインを取得
+        parsed_url = _urlparse(url)
+        domain = parsed_url.netloc
+
+        # 同一ドメインでない場合はクロールしない
+        if domain != self.base_domain:
+            return None
+
+        # 静的ファイルはクロールしない
+        path = parsed_url.path.lower()
+        if path.endswith(self._static_ext_tuple):
+            return None
+
+        # メールアドレス・電話番号リンクはクロールしない
+        if url.startswith(('mailto:', 'tel:')):
+            return None
+
+        # 除外パターンに該当するURLはクロールしない
+        if self.exclude_regex.search(parsed_url.path):
+            return None
+
+        return url
+
+
+class Fetcher:
+    """指定されたURLからHTMLコンテンツを取得するコンポーネント（改善版）"""
+    
+    def __init__(self, config: CrawlerConfig):
+        self.delay = config.delay
+        self.max_retries = config.max_retries
+        self.timeout = config.timeout
+        self.follow_redirects = config.follow_redirects
+        self.last_request_time = 0
+        
+        # ユーザーエージェントをより多様化
+        self.headers = {
+            'User-Agent': config.user_agent,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate, br',  # 圧縮対応
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Cache-Control': 'max-age=0'
+        }
+        
+        # ドメインごとのリクエスト制限を追跡するための辞書
+        self.domain_last_request = {}
+        
+        # セッションオブジェクトの作成（接続の再利用によるパフォーマンス向上）
+        # プールはワーカー数に合わせて拡張する（既定の10コネクションでは
+        # max_workers超過分がkeep-aliveされず、毎回TLSハンドシェイクが走る）
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=max(10, config.max_workers),
+            pool_maxsize=max(20, config.max_workers * 2),
+            max_retries=0,  # リトライはfetch()側の429/バックオフ処理で行う
+            pool_block=False
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Fetcher自身が所有するaiohttpセッション（共有セッションが渡されない
+        # 場合にfetch_asyncが遅延生成する。生成は_aio_lockで直列化）
+        self.max_workers = config.max_workers
+        self._aio_session = None
+        self._aio_lock = asyncio.Lock() if AIOHTTP_AVAILABLE else None
+
+        # 非同期レート制限用：ドメインごとのロックと次回リクエスト可能時刻。
+        # ロックなしでは同一ホストの複数コルーチンが同じ最終時刻を読んで
+        # 同時にリクエストしてしまう（異なるホスト同士は並列のまま）
+        self._domain_locks: Dict[str, asyncio.Lock] = {}
+        self._domain_next_ok: Dict[str, float] = {}
+
+        # fetch_many用：ホストごとの同時接続数を制限するセマフォ
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}
+
+    def __del__(self):
+        """クリーンアップ処理"""
+        try:
+            if hasattr(self, 'session') and self.session:
+                self.session.close()
+        except Exception:
+            pass
+        
+    def _wait_for_rate_limit(self, domain: str):
+        """ドメインごとのレート制限を適用する"""
+        current_time = time.time()
+        
+        # ドメイン固有の最終リクエスト時間を取得
+        domain_last_time = self.domain_last_request.get(domain, 0)
+        
+        # グローバルな最終リクエスト時間との間で長い方を取得
+        last_time = max(self.last_request_time, domain_last_time)
+        
+        elapsed = current_time - last_time
+        if elapsed < self.delay:
+            time.sleep(self.delay - elapsed)
+            
+        # 最終リクエスト時間を更新
+        current_time = time.time()
+        self.last_request_time = current_time
+        self.domain_last_request[domain] = current_time
+        
+    async def _await_rate_limit(self, domain: str):
+        """ドメインごとのレート制限を非同期に適用する
+
+        ドメイン単位のロックで同一ホストのコルーチンを直列化しつつ、
+        異なるホストへのリクエストは並列に進められるようにする。
+        """
+        lock = self._domain_locks.setdefault(domain, asyncio.Lock())
+        loop = asyncio.get_event_loop()
+        async with lock:
+            delay = self._domain_next_ok.get(domain, 0.0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._domain_next_ok[domain] = loop.time() + self.delay
+            # 同期版fetchと併用された場合のためにこちらの記録も更新しておく
+            self.domain_last_request[domain] = time.time()
+
+    async def fetch_async(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None, session=None) -> Tuple[Optional[str], Dict[str, str]]:
+        """URLからHTMLコンテンツを非同期で取得する
+
+        共有のaiohttp.ClientSessionが渡された場合はそれを使用し、
+        接続プール（keep-alive）を全クロールで再利用する。
+        渡されない場合は同期版fetchをスレッドプールで実行する。
+        """
+        if AIOHTTP_AVAILABLE:
+            if session is None:
+                session = await self._get_aio_session()
+            return await self._fetch_with_session(session, url, etag, last_modified)
+
+        # aiohttpが無い場合は同期版をスレッドプールで実行する
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: self.fetch(url, etag, last_modified))
+
+    async def fetch_many(self, urls: List[str]) -> List[Tuple[Optional[str], Dict[str, str]]]:
+        """複数URLを並列に取得する
+
+        ホストごとにmax_workers、全体でmax_workers*4の同時実行数で
+        fetch_asyncをまとめて実行する。ドメインごとのレート制限は
+        fetch_async内のスケジューラがそのまま適用される。
+        結果は入力と同じ順序で返し、例外は(None, エラー情報)に変換する。
+        """
+        global_sem = asyncio.Semaphore(self.max_workers * 4)
+
+        async def _fetch_one(url: str) -> Tuple[Optional[str], Dict[str, str]]:
+            host = _urlparse(url).netloc
+            host_sem = self._host_sems.setdefault(
+                host, asyncio.Semaphore(self.max_workers))
+            async with global_sem, host_sem:
+                return await self.fetch_async(url)
+
+        results = await asyncio.gather(
+            *(_fetch_one(url) for url in urls), return_exceptions=True)
+        return [
+            result if not isinstance(result, BaseException)
+            else (None, {'status_code': 0, 'error': str(result)})
+            for result in results
+        ]
+
+    async def _get_aio_session(self):
+        """Fetcher所有のaiohttpセッションを返す（初回呼び出し時に生成）"""
+        if self._aio_session is None or self._aio_session.closed:
+            async with self._aio_lock:
+                if self._aio_session is None or self._aio_session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit=self.max_workers * 4,
+                        limit_per_host=self.max_workers,
+                        ttl_dns_cache=300,
+                        keepalive_timeout=30
+                    )
+                    self._aio_session = aiohttp.ClientSession(
+                        connector=connector,
+                        headers=self.headers,
+                        timeout=aiohttp.ClientTimeout(total=self.timeout)
+                    )
+        return self._aio_session
+
+    async def aclose(self):
+        """所有しているaiohttpセッションを閉じる"""
+        if self._aio_session is not None and not self._aio_session.closed:
+            await self._aio_session.close()
+        self._aio_session = None
+
+    async def _fetch_with_session(self, session, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Tuple[Optional[str], Dict[str, str]]:
+        """共有aiohttpセッションを使ってHTMLコンテンツを取得する"""
+        # ドメインを抽出してレート制限を適用
+        domain = _urlparse(url).netloc
+        await self._await_rate_limit(domain)
+
+        # 条件付きリクエスト用ヘッダーを準備（不要ならdictを作らない）
+        headers = None
+        if etag or last_modified:
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        retries = 0
+        retry_delay = self.delay
+
+        while retries <= self.max_retries:
+            try:
+                async with session.get(
+                    url,
+                    headers=headers,
+                    allow_redirects=self.follow_redirects
+                ) as response:
+                    # ステータスコードに基づく処理
+                    if response.status == 304:  # Not Modified
+                        logging.info(f"Content not modified: {url}")
+                        return None, {
+                            'etag': etag,
+                            'last_modified': last_modified,
+                            'status_code': 304
+                        }
+
+                    elif response.status == 429:  # Too Many Requests
+                        # レート制限に引っかかった場合、遅延を増加させる
+                        retry_after = int(response.headers.get('Retry-After', retry_delay * 2))
+                        logging.warning(f"Rate limited: {url}. Retrying after {retry_after} seconds.")
+                        await asyncio.sleep(retry_after)
+                        retries += 1
+                        continue
+
+                    elif response.status >= 400:  # エラーコード
+                        if response.status == 404:
+                            logging.warning(f"Page not found: {url}")
+                            return None, {'status_code': 404, 'error': 'Not Found'}
+
+                        logging.warning(f"Failed to fetch {url}: status code {response.status}")
+                        if retries < self.max_retries:
+                            retries += 1
+                            await asyncio.sleep(retry_delay * (2 ** retries))  # 指数バックオフ
+                            continue
+                        return None, {'status_code': response.status, 'error': f'HTTP error: {response.status}'}
+
+                    # content-typeがHTMLでない場合はスキップ
+                    content_type = response.headers.get('Content-Type', '')
+                    if 'text/html' not in content_type.lower():
+                        logging.info(f"Skipping non-HTML content: {url}, Content-Type: {content_type}")
+                        return None, {'status_code': response.status, 'content_type': content_type}
+
+                    # ヘッダー情報を取得
+                    headers_info = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'content_type': content_type,
+                        'status_code': response.status,
+                        'encoding': response.charset
+                    }
+
+                    try:
+                        return await response.text(), headers_info
+                    except UnicodeDecodeError as e:
+                        logging.error(f"Unicode decode error for {url}: {e}")
+                        # フォールバックとしてバイナリからUTF-8でデコード
+                        raw = await response.read()
+                        return raw.decode('utf-8', errors='replace'), headers_info
+
+            except asyncio.TimeoutError as e:
+                logging.warning(f"Timeout for {url}: {e}")
+                retries += 1
+                if retries <= self.max_retries:
+                    await asyncio.sleep(retry_delay * (2 ** retries))
+                else:
+                    return None, {'status_code': 0, 'error': f'Timeout: {str(e)}'}
+
+            except aiohttp.TooManyRedirects as e:
+                logging.error(f"Too many redirects for {url}: {e}")
+                return None, {'status_code': 0, 'error': f'Too many redirects: {str(e)}'}
+
+            except aiohttp.ClientError as e:
+                logging.error(f"Error fetching {url}: {e}")
+                retries += 1
+                if retries <= self.max_retries:
+                    await asyncio.sleep(retry_delay * (2 ** retries))
+                else:
+                    return None, {'status_code': 0, 'error': str(e)}
+
+        return None, {'status_code': 0, 'error': 'Max retries exceeded'}
+        
+    def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Tuple[Optional[str], Dict[str, str]]:
+        """URLからHTMLコンテンツを取得する"""
+        # ドメインを抽出してレート制限を適用
+        domain = _urlparse(url).netloc
+        self._wait_for_rate_limit(domain)
+
+        # 条件付きリクエスト用ヘッダーを準備
+        # （通常のヘッダーはセッション既定値を使うため、条件付きヘッダーが
+        # 不要な場合はdictを作らずNoneを渡す）
+        headers = None
+        if etag or last_modified:
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        retries = 0
+        retry_delay = self.delay
+        
+        while retries <= self.max_retries:
+            try:
+                response = self.session.get(
+                    url,
+                    headers=headers,
+                    timeout=self.timeout,
+                    allow_redirects=self.follow_redirects,
+                    stream=True  # 本文はチャンク読みしながらハッシュ計算する
+                )
+
+                # ステータスコードに基づく処理
+                if response.status_code == 304:  # Not Modified
+                    logging.info(f"Content not modified: {url}")
+                    return None, {
+                        'etag': etag,
+                        'last_modified': last_modified,
+                        'status_code': 304
+                    }
+                
+                elif response.status_code == 429:  # Too Many Requests
+                    # レート制限に引っかかった場合、遅延を増加させる
+                    retry_after = int(response.headers.get('Retry-After', retry_delay * 2))
+                    logging.warning(f"Rate limited: {url}. Retrying after {retry_after} seconds.")
+                    time.sleep(retry_after)
+                    retries += 1
+                    continue
+                    
+                elif response.status_code >= 400:  # エラーコード
+                    if response.status_code == 404:
+                        logging.warning(f"Page not found: {url}")
+                        return None, {'status_code': 404, 'error': 'Not Found'}
+                        
+                    logging.warning(f"Failed to fetch {url}: status code {response.status_code}")
+                    if retries < self.max_retries:
+                        retries += 1
+                        time.sleep(retry_delay * (2 ** retries))  # 指数バックオフ
+                        continue
+                    return None, {'status_code': response.status_code, 'error': f'HTTP error: {response.status_code}'}
+                
+                # content-typeがHTMLでない場合はスキップ
+                content_type = response.headers.get('Content-Type', '')
+                if 'text/html' not in content_type.lower():
+                    logging.info(f"Skipping non-HTML content: {url}, Content-Type: {content_type}")
+                    return None, {'status_code': response.status_code, 'content_type': content_type}
+                
+                # 本文をチャンク単位で読みながらハッシュを逐次計算する
+                # （ネットワークI/Oとハッシュ計算をオーバーラップさせる）
+                content_hash = hashlib.blake2b(digest_size=16)
+                buf = bytearray()
+                for chunk in response.iter_content(chunk_size=16384):
+                    if chunk:
+                        content_hash.update(chunk)
+                        buf.extend(chunk)
+                # 読み込んだ本文をresponseに戻し、エンコーディング解決と
+                # デコードは従来どおりrequests側のロジックに任せる
+                response._content = bytes(buf)
+
+                # ヘッダー情報を取得
+                headers_info = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_type': content_type,
+                    'status_code': response.status_code,
+                    'encoding': response.encoding,
+                    'content_hash': content_hash.hexdigest()
+                }
+
+                # テキストエンコーディングの処理を改善
+                if response.encoding is None:
+                    # エンコーディングの自動検出
+                    response.encoding = response.apparent_encoding
+
+                try:
+                    return response.text, headers_info
+                except UnicodeDecodeError as e:
+                    logging.error(f"Unicode decode error for {url}: {e}")
+                    # フォールバックとしてバイナリからUTF-8でデコード
+                    return response.content.decode('utf-8', errors='replace'), headers_info
+                
+            except requests.exceptions.Timeout as e:
+                logging.warning(f"Timeout for {url}: {e}")
+                retries += 1
+                if retries <= self.max_retries:
+                    time.sleep(retry_delay * (2 ** retries))
+                else:
+                    return None, {'status_code': 0, 'error': f'Timeout: {str(e)}'}
+                
+            except requests.exceptions.TooManyRedirects as e:
+                logging.error(f"Too many redirects for {url}: {e}")
+                return None, {'status_code': 0, 'error': f'Too many redirects: {str(e)}'}
+                
+            except requests.RequestException as e:
+                logging.error(f"Error fetching {url}: {e}")
+                retries += 1
+                if retries <= self.max_retries:
+                    time.sleep(retry_delay * (2 ** retries))
+                else:
+                    return None, {'status_code': 0, 'error': str(e)}
+        
+        return None, {'status_code': 0, 'error': 'Max retries exceeded'}
+
+
+class Parser:
+    """HTMLコンテンツを解析し、コンテンツとリンクを抽出するコンポーネント（改善版）"""
+    
+    def __init__(self, url_filter: UrlFilter):
+        # UrlFilter/Fetcherのみを使うプロセスがlxmlのインポートコストを
+        # 払わずに済むよう、初回のParser生成時にインポートする
+        import lxml.html
+        import lxml.etree
+
+        self.url_filter = url_filter
+
+        # メインコンテンツを特定するためのセレクタ（優先順）
+        self.content_selectors = [
+            '//main', '//article', 
+            '//div[@id="content"]', '//div[@class="content"]',
+            '//div[@id="main"]', '//div[@class="main"]',
+            '//div[contains(@class, "post-content")]', '//div[contains(@class, "entry-content")]',
+            '//div[@role="main"]'
+        ]
+        
+        # 不要な要素を除外するセレクタ
+        self.exclude_selectors = [
+            '//header', '//footer', '//nav',
+            '//aside', '//div[contains(@class, "sidebar")]',
+            '//div[contains(@class, "advertisement")]', '//div[contains(@class, "ad-")]',
+            '//script', '//style', '//iframe', '//noscript',
+            '//div[contains(@class, "comment")]'
+        ]
+
+        # セレクタは「|」で1本のXPathに結合して1回だけコンパイルしておく
+        # （libxml2のツリー走査がセレクタ数ぶんではなく1回で済む）
+        self._content_xpath = lxml.etree.XPath(' | '.join(self.content_selectors))
+        self._exclude_xpath = lxml.etree.XPath(' | '.join(self.exclude_selectors))
+
+        # パーサーを1回だけ生成して再利用する（呼び出しごとの初期化を省く）。
+        # コメント・処理命令はC側で除去しておく
+        self._html_parser = lxml.html.HTMLParser(
+            recover=True, remove_comments=True, remove_pis=True)
+
+    def parse(self, html: str, url: str) -> Tuple[Dict, List[str]]:
+        """HTMLからコンテンツとリンクを抽出する"""
+        import lxml.html  # 初回ロード後はsys.modules参照のみ
+
+        try:
+            # lxmlを使用してHTMLを解析
+            doc = lxml.html.fromstring(html, parser=self._html_parser)
+            doc.make_links_absolute(url)  # 相対リンクを絶対URLに変換
+            
+            # タイトルを抽出
+            title_elem = doc.xpath('//title')
+            title = title_elem[0].text_content().strip() if title_elem else "No Title"
+            
+            # ページのメタ情報を抽出
+            meta_description = ""
+            meta_elems = doc.xpath('//meta[@name="description"]')
+            if meta_elems:
+                meta_description = meta_elems[0].get('content', '')
+            
+            # メインコンテンツを抽出（結合XPathを1回評価し、文書順の先頭を使う）
+            candidates = self._content_xpath(doc)
+            content_elem = candidates[0] if candidates else None
+
+            # メインコンテンツが見つからない場合はbody全体を使用
+            if content_elem is None:
+                body_elem = doc.xpath('//body')
+                content_elem = body_elem[0] if body_elem else doc
+
+            # 不要な要素を除外（deepcopyで複製して処理。シリアライズ＋再パース
+            # の往復より大幅に安く、元ツリーのリンク抽出にも影響しない）
+            content_elem_copy = deepcopy(content_elem)
+            for element in self._exclude_xpath(content_elem_copy):
+                parent = element.getparent()
+                if parent is not None:  # 親がある場合のみ削除
+                    parent.remove(element)
+            
+            # HTMLコンテンツを取得
+            html_content = lxml.html.tostring(content_elem_copy, encoding='unicode')
+            
+            # リンクを抽出（判定と正規化を1回の呼び出しで済ませる）
+            links = []
+            for a_tag in doc.xpath('//a[@href]'):
+                normalized_url = self.url_filter.should_crawl_normalized(a_tag.get('href'))
+                if normalized_url:
+                    links.append(normalized_url)
+            
+            # ページ情報の辞書を作成（拡張版）
+            page_data = {
+                'url': url,
+                'title': title,
+                'meta_description': meta_description,
+                'html_content': html_content,
+                'fetch_time': datetime.now().isoformat(),
+            }
+            
+            return page_data, links
+            
+        except Exception as e:
+            logging.error(f"Error parsing HTML from {url}: {e}")
+            # エラー時は空のデータと空のリンクリストを返す
+            return {'url': url, 'title': 'Error', 'html_content': ''}, []
+
+
+# --- MarkdownConverter用の事前コンパイル済み正規表現 ---
+# 変換で一括削除する特殊文字（文字化けした絵文字の断片・不可視文字）の
+# 削除テーブル。str.translateで文字列全体を1パスで処理する
+_BAD_CHAR_TABLE = str.maketrans('', '', 'ðï¸â   ')
+# 変換はページごとに数十回のre.subを行うため、パターンは全て
+# モジュール読み込み時に1回だけコンパイルする
+_RE_EMOJI = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # 絵文字
+    "\U0001F300-\U0001F5FF"  # シンボル
+    "\U0001F680-\U0001F6FF"  # 乗り物とマップ記号
+    "\U0001F700-\U0001F77F"  # 顔文字
+    "\U0001F780-\U0001F7FF"  # 絵文字の追加
+    "\U0001F800-\U0001F8FF"  # 絵文字の追加
+    "\U0001F900-\U0001F9FF"  # 絵文字の追加
+    "\U0001FA00-\U0001FA6F"  # 絵文字の追加
+    "\U0001FA70-\U0001FAFF"  # 絵文字の追加
+    "\U00002702-\U000027B0"  # その他のシンボル
+    "\U000024C2-\U0001F251"
+    "]+", flags=re.UNICODE
+    )
+_RE_WS = re.compile(r'\s+')
+_RE_ITEMS_COUNT = re.compile(r'\d+\s*items')
+_RE_NON_TEXT_HTML = re.compile(r'[^\x00-\x7F\u0080-\u00FF\u0100-\u017F\u0180-\u024F\u0370-\u03FF\u0400-\u04FF\s\.,;:!?\-_\'\"\/\\\[\]\(\)\{\}\+\*\&\^\%\$\#\@<>=~`|]')
+_RE_BLANK3 = re.compile(r'\n{3,}')
+_RE_DOUBLE_DASH = re.compile(r'\n--\n')
+_RE_DIRECT_LINK_ARROW = re.compile(r'\[â\]\([^)]+\s+"Direct link to [^"]+"\)')
+_RE_DIRECT_LINK_EMPTY = re.compile(r'\[\]\([^)]+\s+"Direct link to [^"]+"\)')
+_RE_DIRECT_LINK_ANY = re.compile(r'\[[^\]]*\]\([^)]+\s+"Direct link to [^"]+"\)')
+_RE_HEAD_NL = re.compile(r'(#{1,6})\s*\n\s*')
+_RE_HEAD_BRACKET_NL = re.compile(r'(#{1,6}\s*)\[\s*\n\s*')
+_RE_LINKTEXT_NL = re.compile(r'(\[\s*[^\n\]]*)\n\s*([^\]]*\])')
+_RE_HEAD_LINK_URL_NL = re.compile(r'(#{1,6}\s+\[[^\]]+\])\s*\n\s*(\([^)]+\))')
+_RE_HEAD_TEXT_NL = re.compile(r'(#{1,6}\s+[A-Za-z][^\n]*)\s*\n\s*([A-Za-z][^\n]*)')
+_RE_LINK_INNER_NL = re.compile(r'(\[(?:[^\[\]]|\[[^\[\]]*\])*?)\n\s*([^\]]*?\]\([^)]+\))')
+_RE_LINK_URL_NL = re.compile(r'(\]\()([^)\n]*)\n\s*([^)]*\))')
+_RE_CATEGORY_HEAD = re.compile(r'##\s*\[(ðï¸\s*)?([^\]]*?)(\s*\d+\s*items)?\]\(([^)]+)\)')
+_RE_HEAD_BRACKET_SPACE = re.compile(r'(#{1,6})\s*\[ ')
+_RE_LINK_EMOJI_ITEMS = re.compile(r'\[ðï¸\s*([^\]]*?)(\s*\d+\s*items)?\]')
+_RE_HEAD_LINK_EMOJI_OPT = re.compile(r'(#{1,6})\s+\[(ðï¸?\s*)?([^\]]*?)\](\([^)]+\))')
+_RE_HEAD_LINK_EMOJI_A = re.compile(r'(#{1,6})\s*\[ðï\s*([^\]]*)\]\(([^)]+)\)')
+_RE_HEAD_LINK_EMOJI_B = re.compile(r'(#{1,6})\s*\[ðï¸\s*([^\]]*)\]\(([^)]+)\)')
+_RE_HEAD_LINK_EMOJI_MID_B = re.compile(r'(#{1,6}\s+\[)([^\]]*?)(ðï¸?)([^\]]*?)(\]\([^)]+\))')
+_RE_HEAD_LINK_EMOJI_MID_A = re.compile(r'(#{1,6}\s+\[)([^\]]*?)(ðï)([^\]]*?)(\]\([^)]+\))')
+_RE_LINK_SPLIT = re.compile(r'\[([^\]]*?)\n\s*([^\]]*?)\](\([^)]+\))')
+_RE_LINK_MULTISPACE = re.compile(r'\[([^\]]*?)\s{2,}([^\]]*?)\]')
+_RE_LINK = re.compile(r'\[([^\]]*?)\]\(([^)]*?)\)')
+_RE_NL_WS = re.compile(r'\s*\n\s*')
+_RE_API_PATH_SPACE = re.compile(r'(\/[a-zA-Z0-9\/-]+\/)\s+([a-zA-Z0-9-]+)')
+_RE_LINK_THEN_WORD = re.compile(r'(\]\([^)]+\))([\w])')
+_RE_MULTISPACE = re.compile(r' {2,}')
+_RE_LIST_GAP = re.compile(r'(\* .*)\n\n(?=\* )')
+_RE_LINK_LIST_GAP = re.compile(r'(\]\([^)]+\))\n\n(\*)')
+_RE_TRAILING_HASHES = re.compile(r'##\s*$')
+_RE_TABLE_EMOJI_B = re.compile(r'\|(.*?)ðï¸(.*?)\|')
+_RE_TABLE_EMOJI_A = re.compile(r'\|(.*?)ðï(.*?)\|')
+_RE_HEAD_PAD = re.compile(r'\n(#{1,6}\s+[^\n]+)\n')
+_RE_HEAD_EXTRA_NL = re.compile(r'(#{1,6}[^\n]+)\n\n\n+(#{1,6})')
+_RE_MOJIBAKE = re.compile(r'ð[ï]?[¸]?')
+_RE_HEAD_EMOJI_BRACKET = re.compile(r'(#{1,6})\s*\[\s*ðï¸?\s*([^\]]+)\]')
+_RE_EMOJI_LINKTEXT = re.compile(r'\[ð[ï]?[¸]?\s*([^\]]+)\]')
+_RE_HEAD_EMOJI_FINAL = re.compile(r'(#{1,6}\s+)\[(ð[ï]?[¸]?\s*)?([^\]]*?)\](\([^)]+\))')
+_RE_HEAD_BODY_SEP = re.compile(r'(#{2,4}\s+[^\n]+)\n([^#\n])')
+_RE_HEAD_LINE = re.compile(r'^#{1,6}\s+')
+_RE_HEAD_EMOJI_BRACKET2 = re.compile(r'(#{1,6})\s*\[\s*ð[ï]?[¸]?\s*([^\]]+)\]')
+_RE_NON_TEXT_MD = re.compile(r'[^\x00-\x7F\u0080-\u00FF\u0100-\u017F\u0180-\u024F\u0370-\u03FF\u0400-\u04FF\s\[\]\(\)\*\|\.,:;\'"!?-]')
+_RE_NON_ASCII = re.compile(r'[^\x00-\x7F]')
+_RE_HEAD_DESC = re.compile(r'(#{1,6}\s+\[[^\]]+\]\([^)]+\))\s+([A-Z][a-z])')
+_RE_CAT_DESC = re.compile(r'(#{1,6}\s*\[[^\]]+\]\([^)]+\))([A-Za-z])')
+_RE_HEAD_CONCAT = re.compile(r'(#{1,6}\s*\[[^\]]+\]\([^)]+\))(#{1,6}\s*\[)')
+_RE_HEAD_DUP = re.compile(r'(#{1,6}\s*\[[^\]]+\])\(([^)]+)\)(#{1,6}\s*\[)')
+_RE_HEAD_LEVEL_MIX = re.compile(r'(#{1,6}[^\n\#]{1,50})(#{1,6}\s*\[)')
+_RE_HEAD_SPACED = re.compile(r'(#{1,6}\s*\[[^\]]+\]\([^)]+\))\s{2,}(#{1,6})')
+_RE_HEAD_BROKEN = re.compile(r'(#{1,6}\s*\[[^\]]+\]\([^)#\n]{5,})\s+(#{1,6}\s*\[)')
+_RE_CODE_BLOCK = re.compile(r'```(?:json|javascript|js|typescript|ts|python|py|bash|sh|xml|html|css)?\s*\n(.*?)\n```', re.DOTALL)
+# 1行JSONらしき行の事前判定（"キー": / 'キー': の形を含む行だけをパースする）
+_RE_JSON_LINE = re.compile(r'^\s*\{.*["\']\s*:.*\}\s*$')
+# 表組み・画像パス・アンカー整形用
+# 表の前後の行末・行頭が「|」の場合は表の行同士なので空行を入れない
+_RE_TABLE_BEFORE = re.compile(r'([^|\n])\n(\|[^\n]+\|)')
+_RE_TABLE_AFTER = re.compile(r'(\|[^\n]+\|)\n([^|\n])')
+_RE_HEAD_ADJACENT = re.compile(r'(#{1,6}[^\n]+)\n(#{1,6})')
+_RE_CELL_CLEAN = re.compile(r'[^\x00-\x7F\s\.,;:!?\-_\'\"\/\\\[\]\(\)\{\}\+\*\&\^\%\$\#\@<>=~`|]')
+_RE_IMG_LINK = re.compile(r'!\[(.*?)\]\(([^)]+)\)')
+_RE_ANCHOR_STRIP = re.compile(r'[^\w\- ]')
+_RE_ANCHOR_DASH = re.compile(r'[\- ]+')
+
+
+class MarkdownConverter:
+    """HTMLコンテンツをMarkdown形式に変換するコンポーネント（改善版）"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        # html2text/lxmlは変換を行うプロセスだけがロードすればよいため
+        # ここで遅延インポートする
+        import html2text
+        import lxml.html
+
+        self.converter = html2text.HTML2Text()
+        self.converter.ignore_links = False
+        self.converter.ignore_images = False
+        self.converter.ignore_tables = False
+        self.converter.body_width = 0  # 行の折り返しを無効化
+        self.converter.unicode_snob = True  # Unicode文字を維持
+        self.converter.single_line_break = True  # 単一の改行を維持
+        self.converter.wrap_links = False  # リンクを折り返さない
+        self.converter.emphasis_mark = '*'  # 強調のマークとして*を使用
+        self.converter.skip_internal_links = True  # アンカーリンクをスキップ
+
+        # オプション設定を適用
+        if config:
+            for key, value in config.items():
+                if hasattr(self.converter, key):
+                    setattr(self.converter, key, value)
+
+        # 前処理用のHTMLパーサーも1回だけ生成して再利用する
+        self._html_parser = lxml.html.HTMLParser(
+            recover=True, remove_comments=True, remove_pis=True)
+
+    def convert(self, page_data: Dict) -> Dict:
+        """HTMLをMarkdownに変換する"""
+        title = page_data['title']
+        html_content = page_data['html_content']
+        url = page_data['url']
+        meta_description = page_data.get('meta_description', '')
+
+        # HTMLの前処理（不要な要素や属性の削除）
+        html_content = self._preprocess_html(html_content)
+
+        # HTMLをMarkdownに変換
+        try:
+            markdown_content = self.converter.handle(html_content)
+
+            # 画像パスを修正（相対パスがある場合）
+            markdown_content = self._fix_image_paths(markdown_content, url)
+
+            # 変換後の後処理
+            markdown_content = self._postprocess_markdown(markdown_content)
+
+        except Exception as e:
+            logging.error(f"Markdown conversion error for {url}: {e}")
+            markdown_content = f"コンテンツの変換中にエラーが発生しました: {str(e)}"
+
+        # Markdownタイトルを作成
+        markdown_title = f"# {title}\n\n"
+
+        # メタ説明を追加（あれば）
+        meta_section = f"*{meta_description}*\n\n" if meta_description else ""
+
+        # URL情報を追加
+        url_info = f"*出典: {url}*\n\n"
+
+        # 最終的なMarkdownコンテンツを組み立て
+        full_markdown = markdown_title + meta_section + url_info + markdown_content
+
+        # 結果を返す
+        result = page_data.copy()
+        result['markdown_content'] = full_markdown
+
+        return result
+
+    def _preprocess_html(self, html_content: str) -> str:
+        """HTMLの前処理を行う"""
+        import lxml.html
+
+        try:
+            # 特殊文字（文字化け・不可視文字）と絵文字はパース前に文字列全体へ
+            # 1回だけ適用して削除する。テキスト・テイル・属性値をまとめて
+            # カバーできるため、要素ごとのreplaceループが不要になる
+            html_content = _RE_EMOJI.sub('', html_content.translate(_BAD_CHAR_TABLE))
+
+            # lxmlを使用してHTMLを解析
+            doc = lxml.html.fromstring(html_content, parser=self._html_parser)
+
+            # 要素ごとの整形はツリーを1回だけ走査して行う
+            # （XPathクエリを要素種別ごとに発行するより、C実装のiter()で
+            # 1パスしてタグで分岐する方が速い）
+            heading_tags = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+            for elem in doc.iter():
+                tag = elem.tag
+                if not isinstance(tag, str):
+                    continue  # コメント等の特殊ノードはスキップ
+
+                if tag == 'a':
+                    if elem.text:
+                        # 「Direct link to」などの不要なテキストを含むa要素を修正
+                        if 'Direct link to' in elem.text:
+                            elem.text = ""
+                        else:
+                            # 見出し要素内のaタグはスペーシングを調整
+                            parent = elem.getparent()
+                            while parent is not None:
+                                if parent.tag in heading_tags:
+                                    elem.text = _RE_WS.sub(' ', elem.text).strip()
+                                    break
+                                parent = parent.getparent()
+
+                elif tag in heading_tags:
+                    # スペーシング修正：見出し内の不要なスペースを調整
+                    if elem.text:
+                        elem.text = _RE_WS.sub(' ', elem.text).strip()
+                        # カテゴリページのフォーマットを修正（h2内のitems数などを削除）
+                        if tag == 'h2' and _RE_ITEMS_COUNT.search(elem.text):
+                            elem.text = _RE_ITEMS_COUNT.sub('', elem.text)
+
+                elif tag == 'table':
+                    # Markdownでの表組み変換を改善するためのクラスを追加
+                    elem.attrib['class'] = 'markdown-table'
+
+                elif tag in ('th', 'td'):
+                    # テーブルのセルを整形
+                    if elem.text:
+                        elem.text = elem.text.strip()
+
+            # HTML文字列に戻す
+            html_cleaned = lxml.html.tostring(doc, encoding='unicode')
+
+            # 最終的なセーフティネット - 不要な文字を削除
+            # 要素ごとのtext/tail走査ではなく、シリアライズ後の文字列へ
+            # 1回の正規表現パスで適用する（要素数に依存しない）
+            html_cleaned = _RE_NON_TEXT_HTML.sub('', html_cleaned)
+
+            # 複数の連続改行を整理
+            html_cleaned = _RE_BLANK3.sub('\n\n', html_cleaned)
+
+            return html_cleaned
+        except Exception as e:
+            logging.warning(f"HTML preprocessing error: {e}")
+            # エラーが発生した場合は元のHTMLを返す
+            return html_content
+
+    def _postprocess_markdown(self, markdown_content: str) -> str:
+        """Markdown変換後の後処理を行う"""
+        # 処理順序を最適化 - 最初にダブルダッシュを処理
+        markdown_content = _RE_DOUBLE_DASH.sub('\n\n', markdown_content)
+
+        # 特殊文字（文字化け・不可視文字）は1回のtranslateでまとめて削除
+        markdown_content = markdown_content.translate(_BAD_CHAR_TABLE)
+
+        # 「Direct link to」などの不要なテキストを削除
+        markdown_content = _RE_DIRECT_LINK_ARROW.sub('', markdown_content)
+        markdown_content = _RE_DIRECT_LINK_EMPTY.sub('', markdown_content)
+        markdown_content = _RE_DIRECT_LINK_ANY.sub('', markdown_content)
+
+        # 見出し修正を優先的に先に処理 (重要: 他の変換の前に行う)
+        # 複数行にまたがる見出しを一行に結合
+        # 例: ## [
+        # Text] -> ## [Text]
+        for _ in range(3):
+            # 見出しタグの後の改行を修正
+            markdown_content = _RE_HEAD_NL.sub(r'\1 ', markdown_content)
+
+            # 見出しのリンク開始括弧内の改行を修正
+            markdown_content = _RE_HEAD_BRACKET_NL.sub(r'\1[', markdown_content)
+
+            # 見出しのリンクテキスト内の改行を修正
+            markdown_content = _RE_LINKTEXT_NL.sub(r'\1 \2', markdown_content)
+
+            # 見出しのリンク全体の途中改行を修正
+            markdown_content = _RE_HEAD_LINK_URL_NL.sub(r'\1\2', markdown_content)
+
+            # 見出し全体が複数行に分かれている場合を修正
+            markdown_content = _RE_HEAD_TEXT_NL.sub(r'\1 \2', markdown_content)
+
+            # リンクテキストとURL間の改行を修正（例: [Search for PositionsAPI URL: /api/Position/search\nOpen](https://...)）
+            markdown_content = _RE_LINK_INNER_NL.sub(r'\1 \2', markdown_content)
+
+            # リンクのURL部分が改行されている場合も修正
+            markdown_content = _RE_LINK_URL_NL.sub(r'\1\2\3', markdown_content)
+
+        # カテゴリページの見出しフォーマットを改善（特殊文字を削除しつつ）
+        markdown_content = _RE_CATEGORY_HEAD.sub(r'## [\2](\4)', markdown_content)
+
+        # 見出し内のスペース調整
+        markdown_content = _RE_HEAD_BRACKET_SPACE.sub(r'\1 [', markdown_content)
+
+        # マークダウンリンク内の特殊文字のみを置換
+        markdown_content = _RE_LINK_EMOJI_ITEMS.sub(r'[\1]', markdown_content)
+
+        # 見出し行内の特殊文字を削除（すべての見出しレベルに対応） - より強力なパターン
+        # 複数のパターンを試して確実に削除
+        for _ in range(2):  # 複数回適用して確実に削除
+            # パターン1: 見出し + [ðï¸? + テキスト] + (URL)
+            markdown_content = _RE_HEAD_LINK_EMOJI_OPT.sub(r'\1 [\3]\4', markdown_content)
+
+            # パターン2: 見出し + [ðï + テキスト] + (URL)
+            markdown_content = _RE_HEAD_LINK_EMOJI_A.sub(r'\1 [\2](\3)', markdown_content)
+
+            # パターン3: 見出し + [ðï¸ + テキスト] + (URL)
+            markdown_content = _RE_HEAD_LINK_EMOJI_B.sub(r'\1 [\2](\3)', markdown_content)
+
+            # すべての見出し内のリンクテキスト内にある特殊文字を強制的に削除
+            markdown_content = _RE_HEAD_LINK_EMOJI_MID_B.sub(r'\1\2\4\5', markdown_content)
+            markdown_content = _RE_HEAD_LINK_EMOJI_MID_A.sub(r'\1\2\4\5', markdown_content)
+
+        # 任意のリンクパターンの修正 - 特に見出し以外の場所にある分割されたリンク
+        # 例: [Search    for    PositionsAPI    URL:    /api/Position/search\n Open](...) のような場合
+        markdown_content = _RE_LINK_SPLIT.sub(r'[\1 \2]\3', markdown_content)
+
+        # 複数の連続スペースをひとつに修正（リンク内での整形）
+        markdown_content = _RE_LINK_MULTISPACE.sub(r'[\1 \2]', markdown_content)
+
+        # リンク全体を包括的に処理する - 改善版アルゴリズム
+
+        def fix_link(match):
+            # リンクテキスト内の処理
+            link_text = match.group(1)
+            url = match.group(2)
+
+            # 1. リンクテキスト内の改行を修正
+            link_text = _RE_NL_WS.sub(' ', link_text)
+
+            # 2. リンクテキスト内の複数スペースを単一スペースに
+            link_text = _RE_WS.sub(' ', link_text).strip()
+
+            # 3. APIエンドポイントパス内のスペースを削除
+            # "/api/Path/ search" → "/api/Path/search" だが、"search Open" はそのまま
+            if '/api/' in link_text or '/v1/' in link_text:
+                # API パスのパターンを検出してスペースを削除
+                link_text = _RE_API_PATH_SPACE.sub(r'\1\2', link_text)
+
+            # 4. URL内のすべてのスペースと改行コードを削除
+            # URL部分の改行コードやエンコード済み改行コードを削除
+            url = _RE_WS.sub('', url)
+            url = url.replace('%0A', '')  # エンコードされた改行も削除
+            url = url.replace('%20', '')  # エンコードされたスペースも削除
+
+            return f"[{link_text}]({url})"
+
+        # すべてのリンクを処理
+        markdown_content = _RE_LINK.sub(fix_link, markdown_content)
+
+        # リンク後の説明文を適切に区切る処理（改良版）
+        # URL直後に続く説明文があれば改行して区切る
+        markdown_content = _RE_LINK_THEN_WORD.sub(r'\1\n\2', markdown_content)
+
+        # 見出し + URL + 説明文のパターンをより強固に処理
+        while _RE_HEAD_DESC.search(markdown_content):
+            markdown_content = _RE_HEAD_DESC.sub(r'\1\n\n\2', markdown_content)
+
+        # カテゴリページの説明文が見出しとリンクされている場合、適切に分離
+        while _RE_CAT_DESC.search(markdown_content):
+            markdown_content = _RE_CAT_DESC.sub(r'\1\n\2', markdown_content)
+
+        # 見出し連結パターンを検出して修正
+        # ## [何か](URL)## [別の何か] を ## [何か](URL)\n\n## [別の何か] に変換
+        markdown_content = _RE_HEAD_CONCAT.sub(r'\1\n\n\2', markdown_content)
+
+        # リンク付き見出し同士が連続している場合
+        markdown_content = _RE_HEAD_DUP.sub(r'\1(\2)\n\n\3', markdown_content)
+
+        # 異なるレベルの見出し連結を処理
+        # ### 見出し## [別の見出し] を ### 見出し\n\n## [別の見出し] に変換
+        markdown_content = _RE_HEAD_LEVEL_MIX.sub(r'\1\n\n\2', markdown_content)
+
+        # 空白を含む連結見出しを処理
+        # ## [何か](URL)    ## [別の何か] を ## [何か](URL)\n\n## [別の何か] に変換
+        markdown_content = _RE_HEAD_SPACED.sub(r'\1\n\n\2', markdown_content)
+
+        # 見出し後の閉じない括弧のパターン
+        # ## [何か](https://example  ## [次] → ## [何か](https://example)\n\n## [次]
+        markdown_content = _RE_HEAD_BROKEN.sub(r'\1)\n\n\2', markdown_content)
+
+        # 最終段階: 3つ以上の連続改行を2つに整理
+        markdown_content = _RE_BLANK3.sub('\n\n', markdown_content)
+
+        # 連続する空白を1つに
+        markdown_content = _RE_MULTISPACE.sub(' ', markdown_content)
+
+        # リスト項目の間隔を最適化
+        markdown_content = _RE_LIST_GAP.sub(r'\1\n', markdown_content)
+        markdown_content = _RE_LINK_LIST_GAP.sub(r'\1\n\2', markdown_content)
+
+        # 見出しの後ろに不要な## マークが残っている場合は削除
+        markdown_content = _RE_TRAILING_HASHES.sub('', markdown_content)
+
+        # テーブル内の特殊文字も削除
+        markdown_content = _RE_TABLE_EMOJI_B.sub(r'|\1\2|', markdown_content)
+        markdown_content = _RE_TABLE_EMOJI_A.sub(r'|\1\2|', markdown_content)
+
+        # 表組みの整形を改善
+        markdown_content = self._improve_tables(markdown_content)
+
+        # JSONやコードブロックを整形
+        markdown_content = self._format_code_blocks(markdown_content)
+
+        # 見出しの前後に適切な改行を追加して読みやすくする
+        markdown_content = _RE_HEAD_PAD.sub(r'\n\1\n\n', markdown_content)
+
+        # 複数見出しの間の余分な改行を修正（最大2行まで）
+        markdown_content = _RE_HEAD_EXTRA_NL.sub(r'\1\n\n\2', markdown_content)
+
+        # 残っている特殊文字を最終的に削除（セーフティネット）- 強化版
+        # 特殊文字を直接削除
+
+        # 見出し行をすべて抽出して特殊文字を除去（最終的な手段）- 徹底的に除去
+        lines = markdown_content.splitlines()
+        for i, line in enumerate(lines):
+            # 見出し行を対象に
+            if line.startswith('#'):
+                # 最も問題の多い特殊文字パターンを直接削除（様々なバリエーションに対応）
+                # 正規表現でも削除してバックアップ（Unicode対応）
+                lines[i] = _RE_MOJIBAKE.sub('', lines[i])
+
+                # 特殊な見出しパターンを修正（例: ## [ðï¸ Account] → ## [Account]）
+                lines[i] = _RE_HEAD_EMOJI_BRACKET.sub(r'\1 [\2]', lines[i])
+
+                # 特殊文字で始まるリンクテキストの修正
+                if '[ð' in lines[i]:
+                    lines[i] = _RE_EMOJI_LINKTEXT.sub(r'[\1]', lines[i])
+
+        # 処理後の行を結合
+        markdown_content = '\n'.join(lines)
+
+        # 最後のセーフティネット - 特殊文字を含む見出しの修正
+        # すべての見出し+リンクパターンを検索して特殊文字を削除
+        markdown_content = _RE_HEAD_EMOJI_FINAL.sub(r'\1[\3]\4', markdown_content)
+
+        # コンテンツの区切りを明確にする（見出し間の区切り）
+        markdown_content = _RE_HEAD_BODY_SEP.sub(r'\1\n\n\2', markdown_content)
+
+        # 非ASCII文字を確実に処理
+        try:
+            # まずはヘッダーや重要なセクションを保持する方法を試す
+            clean_content = ''
+            for line in markdown_content.splitlines():
+                # 見出し行やその他の重要なパターンは特別に処理
+                if _RE_HEAD_LINE.match(line):
+                    # 見出し行内の特殊文字に絞って徹底的に削除
+                    # 最初にðï¸パターンを直接削除（最重要の問題文字）
+
+                    # 特殊な見出しパターンを修正
+                    line = _RE_HEAD_EMOJI_BRACKET2.sub(r'\1 [\2]', line)
+
+                    # 特殊文字で始まるリンクテキストの修正
+                    if '[ð' in line:
+                        line = _RE_EMOJI_LINKTEXT.sub(r'[\1]', line)
+
+                    # 最後に残りの特殊文字も削除
+                    line = _RE_NON_TEXT_MD.sub('', line)
+                elif '[' in line or '*' in line or '|' in line:
+                    # その他の重要パターン（リンク・リスト・表）内の特殊文字を削除
+                    line = _RE_NON_TEXT_MD.sub('', line)
+                else:
+                    # 一般のテキスト行はより厳密に処理
+                    line = _RE_NON_ASCII.sub('', line)
+
+                clean_content += line + '\n'
+            markdown_content = clean_content
+        except Exception:
+            # エラーが発生した場合は単純に非ASCII文字を削除するフォールバック
+            # （encode/decodeの往復はbytesとstrを1回ずつ余分に確保するため、
+            # 1パスの正規表現置換で行う）
+            markdown_content = _RE_NON_ASCII.sub('', markdown_content)
+
+        # 全体的な整理（余分な改行を最終調整）
+        markdown_content = _RE_BLANK3.sub('\n\n', markdown_content)
+
+        return markdown_content
+
+    def _format_code_blocks(self, markdown_content: str) -> str:
+        """コードブロックとJSONの整形を行う（改良版）"""
+        # 既存コードブロックのパターン（より柔軟な対応）
+
+        # コードとして扱うキーワードリスト（言語検出用）
+        code_keywords = {
+            'javascript': ['function', 'const', 'var', 'let', '=>', 'return', 'import ', 'export ', 'class ', 'extends'],
+            'typescript': ['interface', 'type ', 'enum ', 'namespace', '<T>', 'implements'],
+            'python': ['def ', 'class ', 'import ', 'from ', 'if __name__', 'return', 'self.', 'async def'],
+            'bash': ['#!/bin/bash', 'chmod', 'sudo ', 'apt ', 'yum ', 'grep ', 'awk ', 'sed '],
+            'json': ['":', '": ', '"name":', '"version":', '"dependencies":'],
+            'xml': ['<?xml', '<tag>', '</tag>', '<node ', '<element'],
+            'html': ['<!DOCTYPE', '<html>', '</html>', '<div>', '<span>', '<p>']
+        }
+
+        def detect_language(code_text):
+            """コードブロックの言語を検出する"""
+            # JSON形式を優先的に検出
+            if code_text.strip().startswith('{') and code_text.strip().endswith('}') and ('"' in code_text or ':' in code_text):
+                # JSON構文として解析可能か確認（原文優先、JavaScriptスタイルは救済）
+                if _try_parse_json(code_text) is not None:
+                    return 'json'
+
+            # 各言語の特徴的なキーワードを探す
+            for lang, keywords in code_keywords.items():
+                # いくつかのキーワードが存在するかチェック
+                matches = sum(1 for keyword in keywords if keyword in code_text.lower())
+                if matches >= 2:  # 2つ以上のキーワードがマッチしたら
+                    return lang
+
+            # 単一行の簡単な検出
+            code_lower = code_text.lower()
+            if 'function' in code_lower or 'const ' in code_lower or code_lower.count(';') > 2:
+                return 'javascript'
+            if code_lower.count('def ') > 0 or code_lower.count('import ') > 0:
+                return 'python'
+            if code_lower.count('<') > 2 and code_lower.count('>') > 2:
+                return 'html' if '<html' in code_lower or '<body' in code_lower else 'xml'
+
+            # 判別できない場合は空文字を返す
+            return ''
+
+        def format_code_block(match):
+            """コードブロックを整形する"""
+            code = match.group(1)
+            # 言語タグを取得（定義されていれば）
+            if '```' in match.group(0) and match.group(0).split('```')[1].strip():
+                language = match.group(0).split('```')[1].strip()
+            else:
+                language = ''
+
+            # 空のコードブロックは処理しない
+            if not code.strip():
+                return match.group(0)
+
+            # JSONの整形を試みる
+            if language.lower() == 'json' or (not language and (code.strip().startswith('{') and code.strip().endswith('}'))):
+                # 原文を優先して解析する（文字列内のアポストロフィを壊さない）
+                parsed_json = _try_parse_json(code)
+                if parsed_json is not None:
+                    formatted_json = _json_dumps_indent2(parsed_json)
+                    return f"```json\n{formatted_json}\n```"
+                # JSON解析に失敗した場合は通常のコードとして処理
+                if not language:
+                    language = detect_language(code)
+
+            # 言語が指定されていない場合は自動検出
+            if not language:
+                language = detect_language(code)
+
+            # コードのインデント整形
+            # 行頭の共通インデントを検出して削除
+            lines = code.split('\n')
+            if len(lines) > 1:
+                # 空でない行のみを対象に共通インデント検出
+                non_empty_lines = [line for line in lines if line.strip()]
+                if non_empty_lines:
+                    # 各行のインデント数を計算
+                    indents = [len(line) - len(line.lstrip()) for line in non_empty_lines]
+                    # 最小のインデント数を共通インデントとして使用
+                    common_indent = min(indents) if indents else 0
+
+                    # 共通インデントを削除
+                    if common_indent > 0:
+                        formatted_lines = []
+                        for line in lines:
+                            if line.strip():  # 空行は無視
+                                # 共通インデント分だけ削除
+                                formatted_lines.append(line[common_indent:])
+                            else:
+                                formatted_lines.append(line)
+
+                        code = "\n".join(formatted_lines)
+
+            # 言語タグを準備（検出した言語または指定された言語）
+            lang_tag = language if language else ''
+
+            # PDFフォーマット改善のため前後に空行を追加
+            return f"\n```{lang_tag}\n{code}\n```\n"
+
+        # コードブロックを整形
+        markdown_content = _RE_CODE_BLOCK.sub(format_code_block, markdown_content)
+
+        # インラインJSONの検出と整形（段落内の１行JSONなど）
+        lines = markdown_content.split('\n')
+        i = 0
+        while i < len(lines):
+            line = lines[i].strip()
+
+            # cURLコマンド内のJSONパラメータは整形しない
+            prev_line = lines[i-1].lower() if i > 0 else ""
+            current_line = lines[i].lower()
+
+            # curl内のJSONやdataパラメータをスキップする
+            is_curl_json = (('curl' in prev_line or '-d' in prev_line or '--data' in prev_line) and
+                           line.startswith('{') and line.endswith('}'))
+
+            # 単一行のJSONらしき構造を検出して整形（cURLコマンドは除外）
+            # パース前に正規表現で「"キー":」の形を確認し、JSONでない行に
+            # 対するパーサー呼び出し（例外コスト）を避ける
+            if (not is_curl_json and len(line) > 10 and not line.startswith('```') and
+                _RE_JSON_LINE.match(line)):
+                # JSONとして解析（原文優先）
+                parsed_json = _try_parse_json(line)
+                if parsed_json is not None:
+                    # 整形されたJSONをコードブロックに置き換え
+                    formatted_json = _json_dumps_indent2(parsed_json)
+                    lines[i] = f"```json\n{formatted_json}\n```"
+
+            # コードブロックっぽい連続した行を探す（ブレース開始など）
+            elif i < len(lines) - 2 and not lines[i].startswith('#') and not lines[i].startswith('```'):
+                # 開始ブレース・括弧があるかチェック
+                if (('{' in lines[i] and lines[i].strip().endswith('{')) or
+                    ('(' in lines[i] and lines[i].strip().endswith('('))):
+
+                    # コードブロックの範囲を特定
+                    start_idx = i
+                    block_content = [lines[i]]
+                    matching_char = '}' if '{' in lines[i] else ')'
+
+                    # 終了ブレース・括弧を探す
+                    j = i + 1
+                    while j < min(i + 30, len(lines)):  # 最大30行までを探索範囲とする
+                        if matching_char in lines[j]:
+                            block_content.append(lines[j])
+                            end_idx = j
+                            break
+                        block_content.append(lines[j])
+                        j += 1
+                    else:
+                        # 終了文字が見つからなかった場合
+                        i += 1
+                        continue
+
+                    # コードブロックとしての整形を試みる
+                    code_text = "\n".join(block_content)
+
+                    # 言語を自動検出
+                    language = detect_language(code_text)
+
+                    # JSONの場合は特別処理
+                    if language == 'json':
+                        parsed_json = _try_parse_json(code_text)
+                        if parsed_json is not None:
+                            formatted_json = _json_dumps_indent2(parsed_json)
+                            lines[start_idx] = f"```json\n{formatted_json}\n```"
+                        else:
+                            # 通常のコードブロックとして整形
+                            lines[start_idx] = f"```{language}\n{code_text}\n```"
+                    else:
+                        # 非JSONコードとして整形
+                        lines[start_idx] = f"```{language}\n{code_text}\n```"
+
+                    # 整形した分の行を削除
+                    for _ in range(end_idx - start_idx):
+                        if start_idx + 1 < len(lines):
+                            lines.pop(start_idx + 1)
+
+                    # インデックス更新
+                    i = start_idx
+
+            i += 1
+
+        # 行を結合して戻す
+        return '\n'.join(lines)
+
+    def _improve_tables(self, markdown_content: str) -> str:
+        """表組みのマークダウン表現を改善する（PDF出力向け強化版）"""
+        # 前処理: 表の前後に十分な改行を確保して表を分離する
+        markdown_content = _RE_TABLE_BEFORE.sub(r'\1\n\n\2', markdown_content)
+        markdown_content = _RE_TABLE_AFTER.sub(r'\1\n\n\2', markdown_content)
+
+        # 見出し同士が連結している場合に分離する
+        markdown_content = _RE_HEAD_ADJACENT.sub(r'\1\n\n\2', markdown_content)
+
+        # マークダウンの表を検出して改善。
+        # 正規表現による検出は行の繰り返しグループでバックトラックが
+        # 発生しうる（第三者コンテンツ由来の不正な表でReDoSの恐れ）ため、
+        # 行単位の線形スキャンで表ブロックを検出する
+
+        def fix_table(lines):
+            """区切り行付きの表（行のリスト）を整形して文字列で返す"""
+            if len(lines) < 2:
+                return '\n'.join(lines)
+
+            # 各行のセル数と最大幅を計算
+            max_cells = 0
+            row_cells = []
+
+            for line in lines:
+                # |で分割し、前後の空セルを取り除く
+                cells = [c.strip() for c in line.split('|')[1:-1]]
+                row_cells.append(cells)
+                max_cells = max(max_cells, len(cells))
+
+            # 各列の最大文字幅を計算（見た目を整えるため）
+            col_widths = [0] * max_cells
+            for row in row_cells:
+                for i, cell in enumerate(row):
+                    if i < max_cells:
+                        col_widths[i] = max(col_widths[i], len(cell))
+
+            # ヘッダー行を修正（2行目の区切り行）
+            if len(lines) > 1:
+                header_sep = []
+                for i, width in enumerate(col_widths):
+                    # 元の区切り行をチェックして左右寄せを保持
+                    align_marker = ""
+                    if i < len(row_cells[1]):
+                        cell = row_cells[1][i]
+                        if cell.startswith(':') and cell.endswith(':'):
+                            align_marker = ":"  # 中央寄せ
+                            col_sep = ':' + '-' * max(3, width) + ':'
+                        elif cell.startswith(':'):
+                            align_marker = ":"  # 左寄せ
+                            col_sep = ':' + '-' * max(3, width) + ' '
+                        elif cell.endswith(':'):
+                            align_marker = ":"  # 右寄せ
+                            col_sep = ' ' + '-' * max(3, width) + ':'
+                        else:
+                            col_sep = '-' * max(3, width + 2)  # デフォルト（左寄せ）
+                    else:
+                        col_sep = '-' * max(3, width + 2)  # 新しい列はデフォルト
+
+                    header_sep.append(col_sep)
+
+                # 区切り行を再構築
+                lines[1] = '|' + '|'.join(header_sep) + '|'
+
+            # 各行を再構築
+            formatted_lines = []
+            for i, row in enumerate(row_cells):
+                if i == 1:  # 区切り行はすでに処理済み
+                    continue
+
+                # 各セルを整形
+                formatted_cells = []
+                for j in range(max_cells):
+                    if j < len(row):
+                        cell = row[j]
+                        # セルの内容をクリーンアップ - 特殊文字を削除
+                        cell = _RE_CELL_CLEAN.sub('', cell)
+                        formatted_cells.append(cell)
+                    else:
+                        # 足りないセルを空で追加
+                        formatted_cells.append('')
+
+                # 行を再構築
+                formatted_lines.append('| ' + ' | '.join(formatted_cells) + ' |')
+
+            # 区切り行を挿入
+            if len(formatted_lines) > 0:
+                formatted_lines.insert(1, lines[1])
+
+            return '\n'.join(formatted_lines)
+
+        def fix_simple_table(lines):
+            """区切り行のないシンプルな表にヘッダー区切り行を挿入する"""
+            # ヘッダー区切り行を作成して挿入
+            header_line = lines[0]
+            cells_count = header_line.count('|') - 1
+            sep_line = '|' + '|'.join([' ----- ' for _ in range(cells_count)]) + '|'
+
+            # 新しい表を構築
+            new_table = [lines[0], sep_line] + lines[1:]
+            return '\n'.join(new_table)
+
+        def is_table_line(line):
+            return len(line) >= 3 and line.startswith('|') and line.endswith('|')
+
+        sep_chars = frozenset('|-: ')
+
+        def is_separator_line(line):
+            # 区切り行（|---| や |:--:| など）。旧正規表現 \|[-:| ]+\| と同じ判定
+            return is_table_line(line) and set(line) <= sep_chars
+
+        def emit_table_run(run, out):
+            """表らしき連続行のかたまりを整形してoutへ追加する"""
+            # 2行目以降で最初の区切り行を探す
+            sep_idx = next(
+                (k for k in range(1, len(run)) if is_separator_line(run[k])), None)
+
+            if sep_idx is not None and len(run) - (sep_idx - 1) >= 3:
+                # 区切り行の直前行をヘッダーとする表。それより前の行は
+                # 区切り行を含まないので別のかたまりとして処理する
+                head = run[:sep_idx - 1]
+                if head:
+                    emit_table_run(head, out)
+                # PDF表示向けに前後へ余白を追加（結合時の改行と合わせて空行になる）
+                out.append('\n' + fix_table(run[sep_idx - 1:]) + '\n')
+            elif sep_idx is None and len(run) >= 3:
+                out.append('\n' + fix_simple_table(run) + '\n')
+            else:
+                # 表として整形できない断片はそのまま残す
+                out.extend(run)
+
+        # 行単位で1回だけ走査して表ブロックを検出・整形する（O(n)）
+        all_lines = markdown_content.split('\n')
+        parts = []
+        idx = 0
+        total = len(all_lines)
+        while idx < total:
+            if is_table_line(all_lines[idx]):
+                run_end = idx
+                while run_end < total and is_table_line(all_lines[run_end]):
+                    run_end += 1
+                emit_table_run(all_lines[idx:run_end], parts)
+                idx = run_end
+            else:
+                parts.append(all_lines[idx])
+                idx += 1
+
+        return '\n'.join(parts)
+
+    def _fix_image_paths(self, markdown_content: str, base_url: str) -> str:
+        """Markdown内の画像パスを修正する"""
+        # ![alt](relative/path.jpg) 形式の画像タグを検出して修正
+        def replace_img_path(match):
+            alt_text = match.group(1)
+            img_path = match.group(2)
+
+            # 既に絶対URLなら変更しない
+            if img_path.startswith(('http://', 'https://', '//')):
+                return f"![{alt_text}]({img_path})"
+
+            # 相対パスを絶対パスに変換
+            absolute_path = urljoin(base_url, img_path)
+            return f"![{alt_text}]({absolute_path})"
+
+        # 画像パターンを正規表現で検索して置換
+        return _RE_IMG_LINK.sub(replace_img_path, markdown_content)
+
+
+class ContentRepository:
+    """クロールしたコンテンツを管理するコンポーネント（改善版）"""
+    
+    def __init__(self):
+        self.contents = {}  # URLをキーとしたコンテンツ辞書
+        self.urls_by_status = {
+            'success': set(),  # 正常に取得できたURL
+            'error': set(),    # エラーが発生したURL
+            'skipped': set(),  # スキップされたURL
+        }
+        self.metadata = {
+            'start_time': datetime.now().isoformat(),
+            'end_time': None,
+            'total_urls': 0,
+            'success_count': 0,
+            'error_count': 0,
+            'skipped_count': 0,
+        }
+        
+    def add(self, page_data: Dict, status: str = 'success') -> None:
+        """コンテンツを追加する"""
+        url = page_data['url']
+        self.contents[url] = page_data
+        
+        # ステータス別URLセットを更新
+        if status in self.urls_by_status:
+            self.urls_by_status[status].add(url)
+            
+        # メタデータを更新
+        self.metadata['total_urls'] += 1
+        status_count_key = f'{status}_count'
+        if status_count_key in self.metadata:
+            self.metadata[status_count_key] += 1
+        
+    def get(self, url: str) -> Optional[Dict]:
+        """URLに対応するコンテンツを取得する"""
+        return self.contents.get(url)
+    
+    def get_all(self) -> Dict[str, Dict]:
+        """すべてのコンテンツを取得する"""
+        return self.contents
+    
+    def get_urls_by_status(self, status: str) -> Set[str]:
+        """指定されたステータスのURLセットを取得する"""
+        return self.urls_by_status.get(status, set())
+    
+    def count(self) -> int:
+        """コンテンツの数を取得する"""
+        return len(self.contents)
+    
+    def finalize(self) -> None:
+        """クロール完了時にメタデータを更新する"""
+        self.metadata['end_time'] = datetime.now().isoformat()
+        
+    def get_metadata(self) -> Dict:
+        """リポジトリのメタデータを取得する"""
+        if self.metadata['end_time'] is None:
+            self.metadata['end_time'] = datetime.now().isoformat()
+            
+        # 各カウントを最新の状態に更新
+        self.metadata['success_count'] = len(self.urls_by_status['success'])
+        self.metadata['error_count'] = len(self.urls_by_status['error'])
+        self.metadata['skipped_count'] = len(self.urls_by_status['skipped'])
+        
+        return self.metadata
+
+
+class CrawlCache:
+    """クロール結果を永続的に保存し、差分検知に使用するコンポーネント（改善版）"""
+    
+    def __init__(self, domain: str, cache_dir: str = "cache"):
+        self.domain = domain
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        self.db_path = os.path.join(cache_dir, f"{domain}.db")
+        self._initialize_db()
+
+        # 長寿命の共有接続。SQLiteはサーバレスなので、シングルプロセスの
+        # クローラーでは接続を1本持ち回る方が毎回のconnect/close
+        # （PRAGMA再適用・ページキャッシュのウォームアップ）より速い。
+        # スレッド間はロックで直列化する
+        self._conn = self._get_connection()
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+    def _initialize_db(self):
+        """データベースを初期化する"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        # pages テーブルを作成（拡張版）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            title TEXT,
+            content_hash TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            last_crawled TEXT,
+            markdown_content TEXT,
+            meta_description TEXT,
+            status_code INTEGER
+        )
+        ''')
+        
+        # crawl_history テーブルを作成
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            crawl_date TEXT,
+            page_count INTEGER,
+            new_count INTEGER,
+            updated_count INTEGER,
+            deleted_count INTEGER,
+            duration_seconds INTEGER
+        )
+        ''')
+        
+        # インデックスを作成（パフォーマンス向上）
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_last_crawled ON pages(last_crawled)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawl_history_date ON crawl_history(crawl_date)')
+        # content_hash参照（is_content_changed/upsert_and_diff）用のカバリング
+        # インデックス。本文を含む行本体を読まずにインデックスだけで応答できる
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pages_url_hash ON pages(url, content_hash)')
+
+        # プランナが新しいインデックスを選べるよう統計を更新
+        cursor.execute('ANALYZE')
+
+        conn.commit()
+        conn.close()
+    
+    def _get_connection(self):
+        """SQLite接続を取得する（接続プールの実装）
+
+        書き込みの多いクロールワークロードではfsyncが支配的になるため、
+        WALジャーナル＋NORMAL同期に切り替え、キャッシュ等も拡大する。
+        すべての接続がここを通るので、設定は全接続で共通になる。
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')     # 追記型ジャーナル（読み書きの競合も減る）
+        conn.execute('PRAGMA synchronous=NORMAL')   # WALとの組み合わせで安全にfsyncを削減
+        conn.execute('PRAGMA cache_size=-65536')    # ページキャッシュ64MB
+        conn.execute('PRAGMA temp_store=MEMORY')    # 一時表をメモリに
+        conn.execute('PRAGMA mmap_size=268435456')  # 256MBまでmmap読み取り
+        conn.execute('PRAGMA busy_timeout=60000')   # ロック競合時は最大60秒待つ
+        return conn
+    
+    @contextmanager
+    def _db_transaction(self):
+        """データベーストランザクションのコンテキストマネージャ
+
+        共有接続をロックで直列化して貸し出す。接続の生成・破棄は行わない。
+        """
+        with self._lock:
+            try:
+                yield self._conn
+            except Exception as e:
+                self._conn.rollback()
+                logging.error(f"Database transaction error: {e}")
+                raise
+
+    def close(self):
+        """共有接続を閉じる"""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    def get_page(self, url: str) -> Optional[Dict]:
+        """URLに対応するキャッシュされたページ情報を取得する"""
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM pages WHERE url = ?', (url,))
+            row = cursor.fetchone()
+            
+        if row:
+            return dict(row)
+        return None
+    
+    def add_or_update_page(self, page_data: Dict) -> bool:
+        """ページ情報をキャッシュに追加または更新する"""
+        url = page_data['url']
+        title = page_data['title']
+        markdown_content = page_data.get('markdown_content', '')
+        meta_description = page_data.get('meta_description', '')
+        # 呼び出し側が計算済みのハッシュを渡した場合は再計算しない
+        # （Markdown本文のハッシュであること。Fetcherが返すHTMLバイト列の
+        # content_hashとは別物なので注意）
+        content_hash = page_data.get('content_hash') or self._compute_hash(markdown_content)
+        etag = page_data.get('etag')
+        last_modified = page_data.get('last_modified')
+        status_code = page_data.get('status_code', 200)
+        last_crawled = datetime.now().isoformat()
+        
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+
+            # 既存行の有無はPRIMARY KEYインデックスの存在チェックだけで判定
+            # （戻り値用。本文やハッシュ列はロードしない）
+            cursor.execute('SELECT 1 FROM pages WHERE url = ?', (url,))
+            is_update = cursor.fetchone() is not None
+
+            # 追加と更新はUPSERT1文にまとめる（UPDATE/INSERTの分岐を排し、
+            # チェックと書き込みの間の競合もなくなる）
+            cursor.execute('''
+            INSERT INTO pages
+            (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                title = excluded.title,
+                content_hash = excluded.content_hash,
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                last_crawled = excluded.last_crawled,
+                markdown_content = excluded.markdown_content,
+                meta_description = excluded.meta_description,
+                status_code = excluded.status_code
+            ''', (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code))
+
+            conn.commit()
+
+        return is_update
+
+    def add_or_update_pages(self, pages: List[Dict]) -> int:
+        """複数ページを1トランザクションでまとめて追加・更新する
+
+        ページごとにadd_or_update_pageを呼ぶとN回のコミット（fsync）と
+        接続セットアップが発生する。ここでは全行を1本のUPSERT文の
+        executemanyで書き込み、コミットは1回だけにする。
+        差分テキストが不要な一括取り込み向け（差分検知のメインループは
+        ページごとの状態が必要なためupsert_and_diffを使う）。
+
+        Returns:
+            int: 書き込んだ行数
+        """
+        if not pages:
+            return 0
+
+        last_crawled = datetime.now().isoformat()
+        rows = [
+            (page['url'],
+             page['title'],
+             page.get('content_hash') or self._compute_hash(page.get('markdown_content', '')),
+             page.get('etag'),
+             page.get('last_modified'),
+             last_crawled,
+             page.get('markdown_content', ''),
+             page.get('meta_description', ''),
+             page.get('status_code', 200))
+            for page in pages
+        ]
+
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+            INSERT INTO pages
+            (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                title = excluded.title,
+                content_hash = excluded.content_hash,
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                last_crawled = excluded.last_crawled,
+                markdown_content = excluded.markdown_content,
+                meta_description = excluded.meta_description,
+                status_code = excluded.status_code
+            ''', rows)
+            conn.commit()
+
+        return len(rows)
+
+    def upsert_and_diff(self, page_data: Dict) -> Tuple[str, Optional[str]]:
+        """ページの追加・更新と差分計算を1回の行読み込みで行う
+
+        add_or_update_page → is_content_changed → get_diff を個別に呼ぶと、
+        同じ行の読み込みとコンテンツハッシュの計算を3回繰り返すことになる。
+        このメソッドは既存行を1回だけ読み、ハッシュも1回だけ計算して、
+        状態の判定・差分の生成・書き込みを同一トランザクションにまとめる。
+
+        Returns:
+            tuple: (状態 'new'/'updated'/'unchanged', 差分テキストまたはNone)
+        """
+        url = page_data['url']
+        title = page_data['title']
+        markdown_content = page_data.get('markdown_content', '')
+        meta_description = page_data.get('meta_description', '')
+        # 呼び出し側が計算済みのハッシュを渡した場合は再計算しない
+        # （Markdown本文のハッシュであること。Fetcherが返すHTMLバイト列の
+        # content_hashとは別物なので注意）
+        content_hash = page_data.get('content_hash') or self._compute_hash(markdown_content)
+        etag = page_data.get('etag')
+        last_modified = page_data.get('last_modified')
+        status_code = page_data.get('status_code', 200)
+        last_crawled = datetime.now().isoformat()
+
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+
+            # まずハッシュ列だけを読む（未変更ページでは大きな本文列をロードしない）
+            cursor.execute(
+                'SELECT content_hash FROM pages INDEXED BY idx_pages_url_hash WHERE url = ?',
+                (url,))
+            row = cursor.fetchone()
+
+            if row is None:
+                status = 'new'
+                diff = None
+
+                # 新規追加
+                cursor.execute('''
+                INSERT INTO pages
+                (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (url, title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code))
+            else:
+                if row[0] == content_hash:
+                    status = 'unchanged'
+                    diff = None
+                else:
+                    status = 'updated'
+
+                    # ハッシュが変わったときだけ前回の本文を読み込んで差分を計算する
+                    cursor.execute('SELECT markdown_content FROM pages WHERE url = ?', (url,))
+                    old_content = cursor.fetchone()[0]
+                    if not old_content:
+                        diff = "前回のコンテンツが空"
+                    else:
+                        # 差分を計算（コンテキスト形式）
+                        diff = '\n'.join(difflib.unified_diff(
+                            old_content.splitlines(),
+                            markdown_content.splitlines(),
+                            fromfile="前回のバージョン",
+                            tofile="現在のバージョン",
+                            lineterm='',
+                            n=3
+                        ))
+
+                # 更新
+                cursor.execute('''
+                UPDATE pages
+                SET title = ?, content_hash = ?, etag = ?, last_modified = ?,
+                    last_crawled = ?, markdown_content = ?, meta_description = ?, status_code = ?
+                WHERE url = ?
+                ''', (title, content_hash, etag, last_modified, last_crawled, markdown_content, meta_description, status_code, url))
+
+            conn.commit()
+
+        return status, diff
+
+    def get_all_urls(self) -> Set[str]:
+        """キャッシュに保存されているすべてのURLを取得する"""
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT url FROM pages')
+            # fetchall()で全行のリストを作らず、カーソルから直接集合を作る
+            # （大きいキャッシュで中間リストぶんのメモリを節約）
+            urls = {row[0] for row in cursor}
+
+        return urls
+    
+    def delete_urls(self, urls: List[str]) -> int:
+        """指定されたURLをキャッシュから削除する"""
+        if not urls:
+            return 0
+            
+        deleted_count = 0
+
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+
+            # IN句は500件ずつに分割する。SQLiteのバインド変数上限
+            # （古いビルドでは999）を超えず、巨大なSQL文のパースも避ける。
+            # 全チャンクを同一トランザクションで削除しコミットは1回だけ
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                # SQLインジェクション対策のためにプレースホルダーを使用
+                placeholders = ', '.join(['?'] * len(chunk))
+                cursor.execute(f'DELETE FROM pages WHERE url IN ({placeholders})', chunk)
+                deleted_count += cursor.rowcount
+
+            conn.commit()
+
+        return deleted_count
+    
+    def save_crawl_history(self, page_count: int, new_count: int, updated_count: int, deleted_count: int, duration_seconds: int) -> int:
+        """クロール履歴を保存する（拡張版：所要時間を追加）"""
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            
+            crawl_date = datetime.now().isoformat()
+            
+            cursor.execute('''
+            INSERT INTO crawl_history 
+            (crawl_date, page_count, new_count, updated_count, deleted_count, duration_seconds)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (crawl_date, page_count, new_count, updated_count, deleted_count, duration_seconds))
+            
+            history_id = cursor.lastrowid
+            conn.commit()
+        
+        return history_id
+    
+    def is_content_changed(self, url: str, markdown_content: str) -> bool:
+        """ページのコンテンツが前回のクロール時から変更されているかどうかを確認する"""
+        return self.is_content_changed_by_hash(url, self._compute_hash(markdown_content))
+
+    def is_content_changed_by_hash(self, url: str, current_hash: str) -> bool:
+        """計算済みハッシュで変更有無を確認する
+
+        is_content_changed → add_or_update_page と呼ぶ流れで同じ本文を
+        2回ハッシュしないよう、呼び出し側が_compute_hashの結果を使い回す
+        ためのエントリポイント。
+        """
+
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT content_hash FROM pages INDEXED BY idx_pages_url_hash WHERE url = ?',
+                (url,))
+            row = cursor.fetchone()
+        
+        if not row:
+            return True  # 新規ページなので変更ありとみなす
+        
+        return current_hash != row[0]
+    
+    def _compute_hash(self, content: str) -> str:
+        """コンテンツのハッシュ値を計算する
+
+        フィンガープリント用途（暗号用途ではない）のため、大きな本文で
+        sha256/md5より高速なblake2bを使用する。Fetcher側のcontent_hashと
+        同じ形式（digest_size=16）で統一している。
+        """
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def get_diff(self, url: str, current_content: str) -> str:
+        """前回のコンテンツとの差分を取得する（改善版：コンテキスト差分表示）"""
+        # まずハッシュだけを比較し、未変更ならO(N・M)の差分計算を行わない
+        # （difflibは純Python実装で、差分生成のコストの大半を占める）
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT content_hash FROM pages INDEXED BY idx_pages_url_hash WHERE url = ?',
+                (url,))
+            row = cursor.fetchone()
+
+            if not row:
+                return "新規ページ"
+
+            if row[0] == self._compute_hash(current_content):
+                return ""
+
+            # 変更があったときだけ前回の本文をロードする
+            cursor.execute('SELECT markdown_content FROM pages WHERE url = ?', (url,))
+            row = cursor.fetchone()
+
+        old_content = row[0]
+        if not old_content:
+            return "前回のコンテンツが空"
+
+        # 差分を計算（コンテキスト形式、より多くのコンテキスト行を表示）
+        diff = difflib.unified_diff(
+            old_content.splitlines(),
+            current_content.splitlines(),
+            fromfile="前回のバージョン",
+            tofile="現在のバージョン",
+            lineterm='',
+            n=3  # コンテキスト行数を3行に増加
+        )
+
+        return '\n'.join(diff)
+    
+    def get_history(self, limit: int = 10) -> List[Dict]:
+        """最新のクロール履歴を取得する"""
+        with self._db_transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT * FROM crawl_history 
+            ORDER BY crawl_date DESC 
+            LIMIT ?
+            ''', (limit,))
+            
+            history = [dict(row) for row in cursor.fetchall()]
+        
+        return history
+
+
+class FileExporter:
+    """クロールしたコンテンツをファイルに出力するコンポーネント（改善版）"""
+    
+    def __init__(self, output_dir: str = "output"):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        
+    def export_markdown(self, repository: ContentRepository, filename: str) -> str:
+        """コンテンツをMarkdownファイルとしてエクスポートする"""
+        contents = repository.get_all()
+
+        # 出力ファイルのパス
+        output_path = os.path.join(self.output_dir, filename)
+
+        # ソートは1回だけ行い、目次と本文を同じパスで組み立てる
+        sorted_items = sorted(contents.items())
+
+        toc = ["# 目次\n"]
+        body_parts = []
+        for i, (url, page_data) in enumerate(sorted_items, 1):
+            title = page_data.get('title', 'タイトルなし')
+            toc.append(f"{i}. [{title}](#{self._make_anchor(title)})")
+            if 'markdown_content' in page_data:
+                body_parts.append(page_data['markdown_content'])
+
+        # 全文を1本の文字列に連結せず、ファイルへ順次書き出す
+        # （エクスポート時のピークメモリを約半分にする）
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(toc))
+            f.write('\n\n---\n\n')
+            for part in body_parts:
+                f.write('\n\n---\n\n')
+                f.write(part)
+
+        return output_path
+    
+    # サイト内でタイトルは頻繁に重複する（ナビゲーション・カテゴリ等）
+    # ため、アンカー生成をメモ化して同じタイトルの正規表現処理を省く。
+    # selfに依存しないのでstaticmethod＋モジュールレベルのキャッシュでよい
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _make_anchor(text: str) -> str:
+        """テキストからアンカーIDを生成する"""
+        # 小文字に変換し、アルファベット・数字・ハイフン以外の文字をハイフンに置換
+        anchor = _RE_ANCHOR_STRIP.sub('', text.lower())
+        # スペースをハイフンに置換し、連続するハイフンを1つにまとめる
+        anchor = _RE_ANCHOR_DASH.sub('-', anchor)
+        return anchor.strip('-')
+    
+    def export_diff_report(self, diff_data: Dict, filename: str) -> str:
+        """差分レポートをMarkdownファイルとして出力する（改善版）"""
+        output_path = os.path.join(self.output_dir, filename)
+
+        # 一度リストに組み立ててから1回のwriteで書き出す
+        # （URL数ぶんの細かいwrite呼び出しを避ける）
+        parts = []
+
+        # レポートヘッダーとメタデータ
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        parts.append(f"# 差分レポート - {now}\n\n")
+
+        # サマリー情報
+        parts.append("## サマリー\n\n")
+        parts.append(f"- 合計ページ数: {diff_data['total']}\n")
+        parts.append(f"- 新規ページ: {len(diff_data['new_pages'])}\n")
+        parts.append(f"- 更新ページ: {len(diff_data['updated_pages'])}\n")
+        parts.append(f"- 削除ページ: {len(diff_data['deleted_pages'])}\n")
+        # 経過時間があれば表示
+        if 'duration_seconds' in diff_data:
+            duration = diff_data['duration_seconds']
+            minutes, seconds = divmod(duration, 60)
+            parts.append(f"- クロール時間: {minutes}分{seconds}秒\n")
+        parts.append("\n")
+
+        # 新規ページ
+        if diff_data['new_pages']:
+            parts.append("## 新規ページ\n\n")
+            parts.extend(f"- [{url}]({url})\n" for url in sorted(diff_data['new_pages']))
+            parts.append("\n")
+
+        # 更新ページ
+        if diff_data['updated_pages']:
+            parts.append("## 更新ページ\n\n")
+            parts.extend(f"- [{url}]({url})\n" for url in sorted(diff_data['updated_pages']))
+            parts.append("\n")
+
+        # 削除ページ
+        if diff_data['deleted_pages']:
+            parts.append("## 削除ページ\n\n")
+            parts.extend(f"- {url}\n" for url in sorted(diff_data['deleted_pages']))
+            parts.append("\n")
+
+        # 詳細な差分情報
+        if diff_data.get('diffs'):
+            parts.append("## 詳細な差分\n\n")
+            for url, diff in sorted(diff_data['diffs'].items()):
+                parts.append(f"### {url}\n\n")
+                parts.append("```diff\n")
+                parts.append(diff)
+                parts.append("\n```\n\n")
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(parts))
+
+        return output_path
+    
+    def export_summary(self, repository: ContentRepository, diff_data: Dict, filename: str) -> str:
+        """クロール結果の概要レポートをエクスポートする"""
+        output_path = os.path.join(self.output_dir, filename)
+
+        metadata = repository.get_metadata()
+
+        # export_diff_reportと同様、組み立ててから1回で書き出す
+        parts = [f"# クロール概要レポート - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"]
+
+        # クロール概要
+        parts.append("## クロール情報\n\n")
+        parts.append(f"- 開始時間: {metadata['start_time']}\n")
+        parts.append(f"- 終了時間: {metadata['end_time']}\n")
+        if 'duration_seconds' in diff_data:
+            minutes, seconds = divmod(diff_data['duration_seconds'], 60)
+            parts.append(f"- 所要時間: {minutes}分{seconds}秒\n")
+        parts.append(f"- 合計URL: {metadata['total_urls']}\n")
+        parts.append(f"- 成功: {metadata['success_count']}\n")
+        parts.append(f"- エラー: {metadata['error_count']}\n")
+        parts.append(f"- スキップ: {metadata['skipped_count']}\n\n")
+
+        # 差分概要
+        parts.append("## 変更概要\n\n")
+        parts.append(f"- 新規ページ: {len(diff_data['new_pages'])}\n")
+        parts.append(f"- 更新ページ: {len(diff_data['updated_pages'])}\n")
+        parts.append(f"- 削除ページ: {len(diff_data['deleted_pages'])}\n\n")
+
+        # エラーページのリスト
+        error_urls = repository.get_urls_by_status('error')
+        if error_urls:
+            parts.append("## エラーページ\n\n")
+            parts.extend(f"- {url}\n" for url in sorted(error_urls))
+            parts.append("\n")
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(parts))
+
         return output_path
\ No newline at end of file
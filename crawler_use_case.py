@@ -28,6 +28,23 @@ import asyncio
 from datetime import datetime
 from urllib.parse import urlparse
 
+# orjsonが利用可能ならJSON書き出しに使用（なければ標準ライブラリにフォールバック）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _dump_json(data, path):
+    """JSONデータをファイルへ書き出す（orjsonがあればC実装で高速化）"""
+    if ORJSON_AVAILABLE:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
 # クローラーコンポーネントが同じディレクトリにある場合にインポート
 try:
     from crawler_components import CrawlerConfig
@@ -227,8 +244,7 @@ def archive_use_case(url):
             ]
         }
         
-        with open(os.path.join(archive_dir, "archive_metadata.json"), "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        _dump_json(metadata, os.path.join(archive_dir, "archive_metadata.json"))
             
         return True
     else:
@@ -357,11 +373,10 @@ def blog_use_case(url):
         # 新しい記事リストを保存
         if new_articles:
             new_articles_path = os.path.join(config.output_dir, f"{domain}_new_articles.json")
-            with open(new_articles_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "date": datetime.now().isoformat(),
-                    "articles": new_articles
-                }, f, indent=2, ensure_ascii=False)
+            _dump_json({
+                "date": datetime.now().isoformat(),
+                "articles": new_articles
+            }, new_articles_path)
                 
             print(f"\n新しい記事が {len(new_articles)} 件見つかりました。リスト: {new_articles_path}")
             
@@ -433,11 +448,10 @@ def docs_use_case(url):
                 
             # インデックスを保存
             index_path = os.path.join(config.output_dir, f"{domain}_search_index.json")
-            with open(index_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "date": datetime.now().isoformat(),
-                    "pages": index
-                }, f, indent=2, ensure_ascii=False)
+            _dump_json({
+                "date": datetime.now().isoformat(),
+                "pages": index
+            }, index_path)
                 
             print(f"\n検索インデックスが作成されました（{len(index)} ページ）: {index_path}")
             